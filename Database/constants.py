@@ -1,6 +1,27 @@
-MONGODB_URL = "mongodb://localhost:27017/"
+import os
+
+MONGODB_URL = os.environ.get("MONGODB_URL", "mongodb://localhost:27017/")
 DataBaseName = "CampusFoodDeliverySystem"
 RestaurantCollectionName = "Restaurants"
 RatingsCollectionName = "Ratings"
 RestaurantMenuCollectionName = "Menu"
-UsersCollectionName = "User"
\ No newline at end of file
+UsersCollectionName = "User"
+
+# Connection pool, read by mongo.py; keep in step with DockerEnv/app/constants.py. Unset optional timeouts keep pymongo's defaults
+def optionalInt(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+MongoMaxPoolSize = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MongoMinPoolSize = int(os.environ.get("MONGO_MIN_POOL_SIZE", "10"))
+MongoMaxIdleTimeMS = optionalInt("MONGO_MAX_IDLE_TIME_MS")
+MongoConnectTimeoutMS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MongoServerSelectionTimeoutMS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MongoSocketTimeoutMS = optionalInt("MONGO_SOCKET_TIMEOUT_MS")
+MongoWaitQueueTimeoutMS = optionalInt("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+# e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+MongoCompressors = os.environ.get("MONGO_COMPRESSORS", "")
+MongoWarmConnections = int(os.environ.get("MONGO_WARM_CONNECTIONS", str(MongoMinPoolSize)))
+ReadinessTimeoutSeconds = float(os.environ.get("READINESS_TIMEOUT_SECONDS", "1.0"))
+# Time /readyz reports 503 before shutdown continues, so load balancers stop routing first
+ShutdownDrainSeconds = float(os.environ.get("SHUTDOWN_DRAIN_SECONDS", "0"))
@@ -1,4 +1,6 @@
 from typing import Optional, List
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from enum import Enum
 from fastapi import FastAPI, Body, Form, HTTPException, status, UploadFile, File
@@ -8,16 +10,41 @@ from pydantic import ConfigDict, BaseModel, Field
 from pydantic.functional_validators import BeforeValidator
 import aiofiles
 from typing_extensions import Annotated
+from pymongo.errors import DuplicateKeyError
 
-import motor.motor_asyncio
 import constants as constants
+from mongo import createClient, warmPool, PoolState, probeRouter
 
-client = motor.motor_asyncio.AsyncIOMotorClient(constants.MONGODB_URL)
-db = client[constants.DataBaseName]
+# Opened by the lifespan; set beforehand to run against another client
+client = None
+db = None
+poolState = PoolState()
+lifecycle = "starting"
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
+def openMongo():
+    global client, db
+    if client is None:
+        client = createClient([poolState])
+        db = client[constants.DataBaseName]
+    return db
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global lifecycle
+    openMongo()
+    await warmPool(client, constants.MongoWarmConnections)
+    lifecycle = "ready"
+    yield
+    lifecycle = "stopping"
+    await asyncio.sleep(constants.ShutdownDrainSeconds)
+    client.close()
+
 app = FastAPI(title="Menu API",
-    summary="FastAPI Application to add a ReST API to a MongoDB collection for menu.",)
+    summary="FastAPI Application to add a ReST API to a MongoDB collection for menu.",
+    lifespan=lifespan,)
+
+app.include_router(probeRouter(lambda: (lifecycle, client), poolState))
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -76,7 +103,10 @@ async def addMenuItem(name: str = Form(...),
     async with aiofiles.open(f"static/{menu.restaurantName}_{menu.name}.jpg", "wb") as out_file:
         while content := await image.read(1024):  # async read chunk
             await out_file.write(content)
-    newMenu = await menuCollection.insert_one(menu.model_dump(by_alias=True, exclude=["id"]))
+    try:
+        newMenu = await menuCollection.insert_one(menu.model_dump(by_alias=True, exclude=["id"]))
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Menu item {name} already exists for {restaurantName}")
     response = await menuCollection.find_one({"_id": newMenu.inserted_id})
     response['id'] = str(response.pop('_id'))
     return response
@@ -1,4 +1,6 @@
 from typing import Optional, List
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from enum import Enum
 from fastapi import FastAPI, Body, HTTPException, status
@@ -8,19 +10,45 @@ from pydantic.functional_validators import BeforeValidator
 
 from typing_extensions import Annotated
 
-import motor.motor_asyncio
+from pymongo import ReturnDocument
 import constants as constants
+from mongo import createClient, warmPool, PoolState, probeRouter
 import restaurantApp as restaurant
 
-client = motor.motor_asyncio.AsyncIOMotorClient(constants.MONGODB_URL)
-db = client[constants.DataBaseName]
+# Opened by the lifespan; set beforehand to run against another client
+client = None
+db = None
+poolState = PoolState()
+lifecycle = "starting"
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
+def openMongo():
+    global client, db
+    if client is None:
+        client = createClient([poolState])
+        db = client[constants.DataBaseName]
+    return db
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global lifecycle
+    openMongo()
+    await warmPool(client, constants.MongoWarmConnections)
+    await migrateLegacyRatings(db[constants.RatingsCollectionName])
+    lifecycle = "ready"
+    yield
+    lifecycle = "stopping"
+    await asyncio.sleep(constants.ShutdownDrainSeconds)
+    client.close()
+
 app = FastAPI(title="rating API",
-    summary="FastAPI Application to add a ReST API to a MongoDB collection for ratings.",)
+    summary="FastAPI Application to add a ReST API to a MongoDB collection for ratings.",
+    lifespan=lifespan,)
+
+app.include_router(probeRouter(lambda: (lifecycle, client), poolState))
 
 class ratingModel(BaseModel):
-    rating: Optional[float] = Field(..., ge=0, le=5, description="Rating should be between 0 and 5")
+    rating: float = Field(..., ge=0, le=5, description="Rating should be between 0 and 5")
     restaurantName: str = Field(..., description="name of restaurant")
     model_config = ConfigDict(
         populate_by_name=True,
@@ -39,6 +67,22 @@ class ratingResponseModel(BaseModel):
 class ratingListing(BaseModel):
     ratings: List[ratingModel]
 
+# Ratings are stored as a running ratingSum and numRatings so that a new rating is a
+# single atomic $inc; the average is derived whenever a document is read
+def ratingResponse(restaurant_data):
+    return {
+        "avgRating": restaurant_data["ratingSum"] / restaurant_data["numRatings"],
+        "restaurantName": restaurant_data["restaurantName"],
+        "numRatings": restaurant_data["numRatings"],
+    }
+
+async def migrateLegacyRatings(ratingCollection):
+    # Documents written before ratingSum existed only carry avgRating; convert them once
+    await ratingCollection.update_many(
+        {"ratingSum": {"$exists": False}},
+        [{"$set": {"ratingSum": {"$multiply": ["$avgRating", "$numRatings"]}}}, {"$unset": "avgRating"}],
+    )
+
 @app.get("/")
 def read_root():
     return RedirectResponse("/docs")
@@ -52,33 +96,15 @@ def read_root():
 async def addNewRating(rating: ratingModel = Body(...)):
     ratingCollection = db[constants.RatingsCollectionName]
 
-    restaurantCheck = await ratingCollection.find_one({"restaurantName": rating.restaurantName})
-
-    if restaurantCheck:
-        # If data already exists, update the average rating and increase the number of ratings
-        new_avg_rating = ((restaurantCheck['avgRating'] * restaurantCheck['numRatings']) + rating.avgRating) / (restaurantCheck['numRatings'] + 1)
-        updated_data = {
-            "$set": {
-                "avgRating": new_avg_rating,
-                "numRatings": restaurantCheck['numRatings'] + 1
-            }
-        }
-
-        await ratingCollection.update_one({"restaurantName": rating.restaurantName}, updated_data)
-        response_data = await ratingCollection.find_one({"restaurantName": rating.restaurantName})
-
-    else:
-        # If data doesn't exist, insert new data
-        new_data = {
-            "restaurantName": rating.restaurantName,
-            "avgRating": rating.rating,
-            "numRatings": 1
-        }
-
-        result = await ratingCollection.insert_one(new_data)
-        response_data = await ratingCollection.find_one({"_id": result.inserted_id})
+    # One round trip: creates the document on the first rating and returns the updated totals
+    response_data = await ratingCollection.find_one_and_update(
+        {"restaurantName": rating.restaurantName},
+        {"$inc": {"ratingSum": rating.rating, "numRatings": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
 
-    return response_data
+    return ratingResponse(response_data)
 
 @app.get(
     "/avgRating/{name}",
@@ -92,16 +118,7 @@ async def fetch_avgratings(name: str):
     restaurant_data = await ratingCollection.find_one({"restaurantName": name})
 
     if restaurant_data:
-        avg_rating = restaurant_data["avgRating"]
-        num_ratings = restaurant_data["numRatings"]
-
-        response_data = {
-            "avgRating": avg_rating,
-            "restaurantName": name,
-            "numRatings": num_ratings,
-        }
-
-        return response_data
+        return ratingResponse(restaurant_data)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,4 +1,6 @@
 from typing import Optional, List
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from enum import Enum
 from fastapi import FastAPI, Body, Form, HTTPException, status, UploadFile, File, Query
@@ -8,16 +10,41 @@ from pydantic import ConfigDict, BaseModel, Field
 from pydantic.functional_validators import BeforeValidator
 import aiofiles
 from typing_extensions import Annotated
+from pymongo.errors import DuplicateKeyError
 
-import motor.motor_asyncio
 import constants as constants
+from mongo import createClient, warmPool, PoolState, probeRouter
 
-client = motor.motor_asyncio.AsyncIOMotorClient(constants.MONGODB_URL)
-db = client[constants.DataBaseName]
+# Opened by the lifespan; set beforehand to run against another client
+client = None
+db = None
+poolState = PoolState()
+lifecycle = "starting"
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
+def openMongo():
+    global client, db
+    if client is None:
+        client = createClient([poolState])
+        db = client[constants.DataBaseName]
+    return db
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global lifecycle
+    openMongo()
+    await warmPool(client, constants.MongoWarmConnections)
+    lifecycle = "ready"
+    yield
+    lifecycle = "stopping"
+    await asyncio.sleep(constants.ShutdownDrainSeconds)
+    client.close()
+
 app = FastAPI(title="Restaurant API",
-    summary="FastAPI Application to add a ReST API to a MongoDB collection for restaurants.",)
+    summary="FastAPI Application to add a ReST API to a MongoDB collection for restaurants.",
+    lifespan=lifespan,)
+
+app.include_router(probeRouter(lambda: (lifecycle, client), poolState))
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -50,6 +77,19 @@ class RestaurantResponseModel(BaseModel):
 class RestaurantListing(BaseModel):
     restaurants: List[RestaurantModel]
 
+# Times are stored display-ready ("09:00 AM") next to their minute of the day (540), the
+# schema DockerEnv/app reads; both apps share the Restaurants collection
+def parseTime(value):
+    parsed = datetime.strptime(value, '%I:%M %p')
+    return parsed.strftime('%I:%M %p'), parsed.hour * 60 + parsed.minute
+
+def formatTimes(restaurant):
+    # Restaurants DockerEnv/app has not migrated yet still hold 1900-01-01 datetimes
+    for field in ('opening_time', 'closing_time'):
+        if isinstance(restaurant[field], datetime):
+            restaurant[field] = restaurant[field].strftime('%I:%M %p')
+    return restaurant
+
 @app.get("/")
 def read_root():
     return RedirectResponse("/docs")
@@ -68,6 +108,11 @@ async def addRestaurant(name: str = Form(...),
     rating: Optional[float] = Form(None),
     image: UploadFile = File(...),):
     restaurantCollection = db[constants.RestaurantCollectionName]
+    try:
+        opening_time, openingMinute = parseTime(opening_time)
+        closing_time, closingMinute = parseTime(closing_time)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Times must look like 09:30 AM")
     restaurant = RestaurantModel(
         name=name,
         phone_number=phone_number,
@@ -80,13 +125,14 @@ async def addRestaurant(name: str = Form(...),
     async with aiofiles.open(f"static/{restaurant.name}.jpg", "wb") as out_file:
         while content := await image.read(1024):  # async read chunk
             await out_file.write(content)
-    restaurant.opening_time = datetime.strptime(restaurant.opening_time, '%I:%M %p')
-    restaurant.closing_time = datetime.strptime(restaurant.closing_time, '%I:%M %p')
-    newRestaurant = await restaurantCollection.insert_one(restaurant.model_dump(by_alias=True, exclude=["id"]))
-    response = await restaurantCollection.find_one({"_id": newRestaurant.inserted_id})
-    response['opening_time'] = response['opening_time'].strftime('%I:%M %p')
-    response['closing_time'] = response['closing_time'].strftime('%I:%M %p')
-    return response
+    document = restaurant.model_dump(by_alias=True, exclude=["id"])
+    document['openingMinute'] = openingMinute
+    document['closingMinute'] = closingMinute
+    try:
+        newRestaurant = await restaurantCollection.insert_one(document)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Restaurant {name} already exists")
+    return await restaurantCollection.find_one({"_id": newRestaurant.inserted_id})
 
 @app.get(
     "/restaurants/",
@@ -98,8 +144,7 @@ async def listRestaurants():
     restaurantCollection = db[constants.RestaurantCollectionName]
     restaurantListings = await restaurantCollection.find().to_list(None)
     for restaurant in restaurantListings:
-        restaurant['opening_time'] = restaurant['opening_time'].strftime('%I:%M %p')
-        restaurant['closing_time'] = restaurant['closing_time'].strftime('%I:%M %p')
+        formatTimes(restaurant)
     return RestaurantListing(restaurants=restaurantListings)
 
 @app.get(
@@ -112,9 +157,7 @@ async def searchRestaurantByName(name: str):
     restaurantCollection = db[constants.RestaurantCollectionName]
 
     if (restaurant := await restaurantCollection.find_one({"name": name})) is not None:
-        restaurant['opening_time'] = restaurant['opening_time'].strftime('%I:%M %p')
-        restaurant['closing_time'] = restaurant['closing_time'].strftime('%I:%M %p')
-        return restaurant
+        return formatTimes(restaurant)
     
     raise HTTPException(status_code=404, detail=f"Restaurant {name} not found")
 
@@ -136,8 +179,7 @@ async def searchRestaurantByQuery(query: str = Query(..., description="Search qu
     
     # Convert opening_time and closing_time to string format
     for restaurant in matching_restaurants:
-        restaurant['opening_time'] = restaurant['opening_time'].strftime('%I:%M %p')
-        restaurant['closing_time'] = restaurant['closing_time'].strftime('%I:%M %p')
+        formatTimes(restaurant)
 
     return RestaurantListing(restaurants=matching_restaurants)
 
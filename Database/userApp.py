@@ -1,4 +1,6 @@
 from typing import Optional, List
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from enum import Enum
 from fastapi import FastAPI, Body, Form, HTTPException, status, UploadFile, File
@@ -8,15 +10,39 @@ from pydantic import ConfigDict, BaseModel, Field
 from pydantic.functional_validators import BeforeValidator
 from typing_extensions import Annotated
 
-import motor.motor_asyncio
 import constants as constants
+from mongo import createClient, warmPool, PoolState, probeRouter
 
-client = motor.motor_asyncio.AsyncIOMotorClient(constants.MONGODB_URL)
-db = client[constants.DataBaseName]
+# Opened by the lifespan; set beforehand to run against another client
+client = None
+db = None
+poolState = PoolState()
+lifecycle = "starting"
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
+def openMongo():
+    global client, db
+    if client is None:
+        client = createClient([poolState])
+        db = client[constants.DataBaseName]
+    return db
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global lifecycle
+    openMongo()
+    await warmPool(client, constants.MongoWarmConnections)
+    lifecycle = "ready"
+    yield
+    lifecycle = "stopping"
+    await asyncio.sleep(constants.ShutdownDrainSeconds)
+    client.close()
+
 app = FastAPI(title="User API",
-    summary="FastAPI Application to add a ReST API to a MongoDB collection for users.",)
+    summary="FastAPI Application to add a ReST API to a MongoDB collection for users.",
+    lifespan=lifespan,)
+
+app.include_router(probeRouter(lambda: (lifecycle, client), poolState))
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
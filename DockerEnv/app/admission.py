@@ -0,0 +1,247 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+import orjson
+from starlette.routing import Match
+
+
+class TokenBuckets:
+    # One bucket per client, refilled lazily when the client is next seen. Least recently
+    # seen clients are forgotten past maxClients; a forgotten client starts with a full bucket.
+    def __init__(self, rate: float, burst: float, maxClients: int):
+        self.rate = rate
+        self.burst = burst
+        self.maxClients = maxClients
+        self.buckets = OrderedDict()
+
+    def take(self, client: str, cost: float, now: float) -> float:
+        # 0 if the request may go ahead, otherwise seconds until the bucket holds enough
+        tokens, updated = self.buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (min(cost, self.burst) - tokens) / self.rate
+        self.buckets[client] = (tokens, now)
+        if len(self.buckets) > self.maxClients:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimit:
+    # At most limit requests of one route run at once; the rest wait in FIFO order, up to
+    # maxQueue of them, for at most maxWait seconds. A finished request hands its slot
+    # straight to the next waiter.
+    def __init__(self, limit: int, maxQueue: int, maxWait: float):
+        self.limit = limit
+        self.maxQueue = maxQueue
+        self.maxWait = maxWait
+        self.active = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.queueFull = 0
+        self.timedOut = 0
+        self.totalWaitSeconds = 0.0
+        self.maxWaitSeconds = 0.0
+
+    async def acquire(self) -> str:
+        # None once admitted, otherwise why the request was shed
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return None
+        if len(self.waiters) >= self.maxQueue:
+            self.queueFull += 1
+            return "queueFull"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait((waiter,), timeout=self.maxWait)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the request was cancelled: pass it on
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                # Timed out, or the client went away while waiting
+                self.waiters.remove(waiter)
+                waiter.cancel()
+        waited = time.perf_counter() - started
+        self.totalWaitSeconds += waited
+        self.maxWaitSeconds = max(self.maxWaitSeconds, waited)
+        if waiter.cancelled():
+            self.timedOut += 1
+            return "queueTimeout"
+        self.admitted += 1
+        return None
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "queueFull": self.queueFull,
+            "queueTimeout": self.timedOut,
+            "avgWaitSeconds": self.totalWaitSeconds / self.queued if self.queued else 0.0,
+            "maxWaitSeconds": self.maxWaitSeconds,
+        }
+
+
+class LoopLag:
+    # How late the event loop runs a callback scheduled interval seconds ahead: the time
+    # every request already inside this worker is spending queued. Rises at once with a
+    # late tick and decays over a few ticks, so one slow callback doesn't shed for long.
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = 0.0
+        self.maxLag = 0.0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, loop.time() - expected)
+            self.lag = sample if sample > self.lag else self.lag * 0.7 + sample * 0.3
+            self.maxLag = max(self.maxLag, sample)
+
+
+class AdmissionControl:
+    # Decides whether a request may run. Each request is matched to its route and a class
+    # (read, write or upload), then:
+    # - charged against its client's token bucket, or refused with 429 and Retry-After
+    # - shed with 503 and Retry-After while the event loop lags more than its class
+    #   tolerates: uploads go first, then writes, and reads only when far behind
+    # - admitted through its route's concurrency limit, or shed with 503 and Retry-After
+    #   when the route's queue is full or the request waited longer than its class allows
+    # Reads get generous limits and short waits; uploads few slots, so a burst of image
+    # uploads waits its turn instead of slowing every listing down with it.
+    def __init__(self, routes, classes, buckets: TokenBuckets, loopLag: LoopLag, retryAfter: float, clientHeader: str = ""):
+        self.routes = routes
+        self.classes = classes
+        self.buckets = buckets
+        self.loopLag = loopLag
+        self.retryAfter = retryAfter
+        self.clientHeader = clientHeader.lower().encode()
+        self.limits = {}
+        self.throttled = {}
+        self.lagged = {}
+
+    async def admit(self, scope):
+        # (limit to release afterwards, None) or (None, (status, detail, retryAfter)); (None, None) for unrouted paths
+        route = self.routeOf(scope)
+        if route is None:
+            return None, None
+        # Lets the metrics middleware label shed requests by route as well
+        scope["route"] = route
+        routeKey = (scope["method"], route.path)
+        settings = self.classes[self.classify(scope)]
+        if self.buckets is not None:
+            wait = self.buckets.take(self.clientOf(scope), settings["cost"], time.monotonic())
+            if wait > 0:
+                self.throttled[routeKey] = self.throttled.get(routeKey, 0) + 1
+                return None, (429, "Too many requests from this client", wait)
+        if self.loopLag.lag > settings["maxLagSeconds"]:
+            self.lagged[routeKey] = self.lagged.get(routeKey, 0) + 1
+            return None, (503, "Server busy, retry shortly", self.retryAfter)
+        limit = self.limits.get(routeKey)
+        if limit is None:
+            limit = self.limits[routeKey] = ConcurrencyLimit(settings["concurrency"], settings["queue"], settings["maxWaitSeconds"])
+        if await limit.acquire() is not None:
+            return None, (503, "Server busy, retry shortly", self.retryAfter)
+        return limit, None
+
+    def routeOf(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    def classify(self, scope) -> str:
+        if scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            return "read"
+        for name, value in scope["headers"]:
+            if name == b"content-type":
+                return "upload" if value.startswith(b"multipart/") else "write"
+        return "write"
+
+    def clientOf(self, scope) -> str:
+        if self.clientHeader:
+            for name, value in scope["headers"]:
+                if name == self.clientHeader:
+                    # The left-most X-Forwarded-For entry is the original client
+                    return value.split(b",")[0].strip().decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    def stats(self):
+        routes = {}
+        for key in sorted(set(self.limits) | set(self.throttled) | set(self.lagged)):
+            limit = self.limits.get(key)
+            routes[" ".join(key)] = {**(limit.stats() if limit is not None else {}),
+                                     "throttled": self.throttled.get(key, 0), "loopLagged": self.lagged.get(key, 0)}
+        return {
+            "clients": len(self.buckets.buckets) if self.buckets is not None else 0,
+            "loopLagSeconds": self.loopLag.lag,
+            "maxLoopLagSeconds": self.loopLag.maxLag,
+            "routes": routes,
+        }
+
+
+class AdmissionMiddleware:
+    # Plain ASGI middleware around AdmissionControl; paths under exempt (probes, metrics,
+    # static files) and websockets pass straight through
+    def __init__(self, app, control: AdmissionControl, exempt=()):
+        self.app = app
+        self.control = control
+        self.exempt = tuple(exempt)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+        limit, refusal = await self.control.admit(scope)
+        if refusal is not None:
+            await self.refuse(send, *refusal)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if limit is not None:
+                limit.release()
+
+    async def refuse(self, send, statusCode: int, detail: str, retryAfter: float):
+        body = orjson.dumps({"detail": detail})
+        await send({"type": "http.response.start", "status": statusCode, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retryAfter))).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import itertools
+import os
+import time
+import zipfile
+
+import orjson
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+import constants as constants
+from catalogSnapshot import SnapshotStore
+from uploads import saveImageBytes
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+
+def detectFormat(filename, declared=None) -> str:
+    fileFormat = (declared or os.path.splitext(filename or "")[1].lstrip(".") or CSV).lower()
+    if fileFormat in ("jsonl", "json", NDJSON):
+        return NDJSON
+    if fileFormat != CSV:
+        raise ValueError(f"Unsupported import format: {fileFormat}")
+    return CSV
+
+
+def readRows(file, fileFormat: str):
+    # Yields (row number, dict) one row at a time from a binary file; a row that cannot be
+    # parsed is yielded as (row number, ValueError) so it lands in the error report.
+    # Lines are decoded incrementally because SpooledTemporaryFile cannot back a TextIOWrapper on 3.9.
+    lines = codecs.iterdecode(file, "utf-8-sig")
+    rowNumber = 0
+    if fileFormat == NDJSON:
+        try:
+            for line in lines:
+                if not line.strip():
+                    continue
+                rowNumber += 1
+                try:
+                    row = orjson.loads(line)
+                    yield rowNumber, row if isinstance(row, dict) else ValueError("row is not a JSON object")
+                except orjson.JSONDecodeError as exc:
+                    yield rowNumber, ValueError(f"invalid JSON: {exc}")
+        except UnicodeDecodeError as exc:
+            yield rowNumber + 1, ValueError(f"invalid UTF-8: {exc}")
+        return
+    try:
+        for row in csv.DictReader(lines):
+            rowNumber += 1
+            # Empty cells mean "not given", so optional fields fall back to their defaults
+            yield rowNumber, {key: value for key, value in row.items() if key and value not in ("", None)}
+    except (csv.Error, UnicodeDecodeError) as exc:
+        yield rowNumber + 1, ValueError(f"invalid CSV: {exc}")
+
+
+class ImageArchive:
+    # Images referenced by an "image" column, looked up by path inside an uploaded zip
+    def __init__(self, file, directory: str, maxBytes: int):
+        self.archive = zipfile.ZipFile(file)
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.saved = {}
+        self.savedFiles = set()
+
+    def save(self, name: str) -> str:
+        if name not in self.saved:
+            try:
+                info = self.archive.getinfo(name)
+            except KeyError:
+                raise ValueError(f"image {name} is not in the archive")
+            if info.file_size > self.maxBytes:
+                raise ValueError(f"image {name} is larger than {self.maxBytes} bytes")
+            self.saved[name] = saveImageBytes(self.archive.read(info), self.directory, self.maxBytes)
+            self.savedFiles.add(self.saved[name])
+        return self.saved[name]
+
+
+def describeError(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors())
+    return str(exc)
+
+
+def prepareChunk(rows, buildDocument, chunkSize: int, errors: list):
+    # Runs in a worker thread: parsing, validation and image writes stay off the event loop
+    documents, rowNumbers = [], []
+    consumed = 0
+    for rowNumber, row in itertools.islice(rows, chunkSize):
+        consumed += 1
+        try:
+            if isinstance(row, Exception):
+                raise row
+            documents.append(buildDocument(row))
+            rowNumbers.append(rowNumber)
+        except (ValidationError, ValueError) as exc:
+            errors.append({"row": rowNumber, "error": describeError(exc)})
+    return documents, rowNumbers, consumed
+
+
+async def importRows(collection, rows, buildDocument, chunkSize: int, onInserted=None) -> dict:
+    errors = []
+    inserted = 0
+    while True:
+        documents, rowNumbers, consumed = await asyncio.to_thread(prepareChunk, rows, buildDocument, chunkSize, errors)
+        if not consumed:
+            break
+        if not documents:
+            continue
+        failedIndexes = set()
+        try:
+            result = await collection.insert_many(documents, ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as exc:
+            inserted += exc.details["nInserted"]
+            for writeError in exc.details["writeErrors"]:
+                failedIndexes.add(writeError["index"])
+                message = "duplicate key" if writeError.get("code") == 11000 else writeError.get("errmsg", "write failed")
+                errors.append({"row": rowNumbers[writeError["index"]], "error": message})
+        if onInserted is not None:
+            onInserted([document for index, document in enumerate(documents) if index not in failedIndexes])
+    errors.sort(key=lambda error: error["row"])
+    return {"inserted": inserted, "failed": len(errors), "errors": errors}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bulk load restaurants, menu items or users from CSV/NDJSON into MongoDB")
+    parser.add_argument("kind", choices=["restaurants", "menu", "users"])
+    parser.add_argument("path", help="CSV or NDJSON file (.csv, .ndjson, .jsonl)")
+    parser.add_argument("--images", help="zip of images referenced by an 'image' column")
+    parser.add_argument("--format", choices=[CSV, NDJSON])
+    parser.add_argument("--chunk-size", type=int, default=constants.BulkImportChunkSize)
+    args = parser.parse_args()
+
+    # The row builders live next to the models they validate with
+    import main as app
+
+    db = app.openMongo()
+    await app.ensureIndexes(db)
+    collectionName, buildDocument = app.bulkImporters[args.kind]
+    images = None
+    if args.images:
+        images = ImageArchive(open(args.images, "rb"), constants.StaticDirectory, constants.UploadMaxBytes)
+    started = time.perf_counter()
+    with open(args.path, "rb") as file:
+        rows = readRows(file, detectFormat(args.path, args.format))
+        report = await importRows(db[collectionName], rows, lambda row: buildDocument(row, images), args.chunk_size)
+    elapsed = time.perf_counter() - started
+    for error in report["errors"]:
+        print(f"row {error['row']}: {error['error']}")
+    print(f"inserted={report['inserted']} failed={report['failed']} in {elapsed:.1f}s "
+          f"({report['inserted'] / elapsed * 60:.0f} rows/min)")
+    if constants.CatalogSnapshot:
+        # Lets a running loader rebuild the shared snapshot without waiting for its maximum age
+        SnapshotStore(constants.CatalogSnapshotDirectory, constants.CatalogSnapshotCheckSeconds).markDirty()
+    if constants.IndexRefreshSeconds > 0:
+        print(f"Running API workers pick up the new rows in their in-memory indexes within {constants.IndexRefreshSeconds:g}s "
+              f"and in cached listings within {constants.ResponseCacheMaxAgeSeconds:g}s")
+    else:
+        print(f"Running API workers show the new rows in cached listings within {constants.ResponseCacheMaxAgeSeconds:g}s "
+              "and in their in-memory indexes on restart (INDEX_REFRESH_SECONDS=0)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def etagMatches(request: Request, etag: str) -> bool:
+    ifNoneMatch = request.headers.get("if-none-match")
+    if not ifNoneMatch:
+        return False
+    if ifNoneMatch.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison function, so W/ prefixes are ignored
+    for tag in ifNoneMatch.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "mediaType", "expires")
+
+    def __init__(self, body: bytes, mediaType: str = "application/json", expires: float = 0.0):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.mediaType = mediaType
+        self.expires = expires
+
+    def matches(self, request: Request) -> bool:
+        return etagMatches(request, self.etag)
+
+    def toResponse(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.matches(request):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type=self.mediaType, headers=headers)
+
+
+class ResponseCache:
+    # Entries are keyed by tuples such as ("menu", restaurantName). Every write bumps
+    # the version, and a fill is only stored if no write happened while it was being
+    # computed, so a slow reader can never put a stale body back after invalidation.
+    # Writes this worker never sees (other workers, other apps) are caught by maxAge.
+    def __init__(self, maxEntries: int, maxBytes: int, maxAge: float):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+        self.version = 0
+        self.totalBytes = 0
+        self.entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires <= time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: tuple, body: bytes, version: int) -> CachedResponse:
+        entry = CachedResponse(body, expires=time.monotonic() + self.maxAge)
+        if version != self.version or len(body) > self.maxBytes:
+            return entry
+        self._remove(key)
+        self.entries[key] = entry
+        self.totalBytes += len(body)
+        while len(self.entries) > self.maxEntries or self.totalBytes > self.maxBytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.totalBytes -= len(evicted.body)
+        return entry
+
+    def invalidate(self, *prefix):
+        self.version += 1
+        if not prefix:
+            self.entries.clear()
+            self.totalBytes = 0
+            return
+        for key in [key for key in self.entries if key[:len(prefix)] == prefix]:
+            self._remove(key)
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.totalBytes -= len(entry.body)
@@ -0,0 +1,389 @@
+import asyncio
+import bisect
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from cache import etagMatches
+
+logger = logging.getLogger(__name__)
+
+# File layout: restaurant records, then each restaurant's menu records, then the fixed-width
+# tables, then a JSON header, then FOOTER (header offset, header length, magic).
+# Records of one listing are stored back to back with "," between them, so any run of
+# consecutive records is already a valid JSON array body and is served as one slice.
+MAGIC = b"CFDSNAP1"
+FOOTER = struct.Struct("<QI8s")
+RESTAURANT = struct.Struct("<12sQI")    # _id, record offset, record length
+MENU = struct.Struct("<12sQIBq")        # _id, record offset, record length, menu type, price
+MENU_TYPES = {"Veg": 1, "Non-Veg": 2}
+POINTER = "CURRENT"
+DIRTY = "DIRTY"
+LOCK = "loader.lock"
+
+
+def encodeId(objectId) -> bytes:
+    return objectId.binary
+
+
+def cursorBytes(objectId: bytes) -> bytes:
+    return b'"' + objectId.hex().encode() + b'"'
+
+
+def snapshotResponse(request: Request, snapshot, build, mediaType: str = "application/json") -> Response:
+    # The body only changes with the snapshot, so the ETag is known before the body is built
+    # and a revalidation costs neither a Mongo query nor a hash of the body
+    key = f"{mediaType} {request.url.path}?{request.url.query}"
+    etag = '"%x-%s"' % (snapshot.version, hashlib.blake2b(key.encode(), digest_size=8).hexdigest())
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etagMatches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=build(), media_type=mediaType, headers=headers)
+
+
+def listingBody(key: bytes, body: bytes, nextCursor) -> bytes:
+    return b'{"' + key + b'":[' + body + b'],"nextCursor":' + (nextCursor or b"null") + b"}"
+
+
+def ndjsonBody(records, nextCursor) -> bytes:
+    lines = b"".join(record + b"\n" for record in records)
+    if nextCursor is not None:
+        lines += b'{"nextCursor": ' + nextCursor + b"}\n"
+    return lines
+
+
+def writeSnapshot(path: str, version: int, restaurants, menus, ratings):
+    # restaurants: [(ObjectId, name, record bytes)] in _id order
+    # menus: {restaurantName: [(ObjectId, menu_type, price, record bytes)] in _id order}
+    # ratings: {restaurantName: (ratingSum, numRatings)}
+    tables = bytearray()
+    header = {"version": version, "restaurants": [], "menus": {}, "ratings": ratings}
+    with open(path, "wb") as out_file:
+        offset = 0
+
+        def writeRun(records):
+            # Writes records joined by "," and returns each one's (offset, length)
+            nonlocal offset
+            placed = []
+            for index, record in enumerate(records):
+                if index:
+                    out_file.write(b",")
+                    offset += 1
+                out_file.write(record)
+                placed.append((offset, len(record)))
+                offset += len(record)
+            return placed
+
+        placed = writeRun([record for _, _, record in restaurants])
+        restaurantTable = len(tables)
+        for (objectId, name, _), (recordOffset, length) in zip(restaurants, placed):
+            tables += RESTAURANT.pack(encodeId(objectId), recordOffset, length)
+            header["restaurants"].append(name)
+        header["restaurantTable"] = restaurantTable
+
+        menuTables = []
+        for restaurantName, items in menus.items():
+            placed = writeRun([record for _, _, _, record in items])
+            menuTables.append((restaurantName, items, placed))
+        for restaurantName, items, placed in menuTables:
+            header["menus"][restaurantName] = [len(tables), len(items)]
+            for (objectId, menuType, price, _), (recordOffset, length) in zip(items, placed):
+                tables += MENU.pack(encodeId(objectId), recordOffset, length, MENU_TYPES.get(menuType, 0), price)
+
+        tablesOffset = offset
+        out_file.write(tables)
+        header["tablesOffset"] = tablesOffset
+        headerBytes = orjson.dumps(header)
+        out_file.write(headerBytes)
+        out_file.write(FOOTER.pack(tablesOffset + len(tables), len(headerBytes), MAGIC))
+
+
+class Snapshot:
+    # One immutable snapshot, mapped read-only. Every worker maps the same file, so record
+    # bytes live once in the page cache; only the header (names, ratings) is per process.
+    def __init__(self, path: str):
+        with open(path, "rb") as in_file:
+            self.data = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        headerOffset, headerLength, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header = orjson.loads(self.data[headerOffset:headerOffset + headerLength])
+        self.path = path
+        self.version = header["version"]
+        self.tablesOffset = header["tablesOffset"]
+        self.restaurantTable = self.tablesOffset + header["restaurantTable"]
+        self.restaurantNames = header["restaurants"]
+        self.restaurantIndex = {name: index for index, name in enumerate(self.restaurantNames)}
+        self.menus = {name: (self.tablesOffset + table, count) for name, (table, count) in header["menus"].items()}
+        self.ratings = header["ratings"]
+
+    def __len__(self):
+        return len(self.restaurantNames)
+
+    def _restaurant(self, index: int):
+        return RESTAURANT.unpack_from(self.data, self.restaurantTable + index * RESTAURANT.size)
+
+    def _menu(self, table: int, index: int):
+        return MENU.unpack_from(self.data, table + index * MENU.size)
+
+    def _window(self, count: int, idAt, afterId, limit):
+        # Records are in _id order, so the page after a cursor starts at a binary search
+        start = 0
+        if afterId is not None:
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                if idAt(middle) <= afterId:
+                    low = middle + 1
+                else:
+                    high = middle
+            start = low
+        end = count if limit is None else min(count, start + limit)
+        return start, max(start, end)
+
+    def _run(self, count: int, recordAt, afterId, limit):
+        # A page of one listing as (array body without brackets, nextCursor or None). The
+        # records are adjacent in the file, so the body is a single slice.
+        start, end = self._window(count, lambda index: recordAt(index)[0], afterId, limit)
+        if start == end:
+            return b"", None
+        first, last = recordAt(start), recordAt(end - 1)
+        return self.data[first[1]:last[1] + last[2]], (cursorBytes(last[0]) if end < count else None)
+
+    def _records(self, records, afterId, limit):
+        # A page of a filtered listing as (record list, nextCursor or None)
+        start, end = self._window(len(records), lambda index: records[index][0], afterId, limit)
+        page = records[start:end]
+        nextCursor = cursorBytes(page[-1][0]) if page and end < len(records) else None
+        return [self.data[record[1]:record[1] + record[2]] for record in page], nextCursor
+
+    def restaurant(self, name: str):
+        index = self.restaurantIndex.get(name)
+        if index is None:
+            return None
+        _, recordOffset, length = self._restaurant(index)
+        return self.data[recordOffset:recordOffset + length]
+
+    def restaurantPage(self, afterId, limit):
+        return self._run(len(self.restaurantNames), self._restaurant, afterId, limit)
+
+    def restaurantLines(self, afterId, limit):
+        return self._records([self._restaurant(index) for index in range(len(self.restaurantNames))], afterId, limit)
+
+    def restaurantRecords(self, names, afterId, limit):
+        # Search results: the named restaurants, still in _id order with the same paging
+        positions = sorted(self.restaurantIndex[name] for name in set(names) if name in self.restaurantIndex)
+        return self._records([self._restaurant(index) for index in positions], afterId, limit)
+
+    def _menuTable(self, restaurantName: str, menuType=None):
+        table, count = self.menus.get(restaurantName, (0, 0))
+        records = [self._menu(table, index) for index in range(count)]
+        if menuType is not None:
+            records = [record for record in records if record[3] == MENU_TYPES[menuType]]
+        return records
+
+    def menuPage(self, restaurantName: str, afterId, limit, menuType=None):
+        if menuType is None:
+            table, count = self.menus.get(restaurantName, (0, 0))
+            return self._run(count, lambda index: self._menu(table, index), afterId, limit)
+        records, nextCursor = self._records(self._menuTable(restaurantName, menuType), afterId, limit)
+        return b",".join(records), nextCursor
+
+    def menuLines(self, restaurantName: str, afterId, limit):
+        return self._records(self._menuTable(restaurantName), afterId, limit)
+
+    def menuSelection(self, restaurantName: str, menuType, minPrice, maxPrice, direction, after, limit):
+        # Filters on menu type and price, in _id order (direction None, after is _id bytes) or in
+        # price order (direction 1 or -1, after is (price, _id bytes)), using only the table.
+        # Returns (record list, sort key of the last record when another page exists).
+        records = [record for record in self._menuTable(restaurantName, menuType)
+                   if (minPrice is None or record[4] >= minPrice) and (maxPrice is None or record[4] <= maxPrice)]
+        if direction is None:
+            start, end = self._window(len(records), lambda index: records[index][0], after, limit)
+            page, more = records[start:end], end < len(records)
+            lastKey = page[-1][0] if page and more else None
+        else:
+            records.sort(key=lambda record: (record[4], record[0]))
+            keys = [(record[4], record[0]) for record in records]
+            if direction < 0:
+                end = len(records) if after is None else bisect.bisect_left(keys, after)
+                start = 0 if limit is None else max(0, end - limit)
+                page, more = records[start:end][::-1], start > 0
+            else:
+                start = 0 if after is None else bisect.bisect_right(keys, after)
+                end = len(records) if limit is None else min(len(records), start + limit)
+                page, more = records[start:end], end < len(records)
+            lastKey = (page[-1][4], page[-1][0]) if page and more else None
+        return [self.data[record[1]:record[1] + record[2]] for record in page], lastKey
+
+    def rating(self, restaurantName: str):
+        rating = self.ratings.get(restaurantName)
+        if rating is None:
+            return None
+        return {"restaurantName": restaurantName, "ratingSum": rating[0], "numRatings": rating[1]}
+
+    def close(self):
+        self.data.close()
+
+
+class SnapshotStore:
+    # Directory shared by the workers of one host: versioned snapshot files, a CURRENT
+    # pointer swapped with os.replace, a DIRTY marker writers touch, and the loader lock
+    def __init__(self, directory: str, checkInterval: float):
+        self.directory = directory
+        self.checkInterval = checkInterval
+        self.snapshot = None
+        self.pointerStat = None
+        self.lastCheck = 0.0
+        self.lockFile = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def current(self):
+        # At most one stat() per checkInterval; a new version is mapped on first use
+        now = time.monotonic()
+        if self.snapshot is None or now - self.lastCheck >= self.checkInterval:
+            self.lastCheck = now
+            self._refresh()
+        return self.snapshot
+
+    def _refresh(self):
+        try:
+            stat_result = os.stat(self.path(POINTER))
+        except FileNotFoundError:
+            return
+        pointerStat = (stat_result.st_ino, stat_result.st_mtime_ns)
+        if pointerStat == self.pointerStat:
+            return
+        try:
+            with open(self.path(POINTER)) as pointer:
+                snapshot = Snapshot(self.path(pointer.read().strip()))
+        except (FileNotFoundError, ValueError):
+            # The loader replaced the file between reading the pointer and opening it
+            return
+        # The previous map is left to the garbage collector: in-flight requests may still hold it
+        self.snapshot = snapshot
+        self.pointerStat = pointerStat
+
+    def publish(self, version: int, restaurants, menus, ratings) -> str:
+        name = f"catalog-{version}.snap"
+        tempPath = self.path(name + ".tmp")
+        writeSnapshot(tempPath, version, restaurants, menus, ratings)
+        os.replace(tempPath, self.path(name))
+        pointerTemp = self.path(f"{POINTER}.{os.getpid()}.tmp")
+        with open(pointerTemp, "w") as pointer:
+            pointer.write(name)
+        os.replace(pointerTemp, self.path(POINTER))
+        # Unlinked files stay readable for workers that still have them mapped
+        for stale in os.listdir(self.directory):
+            if stale.startswith("catalog-") and stale.endswith(".snap") and stale != name:
+                os.remove(self.path(stale))
+        return name
+
+    def markDirty(self):
+        with open(self.path(DIRTY), "a"):
+            pass
+        os.utime(self.path(DIRTY))
+
+    def dirtySince(self) -> int:
+        try:
+            return os.stat(self.path(DIRTY)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def tryBecomeLoader(self) -> bool:
+        # The lock is held for the worker's lifetime and released by the OS if it dies
+        if self.lockFile is not None:
+            return True
+        lockFile = open(self.path(LOCK), "a")
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lockFile.close()
+            return False
+        self.lockFile = lockFile
+        return True
+
+    def releaseLoader(self):
+        if self.lockFile is not None:
+            fcntl.flock(self.lockFile, fcntl.LOCK_UN)
+            self.lockFile.close()
+            self.lockFile = None
+
+
+class SnapshotLoader:
+    # Runs in every worker; only the one holding the loader lock rebuilds. load() returns
+    # (restaurants, menus, ratings) as writeSnapshot expects them.
+    def __init__(self, store: SnapshotStore, load, refreshInterval: float, maxAge: float):
+        self.store = store
+        self.load = load
+        self.refreshInterval = refreshInterval
+        self.maxAge = maxAge
+        self.task = None
+        self.builtAt = 0.0
+        self.builtFromDirty = -1
+        self.builds = 0
+        self.lastBuildSeconds = 0.0
+
+    async def build(self):
+        dirty = self.store.dirtySince()
+        started = time.perf_counter()
+        restaurants, menus, ratings = await self.load()
+        version = time.time_ns()
+        await asyncio.to_thread(self.store.publish, version, restaurants, menus, ratings)
+        self.lastBuildSeconds = time.perf_counter() - started
+        self.builtAt = time.monotonic()
+        # Writes that land while loading bump DIRTY again and trigger the next build
+        self.builtFromDirty = dirty
+        self.builds += 1
+
+    async def start(self, waitSeconds: float):
+        if self.store.tryBecomeLoader():
+            await self.build()
+        else:
+            deadline = time.monotonic() + waitSeconds
+            while self.store.current() is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.store.releaseLoader()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refreshInterval)
+            try:
+                if not self.store.tryBecomeLoader():
+                    continue
+                stale = time.monotonic() - self.builtAt >= self.maxAge
+                if stale or self.store.dirtySince() != self.builtFromDirty:
+                    await self.build()
+            except Exception:
+                logger.exception("Could not rebuild the catalog snapshot")
+
+    def stats(self) -> dict:
+        snapshot = self.store.current()
+        return {
+            "loader": self.store.lockFile is not None,
+            "version": snapshot.version if snapshot is not None else None,
+            "restaurants": len(snapshot) if snapshot is not None else 0,
+            "builds": self.builds,
+            "lastBuildSeconds": round(self.lastBuildSeconds, 4),
+        }
@@ -1,6 +1,126 @@
-MONGODB_URL = "mongodb://localhost:27017/"
+import os
+
+MONGODB_URL = os.environ.get("MONGODB_URL", "mongodb://localhost:27017/")
 DataBaseName = "CampusFoodDeliverySystem"
 RestaurantCollectionName = "Restaurants"
 RatingsCollectionName = "Ratings"
 RestaurantMenuCollectionName = "Menu"
-UsersCollectionName = "User"
\ No newline at end of file
+UsersCollectionName = "User"
+OrdersCollectionName = "Orders"
+
+ResponseCacheMaxEntries = 512
+ResponseCacheMaxBytes = 32 * 1024 * 1024
+# Listings written by this worker are dropped at once; writes from other workers, the Database
+# apps or bulk imports show up once the cached body is this old
+ResponseCacheMaxAgeSeconds = float(os.environ.get("RESPONSE_CACHE_MAX_AGE_SECONDS", "30"))
+# Identical concurrent lookups of one restaurant, menu or rating share a single query, and
+# the result is reused for this long. Writes in this worker drop it at once; writes made by
+# other workers can be this stale. 0 keeps only the coalescing
+SingleFlightTtlSeconds = float(os.environ.get("SINGLE_FLIGHT_TTL_SECONDS", "0.5"))
+SingleFlightMaxEntries = 4096
+MaxPageSize = 1000
+AutocompleteMaxResults = 25
+# The search and opening-hours indexes live in each worker and are rebuilt from MongoDB this often,
+# to pick up restaurants and menu items written by other workers, the Database apps or bulk imports. 0 turns it off
+IndexRefreshSeconds = float(os.environ.get("INDEX_REFRESH_SECONDS", "60"))
+# Opening hours are campus wall-clock times; "open now" is evaluated in this zone, not the server's
+CampusTimezone = os.environ.get("CAMPUS_TIMEZONE", "Asia/Kolkata")
+
+# Opt-in write-behind for /newRating/: ratings are buffered and flushed in batches
+RatingWriteBehind = os.environ.get("RATING_WRITE_BEHIND", "false").lower() == "true"
+RatingFlushIntervalSeconds = float(os.environ.get("RATING_FLUSH_INTERVAL_SECONDS", "1.0"))
+RatingFlushThreshold = int(os.environ.get("RATING_FLUSH_THRESHOLD", "1000"))
+
+StaticDirectory = "static"
+UploadChunkSize = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UploadMaxBytes = int(os.environ.get("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+ImageWorkers = int(os.environ.get("IMAGE_WORKERS", "2"))
+StaticCacheMaxBytes = int(os.environ.get("STATIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+StaticCacheMaxFileBytes = int(os.environ.get("STATIC_CACHE_MAX_FILE_BYTES", str(256 * 1024)))
+BulkImportChunkSize = int(os.environ.get("BULK_IMPORT_CHUNK_SIZE", "1000"))
+# Prometheus metrics at /metrics; cheap enough to leave on, the switch exists for benchmarking
+MetricsEnabled = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+
+# Connection pool, read by mongo.py; keep in step with Database/constants.py. Unset optional timeouts keep pymongo's defaults
+def optionalInt(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+MongoMaxPoolSize = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MongoMinPoolSize = int(os.environ.get("MONGO_MIN_POOL_SIZE", "10"))
+MongoMaxIdleTimeMS = optionalInt("MONGO_MAX_IDLE_TIME_MS")
+MongoConnectTimeoutMS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MongoServerSelectionTimeoutMS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MongoSocketTimeoutMS = optionalInt("MONGO_SOCKET_TIMEOUT_MS")
+MongoWaitQueueTimeoutMS = optionalInt("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+# e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+MongoCompressors = os.environ.get("MONGO_COMPRESSORS", "")
+MongoWarmConnections = int(os.environ.get("MONGO_WARM_CONNECTIONS", str(MongoMinPoolSize)))
+ReadinessTimeoutSeconds = float(os.environ.get("READINESS_TIMEOUT_SECONDS", "1.0"))
+# Time /readyz reports 503 before shutdown continues, so load balancers stop routing first
+ShutdownDrainSeconds = float(os.environ.get("SHUTDOWN_DRAIN_SECONDS", "0"))
+
+# Opt-in shared catalog: one worker writes restaurants, menus and rating totals to a snapshot
+# file that every worker on the host maps read-only and serves reads from
+CatalogSnapshot = os.environ.get("CATALOG_SNAPSHOT", "false").lower() == "true"
+CatalogSnapshotDirectory = os.environ.get("CATALOG_SNAPSHOT_DIRECTORY", "/dev/shm/campus-catalog" if os.path.isdir("/dev/shm") else "catalog-snapshot")
+# How often a worker checks for a newer snapshot, and how often the loader checks for writes
+CatalogSnapshotCheckSeconds = float(os.environ.get("CATALOG_SNAPSHOT_CHECK_SECONDS", "0.2"))
+CatalogSnapshotRefreshSeconds = float(os.environ.get("CATALOG_SNAPSHOT_REFRESH_SECONDS", "1.0"))
+# Rebuilt at least this often, which also picks up writes made outside the API
+CatalogSnapshotMaxAgeSeconds = float(os.environ.get("CATALOG_SNAPSHOT_MAX_AGE_SECONDS", "300"))
+CatalogSnapshotWaitSeconds = float(os.environ.get("CATALOG_SNAPSHOT_WAIT_SECONDS", "30"))
+
+# /orders/ group commit: orders wait in a bounded queue and are written with insert_many
+OrderQueueMaxSize = int(os.environ.get("ORDER_QUEUE_MAX_SIZE", "10000"))
+OrderBatchSize = int(os.environ.get("ORDER_BATCH_SIZE", "500"))
+OrderWriters = int(os.environ.get("ORDER_WRITERS", "2"))
+OrderMaxItems = 50
+OrderMaxQuantity = 20
+OrderRetryAfterSeconds = 1
+
+# Runner dispatch: campus coordinates are metres on a flat grid
+# Coordinates outside +/- this many metres of the origin are rejected
+CampusExtentMetres = float(os.environ.get("CAMPUS_EXTENT_METRES", "10000"))
+DispatchCellMetres = float(os.environ.get("DISPATCH_CELL_METRES", "100"))
+# A new order rides with an open batch from the same restaurant delivering within this distance
+DispatchBatchRadiusMetres = float(os.environ.get("DISPATCH_BATCH_RADIUS_METRES", "150"))
+DispatchCapacity = int(os.environ.get("DISPATCH_CAPACITY", "3"))
+# An open batch moves to an idle runner this much closer to the restaurant
+DispatchRebalanceGainMetres = float(os.environ.get("DISPATCH_REBALANCE_GAIN_METRES", "200"))
+DispatchRebalanceSeconds = float(os.environ.get("DISPATCH_REBALANCE_SECONDS", "5"))
+
+# /restaurants/top ranks by Bayesian average: each restaurant counts this many extra
+# ratings of the prior mean, so a handful of ratings can't top the board
+LeaderboardPriorMean = float(os.environ.get("LEADERBOARD_PRIOR_MEAN", "3.0"))
+LeaderboardPriorWeight = float(os.environ.get("LEADERBOARD_PRIOR_WEIGHT", "5"))
+# Restaurants and totals are reloaded this often, to pick up what other workers wrote; 0 turns it off
+LeaderboardRefreshSeconds = float(os.environ.get("LEADERBOARD_REFRESH_SECONDS", "60"))
+
+# /ws push hub, per worker. Idle connections cost a few KB each; a client more than
+# PushMaxPending messages behind is disconnected
+PushMaxConnections = int(os.environ.get("PUSH_MAX_CONNECTIONS", "20000"))
+PushMaxPending = int(os.environ.get("PUSH_MAX_PENDING", "64"))
+PushMaxTopics = 32
+
+# Admission control in front of every route except probes, metrics and static files
+AdmissionEnabled = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+# Opt-in per-client token bucket, in requests per second; a write costs more than a read. Off by
+# default: behind the campus NAT or a proxy every client shares one address, and so one bucket,
+# unless ADMISSION_CLIENT_HEADER names the header carrying the real client
+AdmissionClientRate = float(os.environ.get("ADMISSION_CLIENT_RATE", "0"))
+AdmissionClientBurst = float(os.environ.get("ADMISSION_CLIENT_BURST", "100"))
+AdmissionMaxClients = 100000
+# e.g. "X-Forwarded-For" behind a proxy; empty uses the connection's address
+AdmissionClientHeader = os.environ.get("ADMISSION_CLIENT_HEADER", "")
+# Per-route limits by class. A request waits up to maxWaitSeconds for a slot, behind at
+# most queue others, and is shed with 503 after that. It is shed straight away while the
+# event loop runs more than maxLagSeconds behind, so uploads give way first and reads last;
+# every threshold sits above an ordinary garbage collection pause.
+AdmissionClasses = {
+    "read": {"concurrency": int(os.environ.get("ADMISSION_READ_CONCURRENCY", "128")), "queue": 512, "maxWaitSeconds": 0.25, "maxLagSeconds": 1.0, "cost": 1},
+    "write": {"concurrency": int(os.environ.get("ADMISSION_WRITE_CONCURRENCY", "32")), "queue": 256, "maxWaitSeconds": 1.0, "maxLagSeconds": 0.4, "cost": 2},
+    "upload": {"concurrency": int(os.environ.get("ADMISSION_UPLOAD_CONCURRENCY", "4")), "queue": 32, "maxWaitSeconds": 2.0, "maxLagSeconds": 0.15, "cost": 5},
+}
+AdmissionLagIntervalSeconds = 0.02
+AdmissionRetryAfterSeconds = 1
@@ -0,0 +1,330 @@
+import math
+
+
+def distance(a, b) -> float:
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def pathLength(points) -> float:
+    return sum(distance(a, b) for a, b in zip(points, points[1:]))
+
+
+class SpatialGrid:
+    # Uniform grid over campus coordinates in metres. Each cell holds the keys inside it, so
+    # a nearest query scans rings of cells outwards from the point and stops as soon as no
+    # unscanned cell can hold anything closer.
+    def __init__(self, cellSize: float):
+        self.cellSize = cellSize
+        self.cells = {}
+        self.positions = {}
+        # (minX, minY, maxX, maxY) of every cell ever occupied. It only grows, which keeps
+        # updates O(1); a box looser than the occupied cells just costs a few empty rings.
+        self.bounds = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def _cell(self, point):
+        return int(point[0] // self.cellSize), int(point[1] // self.cellSize)
+
+    def move(self, key, point):
+        # Inserts or moves key; a move inside the same cell only updates the position
+        old = self.positions.get(key)
+        cell = self._cell(point)
+        if old is not None:
+            oldCell = self._cell(old)
+            if oldCell == cell:
+                self.positions[key] = point
+                return
+            self._discard(oldCell, key)
+        self.cells.setdefault(cell, set()).add(key)
+        self.positions[key] = point
+        if self.bounds is None:
+            self.bounds = cell + cell
+        else:
+            minX, minY, maxX, maxY = self.bounds
+            self.bounds = (min(minX, cell[0]), min(minY, cell[1]), max(maxX, cell[0]), max(maxY, cell[1]))
+
+    def remove(self, key):
+        point = self.positions.pop(key, None)
+        if point is not None:
+            self._discard(self._cell(point), key)
+
+    def _discard(self, cell, key):
+        keys = self.cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self.cells[cell]
+
+    def _ring(self, cx: int, cy: int, ring: int):
+        # Cells ring steps from (cx, cy), leaving out those outside self.bounds
+        minX, minY, maxX, maxY = self.bounds
+        if ring == 0:
+            yield cx, cy
+            return
+        for y in (cy - ring, cy + ring):
+            if minY <= y <= maxY:
+                for x in range(max(cx - ring, minX), min(cx + ring, maxX) + 1):
+                    yield x, y
+        for x in (cx - ring, cx + ring):
+            if minX <= x <= maxX:
+                for y in range(max(cy - ring + 1, minY), min(cy + ring - 1, maxY) + 1):
+                    yield x, y
+
+    def nearest(self, point, accept=None, limit: int = 1, maxDistance: float = math.inf):
+        # Returns up to limit (distance, key) pairs, closest first, for keys accept() allows
+        if not self.positions:
+            return []
+        cx, cy = self._cell(point)
+        found = []
+        examined = 0
+        # Rings that don't reach self.bounds, or that lie wholly past it, are empty, so the
+        # scan starts at the box and stops beyond it however far away the point is
+        minX, minY, maxX, maxY = self.bounds
+        ring = max(0, minX - cx, cx - maxX, minY - cy, cy - maxY)
+        lastRing = max(cx - minX, maxX - cx, cy - minY, maxY - cy)
+        while examined < len(self.positions) and ring <= lastRing:
+            # Everything beyond this ring is at least ring * cellSize away
+            reach = ring * self.cellSize
+            if reach > maxDistance or (len(found) >= limit and found[limit - 1][0] <= reach):
+                break
+            for cell in self._ring(cx, cy, ring):
+                for key in self.cells.get(cell, ()):
+                    examined += 1
+                    if accept is None or accept(key):
+                        found.append((distance(point, self.positions[key]), key))
+            # Ties go to the smaller key, so runs with the same inputs make the same choices
+            found.sort()
+            ring += 1
+        return [pair for pair in found[:limit] if pair[0] <= maxDistance]
+
+
+class Order:
+    __slots__ = ("id", "restaurantName", "pickup", "dropoff")
+
+    def __init__(self, orderId, restaurantName: str, pickup, dropoff):
+        self.id = orderId
+        self.restaurantName = restaurantName
+        self.pickup = tuple(pickup)
+        self.dropoff = tuple(dropoff)
+
+
+class Runner:
+    __slots__ = ("id", "position", "batch")
+
+    def __init__(self, runnerId, position):
+        self.id = runnerId
+        self.position = tuple(position)
+        self.batch = None
+
+
+class Batch:
+    # Orders from one restaurant carried together: the runner collects them all, then drops
+    # them off in self.orders order. Orders can join until the runner reaches the restaurant.
+    def __init__(self, runner: Runner, order: Order):
+        self.runner = runner
+        self.restaurantName = order.restaurantName
+        self.pickup = order.pickup
+        self.orders = [order]
+        self.pickedUp = False
+
+    def route(self):
+        stops = [self.runner.position]
+        if not self.pickedUp:
+            stops.append(self.pickup)
+        return stops + [order.dropoff for order in self.orders]
+
+    def length(self) -> float:
+        return pathLength(self.route())
+
+    def insertionCost(self, order: Order):
+        # Cheapest place for a new drop-off in the pickup -> drop-offs path: (extra metres, index)
+        stops = [self.pickup] + [existing.dropoff for existing in self.orders]
+        best = (distance(stops[-1], order.dropoff), len(self.orders))
+        for index in range(len(self.orders)):
+            before, after = stops[index], stops[index + 1]
+            cost = distance(before, order.dropoff) + distance(order.dropoff, after) - distance(before, after)
+            if cost < best[0]:
+                best = (cost, index)
+        return best
+
+    def describe(self):
+        return {
+            "restaurantName": self.restaurantName,
+            "pickedUp": self.pickedUp,
+            "orders": [order.id for order in self.orders],
+            "route": [list(stop) for stop in self.route()],
+            "distance": round(self.length(), 1),
+        }
+
+
+class DispatchEngine:
+    # Matches ready orders to runners, in memory. Idle runners, open batches' drop-offs and
+    # orders still waiting for a runner each live in a SpatialGrid, so every event is handled
+    # by looking only at the cells around it:
+    # - a new order joins an open batch from the same restaurant whose drop-offs are within
+    #   batchRadius of its own, at its cheapest insertion point; otherwise it goes to the
+    #   nearest idle runner, or waits
+    # - a runner that becomes idle takes the nearest waiting order and any waiting orders
+    #   from that restaurant that batch with it
+    # - rebalance() hands open batches to idle runners that are much closer to the pickup
+    def __init__(self, cellSize: float = 100.0, batchRadius: float = 150.0, capacity: int = 3, rebalanceGain: float = 200.0):
+        self.batchRadius = batchRadius
+        self.capacity = capacity
+        self.rebalanceGain = rebalanceGain
+        self.runners = {}
+        self.idleRunners = SpatialGrid(cellSize)
+        self.openDropoffs = SpatialGrid(cellSize)
+        self.waitingPickups = SpatialGrid(cellSize)
+        self.waiting = {}
+        self.batchOf = {}
+        self.assignments = 0
+        self.batchedAssignments = 0
+        self.reassignments = 0
+        self.delivered = 0
+
+    def addRunner(self, runnerId, position):
+        runner = self.runners.get(runnerId)
+        if runner is None:
+            runner = self.runners[runnerId] = Runner(runnerId, position)
+            self._idle(runner)
+        else:
+            self.moveRunner(runnerId, position)
+        return runner
+
+    def moveRunner(self, runnerId, position):
+        runner = self.runners[runnerId]
+        runner.position = tuple(position)
+        if runner.batch is None:
+            self.idleRunners.move(runnerId, runner.position)
+
+    def removeRunner(self, runnerId):
+        # Orders not yet collected go back to dispatch. Orders already picked up left with the
+        # runner and can't be dispatched again: they are dropped and returned so the caller can fail them.
+        runner = self.runners.pop(runnerId)
+        self.idleRunners.remove(runnerId)
+        batch = runner.batch
+        if batch is None:
+            return []
+        for order in batch.orders:
+            self.batchOf.pop(order.id, None)
+        if batch.pickedUp:
+            return batch.orders
+        self._close(batch)
+        for order in batch.orders:
+            self.addOrder(order)
+        return []
+
+    def addOrder(self, order: Order):
+        # Returns the runner id the order was assigned to, or None while it waits
+        for _, orderId in self.openDropoffs.nearest(order.dropoff, lambda key: self._joinable(key, order), maxDistance=self.batchRadius):
+            batch = self.batchOf[orderId]
+            _, index = batch.insertionCost(order)
+            batch.orders.insert(index, order)
+            self._track(batch, order)
+            self.batchedAssignments += 1
+            return batch.runner.id
+        for _, runnerId in self.idleRunners.nearest(order.pickup):
+            self._start(self.runners[runnerId], order)
+            return runnerId
+        self.waiting[order.id] = order
+        self.waitingPickups.move(order.id, order.pickup)
+        return None
+
+    def _joinable(self, orderId, order: Order) -> bool:
+        batch = self.batchOf[orderId]
+        return batch.restaurantName == order.restaurantName and len(batch.orders) < self.capacity
+
+    def pickedUp(self, runnerId):
+        # Once the runner has left the restaurant, nothing more can join the batch
+        batch = self.runners[runnerId].batch
+        batch.pickedUp = True
+        self._close(batch)
+
+    def deliver(self, runnerId, orderId):
+        runner = self.runners[runnerId]
+        batch = runner.batch
+        batch.orders = [order for order in batch.orders if order.id != orderId]
+        self.openDropoffs.remove(orderId)
+        self.batchOf.pop(orderId, None)
+        self.delivered += 1
+        if not batch.orders:
+            runner.batch = None
+            self._idle(runner)
+
+    def rebalance(self):
+        # Incremental re-optimization: an open batch moves to an idle runner that is at least
+        # rebalanceGain metres closer to its pickup; the previous runner becomes idle again.
+        # Returns the batches that changed runner, including any the freed runner started.
+        changed = []
+        for runner in list(self.runners.values()):
+            batch = runner.batch
+            if batch is None or batch.pickedUp or batch.runner is not runner:
+                continue
+            current = distance(runner.position, batch.pickup)
+            for gap, runnerId in self.idleRunners.nearest(batch.pickup, maxDistance=current - self.rebalanceGain):
+                replacement = self.runners[runnerId]
+                self.idleRunners.remove(runnerId)
+                replacement.batch, batch.runner, runner.batch = batch, replacement, None
+                self.reassignments += 1
+                changed.append(batch)
+                self._idle(runner)
+                if runner.batch is not None:
+                    changed.append(runner.batch)
+        return changed
+
+    def _start(self, runner: Runner, order: Order):
+        self.idleRunners.remove(runner.id)
+        runner.batch = Batch(runner, order)
+        self._track(runner.batch, order)
+        # Waiting orders from the same restaurant that deliver nearby ride along
+        for _, orderId in self.waitingPickups.nearest(order.pickup, lambda key: self.waiting[key].restaurantName == order.restaurantName,
+                                                      limit=len(self.waiting), maxDistance=0.0):
+            if len(runner.batch.orders) >= self.capacity:
+                break
+            waiting = self.waiting[orderId]
+            if min(distance(waiting.dropoff, existing.dropoff) for existing in runner.batch.orders) <= self.batchRadius:
+                self._unwait(orderId)
+                _, index = runner.batch.insertionCost(waiting)
+                runner.batch.orders.insert(index, waiting)
+                self._track(runner.batch, waiting)
+                self.batchedAssignments += 1
+
+    def _track(self, batch: Batch, order: Order):
+        self.batchOf[order.id] = batch
+        self.openDropoffs.move(order.id, order.dropoff)
+        self.assignments += 1
+
+    def _close(self, batch: Batch):
+        for order in batch.orders:
+            self.openDropoffs.remove(order.id)
+
+    def _unwait(self, orderId):
+        self.waitingPickups.remove(orderId)
+        return self.waiting.pop(orderId)
+
+    def _idle(self, runner: Runner):
+        for _, orderId in self.waitingPickups.nearest(runner.position):
+            self._start(runner, self._unwait(orderId))
+            return
+        self.idleRunners.move(runner.id, runner.position)
+
+    def runner(self, runnerId):
+        runner = self.runners[runnerId]
+        return {"id": runnerId, "position": list(runner.position),
+                "batch": runner.batch.describe() if runner.batch is not None else None}
+
+    def stats(self):
+        return {
+            "runners": len(self.runners),
+            "idleRunners": len(self.idleRunners),
+            "waitingOrders": len(self.waiting),
+            "openDropoffs": len(self.openDropoffs),
+            "assignments": self.assignments,
+            "batchedAssignments": self.batchedAssignments,
+            "reassignments": self.reassignments,
+            "delivered": self.delivered,
+        }
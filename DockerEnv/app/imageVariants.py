@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# name -> (longest edge in pixels, Pillow format, extension)
+VARIANTS = {
+    "thumbnail": (160, "JPEG", ".jpg"),
+    "medium": (640, "JPEG", ".jpg"),
+    "webp": (640, "WEBP", ".webp"),
+}
+
+
+def variantFilename(imageName: str, variant: str) -> str:
+    stem, _ = os.path.splitext(imageName)
+    return f"{stem}_{variant}{VARIANTS[variant][2]}"
+
+
+def generateVariants(directory: str, imageName: str) -> dict:
+    # Runs in a worker process. Source images are content-addressed, so variants that
+    # already exist on disk were produced from identical bytes and are reused as-is.
+    from PIL import Image, ImageOps
+
+    variants = {}
+    with Image.open(os.path.join(directory, imageName)) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ("RGB", "L"):
+            source = source.convert("RGB")
+        for variant, (edge, imageFormat, _) in VARIANTS.items():
+            filename = variantFilename(imageName, variant)
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                resized = source.copy()
+                resized.thumbnail((edge, edge), Image.LANCZOS)
+                # Unique per job: two uploads of one image render the same variant at the same time,
+                # and each rename then atomically puts identical bytes in place
+                tempPath = f"{path}.{uuid.uuid4().hex}.tmp"
+                try:
+                    resized.save(tempPath, imageFormat, quality=82, optimize=True)
+                    os.replace(tempPath, path)
+                except BaseException:
+                    if os.path.exists(tempPath):
+                        os.remove(tempPath)
+                    raise
+            variants[variant] = f"/static/{filename}"
+    return variants
+
+
+class ImageProcessor:
+    def __init__(self, directory: str, workers: int):
+        self.directory = directory
+        self.workers = workers
+        self.executor = None
+        self.tasks = set()
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def stop(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def submit(self, imageName: str, onReady):
+        # Resizing happens in the process pool; onReady(variants) records the result afterwards
+        if self.executor is None:
+            return
+        task = asyncio.create_task(self._process(imageName, onReady))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _process(self, imageName: str, onReady):
+        loop = asyncio.get_running_loop()
+        try:
+            variants = await loop.run_in_executor(self.executor, generateVariants, self.directory, imageName)
+            await onReady(variants)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("Could not generate image variants for %s", imageName)
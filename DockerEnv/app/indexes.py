@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+import constants as constants
+
+logger = logging.getLogger(__name__)
+
+# Every collection the API queries, with the indexes its lookups rely on
+INDEXES = {
+    constants.RestaurantCollectionName: [
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+    constants.RestaurantMenuCollectionName: [
+        IndexModel([("restaurantName", ASCENDING), ("name", ASCENDING)], name="restaurantName_name_unique", unique=True),
+        IndexModel([("restaurantName", ASCENDING), ("_id", ASCENDING)], name="restaurantName_id"),
+        # Menu filters: equality on restaurantName and menu_type, then price as the range and sort key
+        IndexModel([("restaurantName", ASCENDING), ("menu_type", ASCENDING), ("_id", ASCENDING)], name="restaurantName_menu_type_id"),
+        IndexModel([("restaurantName", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)], name="restaurantName_price_id"),
+        IndexModel([("restaurantName", ASCENDING), ("menu_type", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)],
+                   name="restaurantName_menu_type_price_id"),
+    ],
+    constants.RatingsCollectionName: [
+        IndexModel([("restaurantName", ASCENDING)], name="restaurantName_unique", unique=True),
+    ],
+    constants.UsersCollectionName: [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    constants.OrdersCollectionName: [
+        # Makes a retried order a duplicate key error instead of a second order
+        IndexModel([("idempotencyKey", ASCENDING)], name="idempotencyKey_unique", unique=True),
+    ],
+}
+
+# Query shapes issued by the route handlers: (label, collection, filter, sort)
+QUERY_SHAPES = [
+    ("searchRestaurantByName", constants.RestaurantCollectionName, {"name": "x"}, None),
+    ("deleteRestaurant", constants.RestaurantCollectionName, {"name": "x"}, None),
+    ("listRestaurantItems", constants.RestaurantMenuCollectionName, {"restaurantName": "x"}, [("_id", ASCENDING)]),
+    ("listRestaurantItems menu_type", constants.RestaurantMenuCollectionName, {"restaurantName": "x", "menu_type": "Veg"}, [("_id", ASCENDING)]),
+    ("listRestaurantItems sort=price", constants.RestaurantMenuCollectionName,
+     {"restaurantName": "x", "price": {"$gte": 0, "$lte": 100}}, [("price", ASCENDING), ("_id", ASCENDING)]),
+    ("listRestaurantItems menu_type sort=-price", constants.RestaurantMenuCollectionName,
+     {"restaurantName": "x", "menu_type": "Veg"}, [("price", DESCENDING), ("_id", DESCENDING)]),
+    ("delete_menu_item_from_restaurant_by_name", constants.RestaurantMenuCollectionName, {"restaurantName": "x", "name": "y"}, None),
+    ("addNewRating", constants.RatingsCollectionName, {"restaurantName": "x"}, None),
+    ("fetch_avgratings", constants.RatingsCollectionName, {"restaurantName": "x"}, None),
+    ("addUser", constants.UsersCollectionName, {"email": "x"}, None),
+    ("placeOrder prices", constants.RestaurantMenuCollectionName, {"restaurantName": "x", "name": {"$in": ["y"]}}, None),
+    ("placeOrder replay", constants.OrdersCollectionName, {"idempotencyKey": "x"}, None),
+]
+
+
+async def ensureIndexes(db):
+    # create_indexes is a no-op for indexes that already exist with the same definition
+    for collectionName, indexes in INDEXES.items():
+        try:
+            await db[collectionName].create_indexes(indexes)
+        except OperationFailure as exc:
+            # Existing duplicates block a unique index; keep serving and report it
+            logger.error("Could not create indexes on %s: %s", collectionName, exc)
+
+
+def _planStages(plan):
+    stages = [plan]
+    if "inputStage" in plan:
+        stages += _planStages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _planStages(child)
+    return stages
+
+
+async def explainQueryShapes(db):
+    report = []
+    for label, collectionName, query, sort in QUERY_SHAPES:
+        cursor = db[collectionName].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _planStages(explain["queryPlanner"]["winningPlan"])
+        report.append({
+            "query": label,
+            "collection": collectionName,
+            "filter": list(query),
+            "stages": [stage["stage"] for stage in stages],
+            "indexes": [stage["indexName"] for stage in stages if "indexName" in stage],
+            "collectionScan": any(stage["stage"] == "COLLSCAN" for stage in stages),
+        })
+    return report
+
+
+async def main():
+    import motor.motor_asyncio
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(constants.MONGODB_URL)
+    db = client[constants.DataBaseName]
+    await ensureIndexes(db)
+    for row in await explainQueryShapes(db):
+        used = ", ".join(row["indexes"]) or "COLLSCAN"
+        print(f"{row['collection']:<12} {row['query']:<42} {used}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
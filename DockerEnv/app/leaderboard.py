@@ -0,0 +1,86 @@
+import bisect
+import heapq
+from itertools import islice
+
+
+class Leaderboard:
+    # Rated restaurants ordered by Bayesian average: every restaurant counts priorWeight
+    # extra ratings of priorMean, so a single 5 doesn't outrank a hundred 4.8s. One sorted
+    # list of (-score, name) per restaurant type; a new rating moves one entry, found by
+    # bisection, and the top k are the first k entries (merged across types when unfiltered).
+    def __init__(self, priorMean: float, priorWeight: float):
+        self.priorMean = priorMean
+        self.priorWeight = priorWeight
+        self.types = {}
+        self.totals = {}
+        self.ranked = {}
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def rebuild(self, restaurants, ratings):
+        self.__init__(self.priorMean, self.priorWeight)
+        self.types = {restaurant["name"]: restaurant.get("restaurant_type") for restaurant in restaurants}
+        self.refresh(ratings)
+
+    def refresh(self, ratings):
+        # Replaces every total, e.g. with what other workers have written since startup
+        self.totals = {rating["restaurantName"]: (rating["ratingSum"], rating["numRatings"]) for rating in ratings}
+        self.ranked = {}
+        self.entries = {}
+        for name, restaurantType in self.types.items():
+            totals = self.totals.get(name)
+            if restaurantType is not None and totals is not None and totals[1]:
+                key = (-self.score(*totals), name)
+                self.ranked.setdefault(restaurantType, []).append(key)
+                self.entries[name] = (restaurantType, key)
+        for ranked in self.ranked.values():
+            ranked.sort()
+
+    def addRestaurant(self, name: str, restaurantType: str):
+        self.types[name] = restaurantType
+        self._place(name)
+
+    def removeRestaurant(self, name: str):
+        self.types.pop(name, None)
+        self._place(name)
+
+    def update(self, name: str, ratingSum: float, numRatings: int):
+        # Totals, not a delta: they come back from MongoDB with writes from every worker included
+        self.totals[name] = (ratingSum, numRatings)
+        self._place(name)
+
+    def score(self, ratingSum: float, numRatings: int) -> float:
+        return (self.priorMean * self.priorWeight + ratingSum) / (self.priorWeight + numRatings)
+
+    def top(self, k: int, restaurantType: str = None) -> list:
+        if restaurantType is not None:
+            keys = self.ranked.get(restaurantType, [])[:k]
+        else:
+            keys = islice(heapq.merge(*self.ranked.values()), k)
+        leaders = []
+        for negativeScore, name in keys:
+            ratingSum, numRatings = self.totals[name]
+            leaders.append({
+                "name": name,
+                "restaurant_type": self.types[name],
+                "score": -negativeScore,
+                "avgRating": ratingSum / numRatings,
+                "numRatings": numRatings,
+            })
+        return leaders
+
+    def _place(self, name: str):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            ranked = self.ranked[entry[0]]
+            del ranked[bisect.bisect_left(ranked, entry[1])]
+        restaurantType = self.types.get(name)
+        totals = self.totals.get(name)
+        # Unrated restaurants have no average to rank by and stay off the board
+        if restaurantType is None or totals is None or not totals[1]:
+            return
+        key = (-self.score(*totals), name)
+        bisect.insort(self.ranked.setdefault(restaurantType, []), key)
+        self.entries[name] = (restaurantType, key)
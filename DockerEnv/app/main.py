@@ -1,25 +1,225 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
+import asyncio
+import hashlib
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from functools import partial
+import zipfile
 from datetime import datetime
 from enum import Enum
-from fastapi import FastAPI, Body, Form, File, HTTPException, status, UploadFile, Query
-from fastapi.responses import Response, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from zoneinfo import ZoneInfo
+from fastapi import FastAPI, Body, Form, File, Header, HTTPException, status, UploadFile, Query, Request, WebSocket
+from fastapi.responses import Response, RedirectResponse, ORJSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from pydantic import ConfigDict, BaseModel, Field
 from pydantic.functional_validators import BeforeValidator
-import aiofiles
 from fastapi.middleware.cors import CORSMiddleware
 
 from typing_extensions import Annotated
 
-import motor.motor_asyncio
+import orjson
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import constants as constants
+from cache import ResponseCache
+from singleFlight import SingleFlight
+from pagination import NDJSON_MEDIA_TYPE, wantsNdjson, keysetCursor, fetchPage, ndjsonResponse, parseCursor, decodeCursor, encodeCursor
+from indexes import ensureIndexes, explainQueryShapes
+from search import SearchIndex
+from ratingBuffer import RatingBuffer
+from orders import OrderQueue, OrderQueueFull
+from dispatch import DispatchEngine, Order
+from pushHub import PushHub
+from admission import AdmissionControl, AdmissionMiddleware, LoopLag, TokenBuckets
+from uploads import saveUpload
+from bulkImport import ImageArchive, detectFormat, readRows, importRows
+from imageVariants import ImageProcessor
+from staticAssets import AssetCache, AssetFiles
+from openingHours import OpeningHoursIndex
+from leaderboard import Leaderboard
+from mongo import createClient, warmPool, PoolState, probeRouter
+from catalogSnapshot import SnapshotStore, SnapshotLoader, snapshotResponse, listingBody, ndjsonBody
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, Counter, Gauge, Histogram, CallbackGauge, MetricsMiddleware, CommandMetrics, PoolMetrics, residentBytes
 
-client = motor.motor_asyncio.AsyncIOMotorClient(constants.MONGODB_URL)
-db = client[constants.DataBaseName]
+metricsRegistry = Registry()
+requestLatency = metricsRegistry.register(Histogram("http_request_duration_seconds", "Time from request start to the last response byte", ("method", "route", "status")))
+requestsInFlight = metricsRegistry.register(Gauge("http_requests_in_flight", "Requests currently being handled", ("method",)))
+mongoCommandDuration = metricsRegistry.register(Histogram("mongodb_command_duration_seconds", "MongoDB command round trip time", ("collection", "command")))
+mongoCommandFailures = metricsRegistry.register(Counter("mongodb_command_failures_total", "MongoDB commands that returned an error", ("collection", "command")))
+mongoCheckoutWait = metricsRegistry.register(Histogram("mongodb_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ("address", "outcome")))
+mongoConnections = metricsRegistry.register(Gauge("mongodb_pool_connections", "Open connections per server", ("address",)))
+staticBytesServed = metricsRegistry.register(Counter("static_bytes_served_total", "Bytes of /static bodies sent, by how they were sent", ("source",)))
+poolState = PoolState()
+mongoListeners = [poolState]
+if constants.MetricsEnabled:
+    mongoListeners += [CommandMetrics(mongoCommandDuration, mongoCommandFailures), PoolMetrics(mongoCheckoutWait, mongoConnections)]
+
+# Opened by the lifespan (or openMongo() in scripts); set beforehand to run against another client
+client = None
+db = None
+lifecycle = "starting"
+responseCache = ResponseCache(constants.ResponseCacheMaxEntries, constants.ResponseCacheMaxBytes, constants.ResponseCacheMaxAgeSeconds)
+singleFlight = SingleFlight(constants.SingleFlightTtlSeconds, constants.SingleFlightMaxEntries)
+searchIndex = SearchIndex()
+openingHours = OpeningHoursIndex()
+campusZone = ZoneInfo(constants.CampusTimezone)
+leaderboard = Leaderboard(constants.LeaderboardPriorMean, constants.LeaderboardPriorWeight)
+ratingBuffer = None
+orderQueue = None
+# Topic subscriptions of the /ws clients connected to this worker
+pushHub = PushHub(constants.PushMaxConnections, constants.PushMaxPending, constants.PushMaxTopics)
+# Runner positions and open batches live in this worker's memory
+dispatchEngine = DispatchEngine(constants.DispatchCellMetres, constants.DispatchBatchRadiusMetres, constants.DispatchCapacity, constants.DispatchRebalanceGainMetres)
+# Set in the lifespan when CATALOG_SNAPSHOT is on; reads are then served from the shared snapshot
+catalog = None
+imageProcessor = ImageProcessor(constants.StaticDirectory, constants.ImageWorkers)
+staticCache = AssetCache(constants.StaticCacheMaxBytes, constants.StaticCacheMaxFileBytes)
 PyObjectId = Annotated[str, BeforeValidator(str)]
+logger = logging.getLogger(__name__)
+
+def openMongo():
+    global client, db
+    if client is None:
+        client = createClient(mongoListeners)
+        db = client[constants.DataBaseName]
+    return db
+
+def currentCatalog():
+    return catalog.store.current() if catalog is not None else None
+
+def catalogChanged():
+    # Tells the loader (possibly in another worker) that the snapshot needs rebuilding
+    if catalog is not None:
+        catalog.store.markDirty()
+
+def invalidateReads(*prefix):
+    responseCache.invalidate(*prefix)
+    singleFlight.invalidate(*prefix)
+
+def ratingsFlushed():
+    singleFlight.invalidate("ratings")
+    catalogChanged()
+
+def publishChange(event, restaurantName=None):
+    # Catalog subscribers see every change; a restaurant's subscribers only its own
+    pushHub.publish("catalog", event)
+    if restaurantName is not None:
+        pushHub.publish(f"restaurant:{restaurantName}", event)
+
+def cursorId(after):
+    cursor = parseCursor(after)
+    return cursor.binary if cursor is not None else None
+
+def catalogRecords(restaurants, menuItems, ratings):
+    # Runs in a worker thread: serializes every record once, in the shape the endpoints return
+    restaurantRecords = [(restaurant['_id'], restaurant['name'], serializeRestaurant(restaurant)) for restaurant in restaurants]
+    menus = {}
+    for menu in menuItems:
+        menuId = menu['_id']
+        menus.setdefault(menu['restaurantName'], []).append((menuId, menu['menu_type'], menu['price'], serializeMenu(menu)))
+    return restaurantRecords, menus, {rating['restaurantName']: [rating['ratingSum'], rating['numRatings']] for rating in ratings}
+
+async def loadCatalog():
+    restaurants, menuItems, ratings = await asyncio.gather(
+        db[constants.RestaurantCollectionName].find({}, RESTAURANT_FIELDS).sort("_id", 1).to_list(None),
+        db[constants.RestaurantMenuCollectionName].find({}, MENU_FIELDS).sort("_id", 1).to_list(None),
+        db[constants.RatingsCollectionName].find({}, {"_id": 0, "restaurantName": 1, "ratingSum": 1, "numRatings": 1}).to_list(None),
+    )
+    return await asyncio.to_thread(catalogRecords, restaurants, menuItems, ratings)
+
+async def indexSources():
+    restaurants = await db[constants.RestaurantCollectionName].find(
+        {}, {"name": 1, "restaurant_type": 1, "opening_time": 1, "closing_time": 1, "openingMinute": 1, "closingMinute": 1}).to_list(None)
+    menuItems = await db[constants.RestaurantMenuCollectionName].find({}, {"restaurantName": 1, "name": 1, "description": 1}).to_list(None)
+    return restaurants, menuItems
+
+def buildIndexes(restaurants, menuItems):
+    index = SearchIndex()
+    index.rebuild(restaurants, menuItems)
+    hours = OpeningHoursIndex()
+    hours.rebuild(restaurants)
+    return index, hours
+
+async def refreshIndexes():
+    # Built in a thread and swapped in whole, so requests keep using the previous index meanwhile
+    global searchIndex, openingHours
+    while True:
+        await asyncio.sleep(constants.IndexRefreshSeconds)
+        try:
+            restaurants, menuItems = await indexSources()
+            searchIndex, openingHours = await asyncio.to_thread(buildIndexes, restaurants, menuItems)
+        except Exception:
+            logger.exception("Refreshing the in-memory indexes failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global lifecycle
+    openMongo()
+    await warmPool(client, constants.MongoWarmConnections)
+    await ensureIndexes(db)
+    await migrateLegacyRatings(db[constants.RatingsCollectionName])
+    await migrateRestaurantTimes(db[constants.RestaurantCollectionName])
+    restaurants, menuItems = await indexSources()
+    searchIndex.rebuild(restaurants, menuItems)
+    openingHours.rebuild(restaurants)
+    leaderboard.rebuild(restaurants, await ratingTotals())
+    imageProcessor.start()
+    if constants.RatingWriteBehind:
+        # Created inside the running loop so its asyncio primitives bind to it
+        global ratingBuffer
+        ratingBuffer = RatingBuffer(db[constants.RatingsCollectionName], constants.RatingFlushIntervalSeconds, constants.RatingFlushThreshold, ratingsFlushed)
+        ratingBuffer.start()
+    global orderQueue
+    orderQueue = OrderQueue(db[constants.OrdersCollectionName], constants.OrderQueueMaxSize, constants.OrderBatchSize, constants.OrderWriters)
+    orderQueue.start()
+    if constants.CatalogSnapshot:
+        global catalog
+        catalog = SnapshotLoader(SnapshotStore(constants.CatalogSnapshotDirectory, constants.CatalogSnapshotCheckSeconds),
+                                 loadCatalog, constants.CatalogSnapshotRefreshSeconds, constants.CatalogSnapshotMaxAgeSeconds)
+        await catalog.start(constants.CatalogSnapshotWaitSeconds)
+    rebalancer = asyncio.create_task(rebalanceDispatch())
+    leaderboardRefresher = asyncio.create_task(refreshLeaderboard()) if constants.LeaderboardRefreshSeconds > 0 else None
+    indexRefresher = asyncio.create_task(refreshIndexes()) if constants.IndexRefreshSeconds > 0 else None
+    admission.loopLag.start()
+    lifecycle = "ready"
+    yield
+    # Fail readiness first so load balancers drain this worker before anything is torn down
+    lifecycle = "stopping"
+    await asyncio.sleep(constants.ShutdownDrainSeconds)
+    rebalancer.cancel()
+    if leaderboardRefresher is not None:
+        leaderboardRefresher.cancel()
+    if indexRefresher is not None:
+        indexRefresher.cancel()
+    admission.loopLag.stop()
+    await orderQueue.stop()
+    if ratingBuffer is not None:
+        await ratingBuffer.stop()
+    await imageProcessor.stop()
+    if catalog is not None:
+        await catalog.stop()
+    client.close()
 
 app = FastAPI(title="Restaurant API",
-    summary="FastAPI Application to add a ReST API to a MongoDB collection for restaurants.",)
+    summary="FastAPI Application to add a ReST API to a MongoDB collection for restaurants.",
+    lifespan=lifespan,)
+
+
+@app.exception_handler(RequestValidationError)
+async def validationError(request: Request, exc: RequestValidationError):
+    # orjson writes the rejected input as null when it is inf or nan; the stock handler can't encode those at all
+    return ORJSONResponse({"detail": jsonable_encoder(exc.errors())}, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+admission = AdmissionControl(app.router.routes, constants.AdmissionClasses,
+                             TokenBuckets(constants.AdmissionClientRate, constants.AdmissionClientBurst, constants.AdmissionMaxClients) if constants.AdmissionClientRate > 0 else None,
+                             LoopLag(constants.AdmissionLagIntervalSeconds), constants.AdmissionRetryAfterSeconds, constants.AdmissionClientHeader)
+if constants.AdmissionEnabled:
+    # Added first so it runs inside CORS: refusals still carry the CORS headers browsers need
+    app.add_middleware(AdmissionMiddleware, control=admission, exempt=("/healthz", "/readyz", "/metrics", "/static", "/admission"))
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,7 +229,36 @@ app.add_middleware(
     allow_headers=["*"],  # Set this to the HTTP headers you want to allow
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+if constants.MetricsEnabled:
+    app.add_middleware(MetricsMiddleware, latency=requestLatency, inFlight=requestsInFlight, mounts=("/static",))
+
+app.mount("/static", AssetFiles(directory=constants.StaticDirectory, cache=staticCache, bytesServed=staticBytesServed), name="static")
+
+metricsRegistry.register(CallbackGauge("static_cache_lookups_total", "Static file cache lookups", lambda: {("hit",): staticCache.hits, ("miss",): staticCache.misses}, ("result",), kind="counter"))
+metricsRegistry.register(CallbackGauge("static_cache_bytes", "Bytes held by the static file cache", lambda: {(): staticCache.totalBytes}))
+metricsRegistry.register(CallbackGauge("response_cache_lookups_total", "Listing cache lookups", lambda: {("hit",): responseCache.hits, ("miss",): responseCache.misses}, ("result",), kind="counter"))
+metricsRegistry.register(CallbackGauge("orders_queued", "Orders waiting to be written", lambda: {(): orderQueue.queue.qsize() if orderQueue is not None else 0}))
+metricsRegistry.register(CallbackGauge("orders_rejected_total", "Orders refused because the queue was full", lambda: {(): orderQueue.rejected if orderQueue is not None else 0}, kind="counter"))
+metricsRegistry.register(CallbackGauge("rating_buffer_pending_ratings", "Ratings buffered for the next write-behind flush", lambda: {(): ratingBuffer.pendingRatings if ratingBuffer is not None else 0}))
+metricsRegistry.register(CallbackGauge("rating_buffer_pending_restaurants", "Restaurants with buffered ratings", lambda: {(): len(ratingBuffer.pending) if ratingBuffer is not None else 0}))
+metricsRegistry.register(CallbackGauge("rating_buffer_flush_errors_total", "Write-behind rating flushes that failed and were kept for a retry", lambda: {(): ratingBuffer.flushErrors if ratingBuffer is not None else 0}, kind="counter"))
+metricsRegistry.register(CallbackGauge("dispatch_waiting_orders", "Ready orders with no runner yet", lambda: {(): len(dispatchEngine.waiting)}))
+metricsRegistry.register(CallbackGauge("dispatch_idle_runners", "Runners waiting for an order", lambda: {(): len(dispatchEngine.idleRunners)}))
+metricsRegistry.register(CallbackGauge("push_connections", "Open /ws connections", lambda: {(): len(pushHub.subscribers)}))
+metricsRegistry.register(CallbackGauge("push_slow_consumers_total", "/ws clients disconnected for falling behind", lambda: {(): pushHub.slowConsumers}, kind="counter"))
+metricsRegistry.register(CallbackGauge("process_resident_memory_bytes", "Resident memory of this worker", lambda: {(): residentBytes()}))
+metricsRegistry.register(CallbackGauge("admission_shed_total", "Requests refused by admission control", lambda: {
+    (*route, reason): count for route, limit in admission.limits.items()
+    for reason, count in (("queueFull", limit.queueFull), ("queueTimeout", limit.timedOut))} | {
+    (*route, "throttled"): count for route, count in admission.throttled.items()} | {
+    (*route, "loopLagged"): count for route, count in admission.lagged.items()}, ("method", "route", "reason"), kind="counter"))
+metricsRegistry.register(CallbackGauge("event_loop_lag_seconds", "How late the event loop runs scheduled callbacks (smoothed)", lambda: {(): admission.loopLag.lag}))
+metricsRegistry.register(CallbackGauge("admission_waiting", "Requests waiting for a concurrency slot", lambda: {
+    route: len(limit.waiters) for route, limit in admission.limits.items()}, ("method", "route")))
+metricsRegistry.register(CallbackGauge("single_flight_lookups_total", "Restaurant, menu and rating lookups by how they were answered", lambda: {
+    ("hit",): singleFlight.hits, ("coalesced",): singleFlight.coalesced, ("fetch",): singleFlight.fetches}, ("result",), kind="counter"))
+metricsRegistry.register(CallbackGauge("leaderboard_restaurants", "Rated restaurants on the /restaurants/top leaderboard", lambda: {(): len(leaderboard)}))
+metricsRegistry.register(CallbackGauge("response_cache_bytes", "Bytes held by the listing cache", lambda: {(): responseCache.totalBytes}))
 
 #Restaurant type
 class RestaurantTypeEnum(str, Enum):
@@ -38,6 +267,7 @@ class RestaurantTypeEnum(str, Enum):
     BOTH = "Both"
 
 class RestaurantModel(BaseModel):
+    id: Optional[PyObjectId] = None
     name: str
     phone_number: str
     restaurant_type: RestaurantTypeEnum
@@ -45,6 +275,8 @@ class RestaurantModel(BaseModel):
     closing_time: str = Field(..., description="Save Closing Time")
     rating: Optional[float] = Field(default=0.0, ge=0, le=5, description="Rating should be between 0 and 5")
     imageUrl: str
+    imageVariants: Optional[Dict[str, str]] = Field(default=None, description="Resized image URLs (thumbnail, medium, webp) once generated")
+    location: Optional[List[float]] = Field(default=None, description="Pickup point [x, y] in campus metres, used by dispatch")
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True
@@ -60,11 +292,76 @@ class RestaurantResponseModel(BaseModel):
 
 class RestaurantListing(BaseModel):
     restaurants: List[RestaurantModel]
+    nextCursor: Optional[str] = None
+
+# Only the fields RestaurantModel returns are read back, so listings can be dumped with
+# orjson as-is instead of being validated and serialized again by FastAPI
+RESTAURANT_FIELDS = {field: 1 for field in RestaurantModel.model_fields if field != "id"}
+
+# Times are stored display-ready ("09:00 AM") next to their minute of the day (540)
+def parseTime(value):
+    parsed = datetime.strptime(value, '%I:%M %p')
+    return parsed.strftime('%I:%M %p'), parsed.hour * 60 + parsed.minute
+
+async def migrateRestaurantTimes(restaurantCollection):
+    # Restaurants written before the display strings existed stored 1900-01-01 datetimes
+    requests = []
+    async for restaurant in restaurantCollection.find({"opening_time": {"$type": "date"}}, {"opening_time": 1, "closing_time": 1}):
+        opening, closing = restaurant['opening_time'], restaurant['closing_time']
+        requests.append(UpdateOne({"_id": restaurant['_id']}, {"$set": {
+            "opening_time": opening.strftime('%I:%M %p'),
+            "closing_time": closing.strftime('%I:%M %p'),
+            "openingMinute": opening.hour * 60 + opening.minute,
+            "closingMinute": closing.hour * 60 + closing.minute,
+        }}))
+    if requests:
+        await restaurantCollection.bulk_write(requests, ordered=False)
+
+def formatRestaurant(restaurant):
+    restaurant['id'] = str(restaurant.pop('_id'))
+    restaurant.setdefault('imageVariants', None)
+    restaurant.setdefault('location', None)
+    return restaurant
+
+async def recordImageVariants(collectionName, documentId, cacheKey, variants):
+    await db[collectionName].update_one({"_id": documentId}, {"$set": {"imageVariants": variants}})
+    invalidateReads(*cacheKey)
+    catalogChanged()
+
+def serializeRestaurant(restaurant):
+    return orjson.dumps(formatRestaurant(restaurant))
 
 @app.get("/")
 def read_root():
     return RedirectResponse("/docs")
 
+def snapshotPending():
+    return "waiting for catalog snapshot" if catalog is not None and currentCatalog() is None else None
+
+app.include_router(probeRouter(lambda: (lifecycle, client), poolState, snapshotPending))
+
+@app.get("/metrics", response_description="Prometheus metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=metricsRegistry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/reads/coalescing", response_description="Single-flight lookups in this worker: calls, cache hits, coalesced waiters and queries sent")
+async def readCoalescingStats():
+    return singleFlight.stats()
+
+@app.get("/admission/stats", response_description="Per-route concurrency, queueing and shed counts in this worker")
+async def admissionStats():
+    return admission.stats()
+
+@app.get("/catalog/snapshot", response_description="Shared catalog snapshot version and loader state")
+async def catalogSnapshotStats():
+    if catalog is None:
+        return {"enabled": False}
+    return {"enabled": True, **catalog.stats()}
+
+@app.get("/indexes/explain", response_description="Index used by each query shape")
+async def explainIndexes():
+    return {"queries": await explainQueryShapes(db)}
+
 @app.post("/restaurants/",
           response_description="Add new restaurant",
           response_model=RestaurantModel,
@@ -77,8 +374,16 @@ async def addRestaurant(name: str = Form(...),
     opening_time: str = Form(...),
     closing_time: str = Form(...),
     rating: Optional[float] = Form(None),
+    location_x: Optional[float] = Form(None, ge=-constants.CampusExtentMetres, le=constants.CampusExtentMetres, allow_inf_nan=False, description="Pickup point in campus metres"),
+    location_y: Optional[float] = Form(None, ge=-constants.CampusExtentMetres, le=constants.CampusExtentMetres, allow_inf_nan=False),
     image: UploadFile = File(...),):
     restaurantCollection = db[constants.RestaurantCollectionName]
+    try:
+        opening_time, openingMinute = parseTime(opening_time)
+        closing_time, closingMinute = parseTime(closing_time)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Times must look like 09:30 AM")
+    imageName = await saveUpload(image, constants.StaticDirectory, constants.UploadChunkSize, constants.UploadMaxBytes)
     restaurant = RestaurantModel(
         name=name,
         phone_number=phone_number,
@@ -86,18 +391,25 @@ async def addRestaurant(name: str = Form(...),
         opening_time=opening_time,
         closing_time=closing_time,
         rating=rating,
-        imageUrl=f"/static/{name}.jpg",
+        imageUrl=f"/static/{imageName}",
+        location=[location_x, location_y] if location_x is not None and location_y is not None else None,
     )
-    async with aiofiles.open(f"static/{restaurant.name}.jpg", "wb") as out_file:
-        while content := await image.read(1024):  # async read chunk
-            await out_file.write(content)
-    restaurant.opening_time = datetime.strptime(restaurant.opening_time, '%I:%M %p')
-    restaurant.closing_time = datetime.strptime(restaurant.closing_time, '%I:%M %p')
-    newRestaurant = await restaurantCollection.insert_one(restaurant.model_dump(by_alias=True, exclude=["id"]))
-    response = await restaurantCollection.find_one({"_id": newRestaurant.inserted_id})
-    response['opening_time'] = response['opening_time'].strftime('%I:%M %p')
-    response['closing_time'] = response['closing_time'].strftime('%I:%M %p')
-    return response
+    document = restaurant.model_dump(by_alias=True, exclude=["id", "imageVariants"])
+    document['openingMinute'] = openingMinute
+    document['closingMinute'] = closingMinute
+    try:
+        newRestaurant = await restaurantCollection.insert_one(document)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Restaurant {name} already exists")
+    invalidateReads("restaurants")
+    catalogChanged()
+    publishChange({"type": "restaurantAdded", "restaurantName": restaurant.name})
+    searchIndex.addRestaurant(restaurant.name)
+    openingHours.add(restaurant.name, openingMinute, closingMinute, opening_time, closing_time)
+    leaderboard.addRestaurant(restaurant.name, restaurant_type.value)
+    imageProcessor.submit(imageName, partial(recordImageVariants, constants.RestaurantCollectionName, newRestaurant.inserted_id, ("restaurants",)))
+    # insert_one added the _id, so the stored document is returned without reading it back
+    return formatRestaurant(document)
 
 @app.get(
     "/restaurants/",
@@ -105,13 +417,72 @@ async def addRestaurant(name: str = Form(...),
     response_model=RestaurantListing,
     response_model_by_alias=False,
 )
-async def listRestaurants():
+async def listRestaurants(request: Request,
+    after: Optional[str] = Query(None, description="Return restaurants after this cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=constants.MaxPageSize, description="Page size")):
+    if (snapshot := currentCatalog()) is not None:
+        afterId = cursorId(after)
+        if wantsNdjson(request):
+            return snapshotResponse(request, snapshot, lambda: ndjsonBody(*snapshot.restaurantLines(afterId, limit)), NDJSON_MEDIA_TYPE)
+        return snapshotResponse(request, snapshot, lambda: listingBody(b"restaurants", *snapshot.restaurantPage(afterId, limit)))
+
     restaurantCollection = db[constants.RestaurantCollectionName]
-    restaurantListings = await restaurantCollection.find().to_list(None)
-    for restaurant in restaurantListings:
-        restaurant['opening_time'] = restaurant['opening_time'].strftime('%I:%M %p')
-        restaurant['closing_time'] = restaurant['closing_time'].strftime('%I:%M %p')
-    return RestaurantListing(restaurants=restaurantListings)
+    if wantsNdjson(request):
+        return ndjsonResponse(keysetCursor(restaurantCollection, {}, after, limit, RESTAURANT_FIELDS), serializeRestaurant, limit)
+
+    cacheKey = ("restaurants", after, limit)
+    if (cached := responseCache.get(cacheKey)) is None:
+        version = responseCache.version
+        restaurantListings, nextCursor = await fetchPage(restaurantCollection, {}, after, limit, RESTAURANT_FIELDS)
+        for restaurant in restaurantListings:
+            formatRestaurant(restaurant)
+        body = orjson.dumps({"restaurants": restaurantListings, "nextCursor": nextCursor})
+        cached = responseCache.put(cacheKey, body, version)
+    return cached.toResponse(request)
+
+class OpenRestaurant(BaseModel):
+    name: str
+    opening_time: str
+    closing_time: str
+
+class OpenRestaurantListing(BaseModel):
+    at: str
+    restaurants: List[OpenRestaurant]
+
+@app.get(
+    "/restaurants/open",
+    response_description="Restaurants open at a time of day",
+    response_model=OpenRestaurantListing,
+)
+async def listOpenRestaurants(at: Optional[str] = Query(None, pattern=r"^([01]\d|2[0-3]):[0-5]\d$", description="24-hour HH:MM, defaults to the current campus time")):
+    if at is None:
+        at = datetime.now(campusZone).strftime('%H:%M')
+    hour, minute = at.split(":")
+    return ORJSONResponse({"at": at, "restaurants": openingHours.openAt(int(hour) * 60 + int(minute))})
+
+class TopRestaurant(BaseModel):
+    name: str
+    restaurant_type: RestaurantTypeEnum
+    score: float = Field(..., description="Average rating adjusted towards the prior for restaurants with few ratings")
+    avgRating: float
+    numRatings: int
+
+class TopRestaurantListing(BaseModel):
+    restaurants: List[TopRestaurant]
+
+@app.get(
+    "/restaurants/top",
+    response_description="Best rated restaurants, ranked by Bayesian average rating",
+    response_model=TopRestaurantListing,
+)
+async def listTopRestaurants(k: int = Query(10, ge=1, le=constants.MaxPageSize, description="How many restaurants to return"),
+    restaurantType: Optional[RestaurantTypeEnum] = Query(None, alias="type", description="Only restaurants of this type")):
+    return ORJSONResponse({"restaurants": leaderboard.top(k, restaurantType.value if restaurantType is not None else None)})
+
+async def fetchRestaurantRecord(restaurantCollection, name):
+    # Serialized here so every caller sharing the result gets bytes it cannot modify
+    restaurant = await restaurantCollection.find_one({"name": name}, RESTAURANT_FIELDS)
+    return serializeRestaurant(restaurant) if restaurant is not None else None
 
 @app.get(
     "/restaurants/{name}",
@@ -122,35 +493,94 @@ async def listRestaurants():
 async def searchRestaurantByName(name: str):
     restaurantCollection = db[constants.RestaurantCollectionName]
 
-    if (restaurant := await restaurantCollection.find_one({"name": name})) is not None:
-        restaurant['opening_time'] = restaurant['opening_time'].strftime('%I:%M %p')
-        restaurant['closing_time'] = restaurant['closing_time'].strftime('%I:%M %p')
-        return restaurant
+    if (snapshot := currentCatalog()) is not None:
+        if (record := snapshot.restaurant(name)) is not None:
+            return Response(content=record, media_type="application/json")
+    elif (record := await singleFlight.do(("restaurants", "byName", name), partial(fetchRestaurantRecord, restaurantCollection, name))) is not None:
+        return Response(content=record, media_type="application/json")
     
     raise HTTPException(status_code=404, detail=f"Restaurant {name} not found")
 
+class NameBatch(BaseModel):
+    names: List[str] = Field(..., min_length=1, max_length=constants.MaxPageSize, description="Restaurant names to look up")
+
+class RestaurantBatch(BaseModel):
+    restaurants: Dict[str, RestaurantModel]
+    missing: List[str] = Field(..., description="Requested names with no restaurant")
+
+@app.post(
+    "/restaurants/batch",
+    response_description="Find several restaurants by name",
+    response_model=RestaurantBatch,
+    response_model_by_alias=False,
+)
+async def batchRestaurants(batch: NameBatch = Body(...)):
+    restaurantCollection = db[constants.RestaurantCollectionName]
+    names = list(dict.fromkeys(batch.names))
+    if (snapshot := currentCatalog()) is not None:
+        records = {name: record for name in names if (record := snapshot.restaurant(name)) is not None}
+        body = (b'{"restaurants":{' + b",".join(orjson.dumps(name) + b":" + record for name, record in records.items())
+                + b'},"missing":' + orjson.dumps([name for name in names if name not in records]) + b"}")
+        return Response(content=body, media_type="application/json")
+    found = {}
+    async for restaurant in restaurantCollection.find({"name": {"$in": names}}, RESTAURANT_FIELDS):
+        found[restaurant['name']] = formatRestaurant(restaurant)
+    return ORJSONResponse({"restaurants": found, "missing": [name for name in names if name not in found]})
+
 @app.get(
     "/restaurants/search/",
     response_description="Search restaurants by name",
     response_model=RestaurantListing,
     response_model_by_alias=False,
 )
-async def searchRestaurantByQuery(query: str = Query(..., description="Search query")):
+async def searchRestaurantByQuery(request: Request,
+    query: str = Query(..., description="Search query"),
+    after: Optional[str] = Query(None, description="Return restaurants after this cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=constants.MaxPageSize, description="Page size")):
     restaurantCollection = db[constants.RestaurantCollectionName]
     
-    # Perform case-insensitive search using regular expression
-    search_pattern = {"name": {"$regex": query, "$options": "i"}}
-    matching_restaurants = await restaurantCollection.find(search_pattern).to_list(None)
+    # Resolve the case-insensitive substring match from the in-memory search index, then fetch by the name index
+    names = searchIndex.restaurantNames(query)
+    if (snapshot := currentCatalog()) is not None:
+        records, nextCursor = snapshot.restaurantRecords(names, cursorId(after), limit)
+        if wantsNdjson(request):
+            return Response(content=ndjsonBody(records, nextCursor), media_type=NDJSON_MEDIA_TYPE)
+        if not records and after is None:
+            raise HTTPException(status_code=404, detail=f"No restaurants found matching the query: {query}")
+        return Response(content=listingBody(b"restaurants", b",".join(records), nextCursor), media_type="application/json")
+
+    search_pattern = {"name": {"$in": names}}
+    if wantsNdjson(request):
+        return ndjsonResponse(keysetCursor(restaurantCollection, search_pattern, after, limit, RESTAURANT_FIELDS), serializeRestaurant, limit)
 
-    if not matching_restaurants:
+    matching_restaurants, nextCursor = await fetchPage(restaurantCollection, search_pattern, after, limit, RESTAURANT_FIELDS)
+
+    if not matching_restaurants and after is None:
         raise HTTPException(status_code=404, detail=f"No restaurants found matching the query: {query}")
     
-    # Convert opening_time and closing_time to string format
     for restaurant in matching_restaurants:
-        restaurant['opening_time'] = restaurant['opening_time'].strftime('%I:%M %p')
-        restaurant['closing_time'] = restaurant['closing_time'].strftime('%I:%M %p')
+        formatRestaurant(restaurant)
 
-    return RestaurantListing(restaurants=matching_restaurants)
+    return ORJSONResponse({"restaurants": matching_restaurants, "nextCursor": nextCursor})
+
+class SearchHit(BaseModel):
+    kind: str = Field(..., description="restaurant or menu")
+    name: str
+    restaurantName: str
+    score: float
+
+class SearchResults(BaseModel):
+    query: str
+    results: List[SearchHit]
+
+@app.get(
+    "/search/autocomplete",
+    response_description="Ranked restaurant and menu item suggestions",
+    response_model=SearchResults,
+)
+async def autocomplete(q: str = Query(..., min_length=2, description="Partially typed search text"),
+    limit: int = Query(10, ge=1, le=constants.AutocompleteMaxResults)):
+    return SearchResults(query=q, results=searchIndex.autocomplete(q, limit))
 
 @app.delete(
     "/restaurants/{name}",
@@ -160,6 +590,12 @@ async def deleteRestaurant(name):
     restaurantCollection = db[constants.RestaurantCollectionName]
     deleteRes = await restaurantCollection.delete_one({"name":name})
     if deleteRes.deleted_count == 1:
+        invalidateReads("restaurants")
+        catalogChanged()
+        searchIndex.removeRestaurant(name)
+        openingHours.remove(name)
+        leaderboard.removeRestaurant(name)
+        publishChange({"type": "restaurantRemoved", "restaurantName": name}, name)
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     raise HTTPException(status_code=404, detail=f"Restaurant {name} not found")
 
@@ -187,9 +623,85 @@ class MenuResponseModel(BaseModel):
     description: str
     price: int
     imageUrl: str
+    imageVariants: Optional[Dict[str, str]] = Field(default=None, description="Resized image URLs (thumbnail, medium, webp) once generated")
 
 class MenuListing(BaseModel):
     menus: List[MenuResponseModel]
+    nextCursor: Optional[str] = None
+
+MENU_FIELDS = {field: 1 for field in MenuResponseModel.model_fields if field != "id"}
+
+class MenuSortEnum(str, Enum):
+    PRICE = "price"
+    PRICE_DESC = "-price"
+
+# _id breaks price ties in the same direction, so one (restaurantName, price, _id) index serves both orders
+MENU_SORTS = {
+    MenuSortEnum.PRICE: [("price", ASCENDING), ("_id", ASCENDING)],
+    MenuSortEnum.PRICE_DESC: [("price", DESCENDING), ("_id", DESCENDING)],
+}
+
+def formatMenu(menu):
+    menu['id'] = str(menu.pop('_id'))
+    menu.setdefault('imageVariants', None)
+    return menu
+
+def menuOutput(menu, fields=None):
+    menu = formatMenu(menu)
+    return menu if fields is None else {field: menu.get(field) for field in fields}
+
+def serializeMenu(menu, fields=None):
+    return orjson.dumps(menuOutput(menu, fields))
+
+def menuFields(fields):
+    # "name,price" -> ("name", "price") in response model order; None returns every field
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(MenuResponseModel.model_fields)
+    if unknown or not requested:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"fields must be a comma-separated list of {', '.join(MenuResponseModel.model_fields)}")
+    return tuple(field for field in MenuResponseModel.model_fields if field in requested)
+
+def menuProjection(fields, sort):
+    if fields is None:
+        return MENU_FIELDS
+    # Sort keys are always fetched because the next page's cursor is built from them
+    projection = {field: 1 for field in fields if field != "id"}
+    projection.update({field: 1 for field, _ in sort or () if field != "_id"})
+    return projection or {"_id": 1}
+
+def menuFilter(name, menu_type, min_price, max_price):
+    query = {"restaurantName": name}
+    if menu_type is not None:
+        query["menu_type"] = menu_type.value
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lte"] = max_price
+    if price:
+        query["price"] = price
+    return query
+
+def snapshotMenuSelection(snapshot, name, menu_type, min_price, max_price, sort, fields, after, limit):
+    # Filtered or price-ordered menu pages from the shared snapshot, with the same cursors as the Mongo path
+    direction = sort[0][1] if sort is not None else None
+    afterKey = None
+    if after is not None and sort is None:
+        afterKey = cursorId(after)
+    elif after is not None:
+        price, afterId = decodeCursor(after, sort)
+        afterKey = (price, afterId.binary)
+    records, lastKey = snapshot.menuSelection(name, menu_type.value if menu_type is not None else None,
+                                              min_price, max_price, direction, afterKey, limit)
+    if fields is not None:
+        records = [orjson.dumps({field: menu.get(field) for field in fields}) for menu in map(orjson.loads, records)]
+    nextCursor = None
+    if lastKey is not None:
+        nextCursor = lastKey.hex() if sort is None else encodeCursor([lastKey[0], ObjectId(lastKey[1])])
+    return records, (orjson.dumps(nextCursor) if nextCursor is not None else None)
 
 @app.get("/")
 def read_root():
@@ -208,36 +720,79 @@ async def addMenuItem(name: str = Form(...),
     price: int = Form(...),
     image: UploadFile = File(...),):
     menuCollection = db[constants.RestaurantMenuCollectionName]
+    imageName = await saveUpload(image, constants.StaticDirectory, constants.UploadChunkSize, constants.UploadMaxBytes)
     menu = MenuModel(
         name=name,
         restaurantName=restaurantName,
         description=description,
         menu_type=menu_type,
         price=price,
-        imageUrl=f"/static/{restaurantName}_{name}.jpg",
+        imageUrl=f"/static/{imageName}",
     )
-    async with aiofiles.open(f"static/{menu.restaurantName}_{menu.name}.jpg", "wb") as out_file:
-        while content := await image.read(1024):  # async read chunk
-            await out_file.write(content)
-    newMenu = await menuCollection.insert_one(menu.model_dump(by_alias=True, exclude=["id"]))
-    response = await menuCollection.find_one({"_id": newMenu.inserted_id})
-    response['id'] = str(response.pop('_id'))
-    return response
+    try:
+        document = menu.model_dump(by_alias=True, exclude=["id"])
+        newMenu = await menuCollection.insert_one(document)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Menu item {name} already exists for {restaurantName}")
+    invalidateReads("menu", menu.restaurantName)
+    catalogChanged()
+    searchIndex.addMenuItem(menu.restaurantName, menu.name, menu.description)
+    publishChange({"type": "menuItemAdded", "restaurantName": menu.restaurantName, "name": menu.name,
+                   "menu_type": menu.menu_type, "price": menu.price}, menu.restaurantName)
+    imageProcessor.submit(imageName, partial(recordImageVariants, constants.RestaurantMenuCollectionName, newMenu.inserted_id, ("menu", menu.restaurantName)))
+    return formatMenu(document)
 
 @app.get(
     "/menu/{name}",
-    response_description="List all restaurant menu items",
+    response_description="List restaurant menu items, optionally filtered, sorted by price and trimmed to some fields",
     response_model=MenuListing,
     response_model_by_alias=False,
 )
-async def listRestaurantItems(name: str):
+async def listRestaurantItems(name: str, request: Request,
+    after: Optional[str] = Query(None, description="Return menu items after this cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=constants.MaxPageSize, description="Page size"),
+    menu_type: Optional[MenuTypeEnum] = Query(None, description="Only include Veg or Non-Veg items"),
+    min_price: Optional[int] = Query(None, ge=0, description="Lowest price to include"),
+    max_price: Optional[int] = Query(None, ge=0, description="Highest price to include"),
+    sort: Optional[MenuSortEnum] = Query(None, description="price or -price; defaults to the order items were added"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,name,price")):
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_price must not be greater than max_price")
+    fields = menuFields(fields)
+    sortOrder = MENU_SORTS.get(sort)
+    if (snapshot := currentCatalog()) is not None:
+        if menu_type is None and min_price is None and max_price is None and sort is None and fields is None:
+            afterId = cursorId(after)
+            if wantsNdjson(request):
+                return snapshotResponse(request, snapshot, lambda: ndjsonBody(*snapshot.menuLines(name, afterId, limit)), NDJSON_MEDIA_TYPE)
+            return snapshotResponse(request, snapshot, lambda: listingBody(b"menus", *snapshot.menuPage(name, afterId, limit)))
+        records, nextCursor = snapshotMenuSelection(snapshot, name, menu_type, min_price, max_price, sortOrder, fields, after, limit)
+        if wantsNdjson(request):
+            return snapshotResponse(request, snapshot, lambda: ndjsonBody(records, nextCursor), NDJSON_MEDIA_TYPE)
+        return snapshotResponse(request, snapshot, lambda: listingBody(b"menus", b",".join(records), nextCursor))
+
     menuCollection = db[constants.RestaurantMenuCollectionName]
-    if (menuListings := await menuCollection.find({"restaurantName": name}).to_list(None)) is not None:
-        for menu in menuListings:
-            menu['id'] = str(menu.pop('_id'))
-        return MenuListing(menus=menuListings)
-    
-    raise HTTPException(status_code=404, detail=f"Restaurant {name} not found")
+    query = menuFilter(name, menu_type, min_price, max_price)
+    projection = menuProjection(fields, sortOrder)
+    if wantsNdjson(request):
+        return ndjsonResponse(keysetCursor(menuCollection, query, after, limit, projection, sortOrder),
+                              partial(serializeMenu, fields=fields), limit, sortOrder)
+
+    cacheKey = ("menu", name, after, limit, menu_type, min_price, max_price, sort, fields)
+    if (cached := responseCache.get(cacheKey)) is None:
+        # Concurrent misses share one fill; the response cache keeps the result, so no ttl here
+        cached = await singleFlight.do(cacheKey, partial(fillMenuListing, menuCollection, query, after, limit, projection, sortOrder, fields, cacheKey), ttl=0)
+        if cached is None:
+            raise HTTPException(status_code=404, detail=f"Restaurant {name} not found")
+    return cached.toResponse(request)
+
+async def fillMenuListing(menuCollection, query, after, limit, projection, sortOrder, fields, cacheKey):
+    version = responseCache.version
+    menuListings, nextCursor = await fetchPage(menuCollection, query, after, limit, projection, sortOrder)
+    if menuListings is None:
+        return None
+    body = orjson.dumps({"menus": [menuOutput(menu, fields) for menu in menuListings], "nextCursor": nextCursor})
+    return responseCache.put(cacheKey, body, version)
 
 @app.delete("/menu/{restaurant_name}/{menu_name}",
             response_description="Delete a menu item from a restaurant by name",
@@ -248,11 +803,15 @@ async def delete_menu_item_from_restaurant_by_name(restaurant_name: str, menu_na
     delete_result = await menuCollection.delete_one({"name": menu_name, "restaurantName": restaurant_name})
     if delete_result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Menu item not found")
+    invalidateReads("menu", restaurant_name)
+    catalogChanged()
+    searchIndex.removeMenuItem(restaurant_name, menu_name)
+    publishChange({"type": "menuItemRemoved", "restaurantName": restaurant_name, "name": menu_name}, restaurant_name)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 # rating models
 class ratingModel(BaseModel):
-    rating: Optional[float] = Field(..., ge=0, le=5, description="Rating should be between 0 and 5")
+    rating: float = Field(..., ge=0, le=5, description="Rating should be between 0 and 5")
     restaurantName: str = Field(..., description="name of restaurant")
     model_config = ConfigDict(
         populate_by_name=True,
@@ -271,6 +830,45 @@ class ratingResponseModel(BaseModel):
 class ratingListing(BaseModel):
     ratings: List[ratingModel]
 
+# Ratings are stored as a running ratingSum and numRatings so that a new rating is a
+# single atomic $inc; the average is derived whenever a document is read
+def ratingResponse(restaurant_data):
+    return {
+        "avgRating": restaurant_data["ratingSum"] / restaurant_data["numRatings"],
+        "restaurantName": restaurant_data["restaurantName"],
+        # float, as ratingResponseModel declares it, whichever endpoint or event carries it
+        "numRatings": float(restaurant_data["numRatings"]),
+    }
+
+def ratingUpdated(response):
+    numRatings = int(response['numRatings'])
+    leaderboard.update(response['restaurantName'], response['avgRating'] * numRatings, numRatings)
+    pushHub.publish(f"restaurant:{response['restaurantName']}", {"type": "ratingUpdated", **response})
+    return response
+
+async def ratingTotals():
+    ratings = await db[constants.RatingsCollectionName].find({}, {"_id": 0, "restaurantName": 1, "ratingSum": 1, "numRatings": 1}).to_list(None)
+    if ratingBuffer is not None:
+        ratings = [ratingBuffer.merge(rating['restaurantName'], rating) for rating in ratings]
+    return ratings
+
+async def refreshLeaderboard():
+    while True:
+        await asyncio.sleep(constants.LeaderboardRefreshSeconds)
+        try:
+            # Restaurants too: ones added by other workers or the Database apps join the board
+            restaurants = await db[constants.RestaurantCollectionName].find({}, {"name": 1, "restaurant_type": 1}).to_list(None)
+            leaderboard.rebuild(restaurants, await ratingTotals())
+        except Exception:
+            logger.exception("Refreshing the leaderboard failed")
+
+async def migrateLegacyRatings(ratingCollection):
+    # Documents written before ratingSum existed only carry avgRating; convert them once
+    await ratingCollection.update_many(
+        {"ratingSum": {"$exists": False}},
+        [{"$set": {"ratingSum": {"$multiply": ["$avgRating", "$numRatings"]}}}, {"$unset": "avgRating"}],
+    )
+
 @app.get("/")
 def read_root():
     return RedirectResponse("/docs")
@@ -284,33 +882,33 @@ def read_root():
 async def addNewRating(rating: ratingModel = Body(...)):
     ratingCollection = db[constants.RatingsCollectionName]
 
-    restaurantCheck = await ratingCollection.find_one({"restaurantName": rating.restaurantName})
+    if ratingBuffer is not None:
+        # Write-behind: the rating is flushed later with others, so only the current totals are read
+        ratingBuffer.add(rating.restaurantName, rating.rating)
+        restaurant_data = await fetchRating(ratingCollection, rating.restaurantName)
+        return ratingUpdated(ratingResponse(ratingBuffer.merge(rating.restaurantName, restaurant_data)))
 
-    if restaurantCheck:
-        # If data already exists, update the average rating and increase the number of ratings
-        new_avg_rating = ((restaurantCheck['avgRating'] * restaurantCheck['numRatings']) + rating.avgRating) / (restaurantCheck['numRatings'] + 1)
-        updated_data = {
-            "$set": {
-                "avgRating": new_avg_rating,
-                "numRatings": restaurantCheck['numRatings'] + 1
-            }
-        }
-
-        await ratingCollection.update_one({"restaurantName": rating.restaurantName}, updated_data)
-        response_data = await ratingCollection.find_one({"restaurantName": rating.restaurantName})
+    # One round trip: creates the document on the first rating and returns the updated totals
+    response_data = await ratingCollection.find_one_and_update(
+        {"restaurantName": rating.restaurantName},
+        {"$inc": {"ratingSum": rating.rating, "numRatings": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    singleFlight.invalidate("ratings", rating.restaurantName)
+    catalogChanged()
 
-    else:
-        # If data doesn't exist, insert new data
-        new_data = {
-            "restaurantName": rating.restaurantName,
-            "avgRating": rating.rating,
-            "numRatings": 1
-        }
+    return ratingUpdated(ratingResponse(response_data))
 
-        result = await ratingCollection.insert_one(new_data)
-        response_data = await ratingCollection.find_one({"_id": result.inserted_id})
+def fetchRating(ratingCollection, name):
+    # Shared between callers: ratingBuffer.merge and ratingResponse only read it
+    return singleFlight.do(("ratings", name), partial(ratingCollection.find_one, {"restaurantName": name}))
 
-    return response_data
+@app.get("/ratings/buffer", response_description="Write-behind rating buffer depth and flush latency")
+async def ratingBufferStats():
+    if ratingBuffer is None:
+        return {"enabled": False}
+    return {"enabled": True, **ratingBuffer.stats()}
 
 @app.get(
     "/avgRating/{name}",
@@ -321,21 +919,424 @@ async def addNewRating(rating: ratingModel = Body(...)):
 async def fetch_avgratings(name: str):
     ratingCollection = db[constants.RatingsCollectionName]
 
-    restaurant_data = await ratingCollection.find_one({"restaurantName": name})
+    if (snapshot := currentCatalog()) is not None:
+        restaurant_data = snapshot.rating(name)
+    else:
+        restaurant_data = await fetchRating(ratingCollection, name)
+    if ratingBuffer is not None:
+        restaurant_data = ratingBuffer.merge(name, restaurant_data)
 
     if restaurant_data:
-        avg_rating = restaurant_data["avgRating"]
-        num_ratings = restaurant_data["numRatings"]
-
-        response_data = {
-            "avgRating": avg_rating,
-            "restaurantName": name,
-            "numRatings": num_ratings,
-        }
-
-        return response_data
+        return ratingResponse(restaurant_data)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Restaurant with name '{name}' not found",
         )
+
+class RatingBatch(BaseModel):
+    ratings: Dict[str, ratingResponseModel]
+    missing: List[str] = Field(..., description="Requested names that have not been rated")
+
+@app.post(
+    "/avgRating/batch",
+    response_description="Fetch average ratings for several restaurants",
+    response_model=RatingBatch,
+    response_model_by_alias=False,
+)
+async def batchAvgRatings(batch: NameBatch = Body(...)):
+    ratingCollection = db[constants.RatingsCollectionName]
+    names = list(dict.fromkeys(batch.names))
+    stored = {}
+    if (snapshot := currentCatalog()) is not None:
+        stored = {name: snapshot.rating(name) for name in names}
+    else:
+        async for restaurant_data in ratingCollection.find({"restaurantName": {"$in": names}}):
+            stored[restaurant_data['restaurantName']] = restaurant_data
+    found = {}
+    for name in names:
+        restaurant_data = stored.get(name)
+        if ratingBuffer is not None:
+            restaurant_data = ratingBuffer.merge(name, restaurant_data)
+        if restaurant_data:
+            found[name] = ratingResponse(restaurant_data)
+    return ORJSONResponse({"ratings": found, "missing": [name for name in names if name not in found]})
+
+class RestaurantPage(BaseModel):
+    restaurant: RestaurantModel
+    menus: List[MenuResponseModel]
+    nextCursor: Optional[str] = None
+    rating: Optional[ratingResponseModel] = Field(default=None, description="Absent until the restaurant is rated")
+
+@app.get(
+    "/restaurants/{name}/page",
+    response_description="Restaurant, its menu and its rating in one response",
+    response_model=RestaurantPage,
+    response_model_by_alias=False,
+)
+async def restaurantPage(name: str,
+    menu_type: Optional[MenuTypeEnum] = Query(None, description="Only include Veg or Non-Veg items"),
+    after: Optional[str] = Query(None, description="Return menu items after this cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=constants.MaxPageSize, description="Menu page size")):
+    if (snapshot := currentCatalog()) is not None:
+        if (record := snapshot.restaurant(name)) is None:
+            raise HTTPException(status_code=404, detail=f"Restaurant {name} not found")
+        menus, nextCursor = snapshot.menuPage(name, cursorId(after), limit, menu_type.value if menu_type is not None else None)
+        restaurant_data = snapshot.rating(name)
+        if ratingBuffer is not None:
+            restaurant_data = ratingBuffer.merge(name, restaurant_data)
+        rating = ratingResponse(restaurant_data) if restaurant_data else None
+        body = (b'{"restaurant":' + record + b',"menus":[' + menus + b'],"nextCursor":' + (nextCursor or b"null")
+                + b',"rating":' + orjson.dumps(rating) + b"}")
+        return Response(content=body, media_type="application/json")
+
+    menuQuery = {"restaurantName": name}
+    if menu_type is not None:
+        menuQuery["menu_type"] = menu_type.value
+    # The three lookups are independent, so they share one round trip's worth of latency
+    restaurant, (menuListings, nextCursor), restaurant_data = await asyncio.gather(
+        db[constants.RestaurantCollectionName].find_one({"name": name}, RESTAURANT_FIELDS),
+        fetchPage(db[constants.RestaurantMenuCollectionName], menuQuery, after, limit, MENU_FIELDS),
+        db[constants.RatingsCollectionName].find_one({"restaurantName": name}),
+    )
+    if restaurant is None:
+        raise HTTPException(status_code=404, detail=f"Restaurant {name} not found")
+    if ratingBuffer is not None:
+        restaurant_data = ratingBuffer.merge(name, restaurant_data)
+    return ORJSONResponse({
+        "restaurant": formatRestaurant(restaurant),
+        "menus": [formatMenu(menu) for menu in menuListings],
+        "nextCursor": nextCursor,
+        "rating": ratingResponse(restaurant_data) if restaurant_data else None,
+    })
+
+#Users
+class UserModel(BaseModel):
+    email: str = Field(..., pattern=r"^[^@\s]+@[^@\s]+$", description="Unique login email")
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True
+    )
+
+#Bulk import
+class BulkRowError(BaseModel):
+    row: int = Field(..., description="1-based data row in the uploaded file")
+    error: str
+
+class BulkImportReport(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+
+def importImageUrl(image, images):
+    # An "image" column names a file in the uploaded zip; without one, imageUrl is taken as given
+    if images is None:
+        raise ValueError(f"row references image {image} but no images archive was uploaded")
+    return "/static/" + images.save(image)
+
+def restaurantImportDocument(row, images):
+    # Rows are validated before their image is written, so a rejected row leaves no file behind
+    image = row.pop("image", None)
+    restaurant = RestaurantModel.model_validate({"imageUrl": "", **row} if image else row)
+    document = restaurant.model_dump(by_alias=True, exclude=["id", "imageVariants"])
+    try:
+        document['opening_time'], document['openingMinute'] = parseTime(document['opening_time'])
+        document['closing_time'], document['closingMinute'] = parseTime(document['closing_time'])
+    except ValueError:
+        raise ValueError("Times must look like 09:30 AM")
+    if image:
+        document['imageUrl'] = importImageUrl(image, images)
+    return document
+
+def menuImportDocument(row, images):
+    image = row.pop("image", None)
+    menu = MenuModel.model_validate({"imageUrl": "", **row} if image else row)
+    document = menu.model_dump(by_alias=True)
+    if image:
+        document['imageUrl'] = importImageUrl(image, images)
+    return document
+
+def userImportDocument(row, images):
+    return UserModel.model_validate(row).model_dump(by_alias=True)
+
+def uploadedImageName(document, images):
+    # Only images this import wrote from its zip get variants; a row's own imageUrl can name any path
+    imageUrl = document['imageUrl']
+    if images is None or not imageUrl.startswith("/static/"):
+        return None
+    imageName = imageUrl[len("/static/"):]
+    return imageName if imageName in images.savedFiles else None
+
+def restaurantsImported(documents, images=None):
+    if documents:
+        invalidateReads("restaurants")
+        catalogChanged()
+        # One event per chunk, so an import doesn't overflow every subscriber's queue
+        pushHub.publish("catalog", {"type": "restaurantsImported", "restaurantNames": [document['name'] for document in documents]})
+    for document in documents:
+        searchIndex.addRestaurant(document['name'])
+        openingHours.add(document['name'], document['openingMinute'], document['closingMinute'], document['opening_time'], document['closing_time'])
+        leaderboard.addRestaurant(document['name'], document['restaurant_type'])
+        if (imageName := uploadedImageName(document, images)) is not None:
+            imageProcessor.submit(imageName, partial(recordImageVariants, constants.RestaurantCollectionName, document['_id'], ("restaurants",)))
+
+def menuImported(documents, images=None):
+    imported = {}
+    for document in documents:
+        imported.setdefault(document['restaurantName'], []).append(document['name'])
+    if documents:
+        catalogChanged()
+        pushHub.publish("catalog", {"type": "menuImported", "restaurantNames": list(imported)})
+    for restaurantName, names in imported.items():
+        invalidateReads("menu", restaurantName)
+        pushHub.publish(f"restaurant:{restaurantName}", {"type": "menuImported", "restaurantName": restaurantName, "names": names})
+    for document in documents:
+        searchIndex.addMenuItem(document['restaurantName'], document['name'], document['description'])
+        if (imageName := uploadedImageName(document, images)) is not None:
+            imageProcessor.submit(imageName, partial(recordImageVariants, constants.RestaurantMenuCollectionName, document['_id'], ("menu", document['restaurantName'])))
+
+# kind -> (collection, row builder); bulkImport.py's CLI loads rows through the same builders
+bulkImporters = {
+    "restaurants": (constants.RestaurantCollectionName, restaurantImportDocument),
+    "menu": (constants.RestaurantMenuCollectionName, menuImportDocument),
+    "users": (constants.UsersCollectionName, userImportDocument),
+}
+# Keeps this worker's in-memory indexes and caches in step with each inserted chunk
+bulkImportCallbacks = {
+    "restaurants": restaurantsImported,
+    "menu": menuImported,
+    "users": None,
+}
+
+@app.post(
+    "/bulk/{kind}",
+    response_description="Import rows from a CSV or NDJSON file",
+    response_model=BulkImportReport,
+)
+async def bulkImport(kind: str,
+    file: UploadFile = File(..., description="CSV with a header row, or one JSON object per line"),
+    images: Optional[UploadFile] = File(None, description="Zip of images referenced by an 'image' column"),
+    format: Optional[str] = Form(None, description="csv or ndjson; defaults to the file extension")):
+    if kind not in bulkImporters:
+        raise HTTPException(status_code=404, detail=f"Cannot import {kind}; expected restaurants, menu or users")
+    try:
+        fileFormat = detectFormat(file.filename, format)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    archive = None
+    if images is not None:
+        try:
+            archive = ImageArchive(images.file, constants.StaticDirectory, constants.UploadMaxBytes)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="images must be a zip archive")
+    collectionName, buildDocument = bulkImporters[kind]
+    return await importRows(db[collectionName], readRows(file.file, fileFormat),
+                            partial(buildDocument, images=archive), constants.BulkImportChunkSize,
+                            partial(onImported, images=archive) if (onImported := bulkImportCallbacks[kind]) is not None else None)
+
+#Orders
+class OrderItemModel(BaseModel):
+    name: str = Field(..., description="Menu item name")
+    quantity: int = Field(..., ge=1, le=constants.OrderMaxQuantity)
+
+class PointModel(BaseModel):
+    x: float = Field(..., ge=-constants.CampusExtentMetres, le=constants.CampusExtentMetres, allow_inf_nan=False, description="Campus metres east")
+    y: float = Field(..., ge=-constants.CampusExtentMetres, le=constants.CampusExtentMetres, allow_inf_nan=False, description="Campus metres north")
+
+class OrderModel(BaseModel):
+    restaurantName: str
+    email: str = Field(..., pattern=r"^[^@\s]+@[^@\s]+$", description="Customer placing the order")
+    items: List[OrderItemModel] = Field(..., min_length=1, max_length=constants.OrderMaxItems)
+    dropoff: Optional[PointModel] = Field(default=None, description="Where to deliver; needed for runner dispatch")
+
+class OrderLineModel(BaseModel):
+    name: str
+    quantity: int
+    price: int = Field(..., description="Menu price when the order was placed")
+
+class OrderResponseModel(BaseModel):
+    id: Optional[PyObjectId] = None
+    restaurantName: str
+    email: str
+    items: List[OrderLineModel]
+    total: int
+    status: str
+    createdAt: datetime
+    dropoff: Optional[List[float]] = None
+    runnerId: Optional[str] = None
+
+def orderResponse(order, status_code=status.HTTP_200_OK, headers=None):
+    order['id'] = str(order.pop('_id'))
+    order.pop('idempotencyKey', None)
+    order.pop('requestHash', None)
+    # Stored datetimes come back naive, in UTC
+    return Response(content=orjson.dumps(order, option=orjson.OPT_NAIVE_UTC), status_code=status_code,
+                    media_type="application/json", headers=headers)
+
+@app.post(
+    "/orders/",
+    response_description="Place an order; retries with the same Idempotency-Key return the original order",
+    response_model=OrderResponseModel,
+    status_code=status.HTTP_201_CREATED,
+    response_model_by_alias=False,
+)
+async def placeOrder(order: OrderModel = Body(...),
+    idempotency_key: Optional[str] = Header(None, max_length=128, description="Client-chosen key, reused on every retry of this order")):
+    quantities = {}
+    for item in order.items:
+        quantities[item.name] = quantities.get(item.name, 0) + item.quantity
+    # Prices come from the menu, never from the client
+    prices = {}
+    async for menu in db[constants.RestaurantMenuCollectionName].find(
+            {"restaurantName": order.restaurantName, "name": {"$in": list(quantities)}}, {"_id": 0, "name": 1, "price": 1}):
+        prices[menu['name']] = menu['price']
+    if missing := [name for name in quantities if name not in prices]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Not on the menu of {order.restaurantName}: {', '.join(missing)}")
+
+    requestHash = hashlib.blake2b(orjson.dumps(order.model_dump(), option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+    key = idempotency_key or uuid.uuid4().hex
+    createdAt = datetime.utcnow()
+    items = [{"name": name, "quantity": quantity, "price": prices[name]} for name, quantity in quantities.items()]
+    document = {
+        "_id": ObjectId(),
+        "idempotencyKey": key,
+        "requestHash": requestHash,
+        "restaurantName": order.restaurantName,
+        "email": order.email,
+        "items": items,
+        "total": sum(item['quantity'] * item['price'] for item in items),
+        "status": "placed",
+        "dropoff": [order.dropoff.x, order.dropoff.y] if order.dropoff is not None else None,
+        # MongoDB keeps milliseconds, so a replay returns exactly what the first response did
+        "createdAt": createdAt.replace(microsecond=createdAt.microsecond // 1000 * 1000),
+    }
+    try:
+        created = await orderQueue.submit(document)
+    except OrderQueueFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many orders in flight, retry shortly",
+                            headers={"Retry-After": str(constants.OrderRetryAfterSeconds)})
+    if created:
+        return orderResponse(document, status.HTTP_201_CREATED)
+
+    existing = await db[constants.OrdersCollectionName].find_one({"idempotencyKey": key})
+    if existing is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="An order with this Idempotency-Key is still being placed")
+    if existing['requestHash'] != requestHash:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="This Idempotency-Key was already used for a different order")
+    return orderResponse(existing, headers={"Idempotent-Replayed": "true"})
+
+@app.get("/orders/queue", response_description="Order queue depth and group commit batch sizes")
+async def orderQueueStats():
+    return orderQueue.stats()
+
+@app.get(
+    "/orders/{order_id}",
+    response_description="Fetch an order",
+    response_model=OrderResponseModel,
+    response_model_by_alias=False,
+)
+async def getOrder(order_id: str):
+    if ObjectId.is_valid(order_id) and (order := await db[constants.OrdersCollectionName].find_one({"_id": ObjectId(order_id)})) is not None:
+        return orderResponse(order)
+    raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+
+#Dispatch
+async def rebalanceDispatch():
+    while True:
+        await asyncio.sleep(constants.DispatchRebalanceSeconds)
+        for batch in dispatchEngine.rebalance():
+            try:
+                await setOrderStatus([order.id for order in batch.orders], "assigned", batch.runner.id)
+            except Exception:
+                logger.exception("Recording a rebalanced batch for runner %s failed", batch.runner.id)
+
+def dispatchRunner(runner_id):
+    if runner_id not in dispatchEngine.runners:
+        raise HTTPException(status_code=404, detail=f"Runner {runner_id} is not on shift")
+    return dispatchEngine.runners[runner_id]
+
+async def setOrderStatus(orderIds, orderStatus, runnerId=None):
+    await db[constants.OrdersCollectionName].update_many(
+        {"_id": {"$in": [ObjectId(orderId) for orderId in orderIds]}}, {"$set": {"status": orderStatus, "runnerId": runnerId}})
+    for orderId in orderIds:
+        pushHub.publish(f"order:{orderId}", {"type": "orderStatus", "orderId": orderId, "status": orderStatus, "runnerId": runnerId})
+
+@app.get("/dispatch/stats", response_description="Runners, waiting orders and assignment counts in this worker")
+async def dispatchStats():
+    return dispatchEngine.stats()
+
+@app.put("/dispatch/runners/{runner_id}", response_description="Start a runner's shift or report where they are")
+async def updateRunner(runner_id: str, position: PointModel = Body(...)):
+    starting = runner_id not in dispatchEngine.runners
+    runner = dispatchEngine.addRunner(runner_id, (position.x, position.y))
+    # A runner coming on shift may have been handed waiting orders straight away
+    if starting and runner.batch is not None:
+        await setOrderStatus([order.id for order in runner.batch.orders], "assigned", runner_id)
+    return dispatchEngine.runner(runner_id)
+
+@app.get("/dispatch/runners/{runner_id}", response_description="A runner's position and current route")
+async def getRunner(runner_id: str):
+    dispatchRunner(runner_id)
+    return dispatchEngine.runner(runner_id)
+
+@app.delete("/dispatch/runners/{runner_id}", response_description="End a runner's shift; orders not yet collected are dispatched again, collected ones fail")
+async def removeRunner(runner_id: str):
+    batch = dispatchRunner(runner_id).batch
+    abandoned = dispatchEngine.removeRunner(runner_id)
+    if abandoned:
+        await setOrderStatus([order.id for order in abandoned], "failed", runner_id)
+    elif batch is not None:
+        for order in batch.orders:
+            runner = dispatchEngine.batchOf[order.id].runner.id if order.id in dispatchEngine.batchOf else None
+            await setOrderStatus([order.id], "assigned" if runner is not None else "ready", runner)
+    return dispatchEngine.stats()
+
+@app.post("/dispatch/runners/{runner_id}/pickup", response_description="The runner collected their batch from the restaurant")
+async def runnerPickedUp(runner_id: str):
+    runner = dispatchRunner(runner_id)
+    if runner.batch is None or runner.batch.pickedUp:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Runner {runner_id} has nothing to collect")
+    dispatchEngine.pickedUp(runner_id)
+    await setOrderStatus([order.id for order in runner.batch.orders], "pickedUp", runner_id)
+    return dispatchEngine.runner(runner_id)
+
+@app.post("/dispatch/runners/{runner_id}/delivered/{order_id}", response_description="The runner handed over an order")
+async def runnerDelivered(runner_id: str, order_id: str):
+    runner = dispatchRunner(runner_id)
+    if runner.batch is None or not runner.batch.pickedUp or order_id not in [order.id for order in runner.batch.orders]:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Runner {runner_id} is not carrying order {order_id}")
+    dispatchEngine.deliver(runner_id, order_id)
+    await setOrderStatus([order_id], "delivered", runner_id)
+    if runner.batch is not None and not runner.batch.pickedUp:
+        # Going idle handed the runner a new batch
+        await setOrderStatus([order.id for order in runner.batch.orders], "assigned", runner_id)
+    return dispatchEngine.runner(runner_id)
+
+@app.post("/dispatch/orders/{order_id}/ready", response_description="The restaurant has the order ready; assign it to a runner")
+async def orderReady(order_id: str):
+    if order_id in dispatchEngine.batchOf or order_id in dispatchEngine.waiting:
+        batch = dispatchEngine.batchOf.get(order_id)
+        return {"orderId": order_id, "runnerId": batch.runner.id if batch is not None else None}
+    order = await db[constants.OrdersCollectionName].find_one({"_id": ObjectId(order_id)}, {"restaurantName": 1, "dropoff": 1, "status": 1}) if ObjectId.is_valid(order_id) else None
+    if order is None:
+        raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+    # Only orders not yet with a runner; anything assigned, collected or delivered stays as it is
+    if order.get('status') not in ("placed", "ready"):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Order {order_id} is already {order.get('status')}")
+    restaurant = await db[constants.RestaurantCollectionName].find_one({"name": order['restaurantName']}, {"location": 1})
+    if not order.get('dropoff') or restaurant is None or not restaurant.get('location'):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Dispatch needs the order's dropoff and the restaurant's location")
+    runnerId = dispatchEngine.addOrder(Order(order_id, order['restaurantName'], restaurant['location'], order['dropoff']))
+    await setOrderStatus([order_id], "assigned" if runnerId is not None else "ready", runnerId)
+    return {"orderId": order_id, "runnerId": runnerId}
+
+#Push
+@app.websocket("/ws")
+async def pushSocket(websocket: WebSocket, topics: Optional[str] = Query(None, description="Comma-separated topics to subscribe to on connect")):
+    # Topics: "catalog", "restaurant:<name>", "order:<id>"; send {"subscribe": [...]} or {"unsubscribe": [...]} to change them
+    await pushHub.serve(websocket, topics.split(",") if topics else [])
+
+@app.get("/ws/stats", response_description="Push connections, subscriptions and fan-out counts in this worker")
+async def pushStats():
+    return {**pushHub.stats(), "residentBytes": residentBytes()}
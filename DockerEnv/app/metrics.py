@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Seconds; tuned for an API whose reads are expected to take single-digit milliseconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def residentBytes() -> int:
+    # Linux only; 0 elsewhere rather than failing the scrape
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def formatLabels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{escapeLabel(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escapeLabel(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def formatValue(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    # Motor runs pymongo on worker threads, so every update takes the metric's lock
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelNames=()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = list(self.values.items())
+        return self.header() + [f"{self.name}{formatLabels(self.labelNames, labels)} {formatValue(value)}" for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0):
+        with self.lock:
+            self.values[labels] = value
+
+
+class CallbackGauge(Metric):
+    # Read at scrape time from state that is already kept elsewhere (cache sizes, hit counts);
+    # kind="counter" for values that only grow
+    def __init__(self, name: str, help: str, callback, labelNames=(), kind: str = "gauge"):
+        super().__init__(name, help, labelNames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        return self.header() + [f"{self.name}{formatLabels(self.labelNames, labels)} {formatValue(value)}"
+                                for labels, value in self.callback().items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelNames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelNames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value: float):
+        # Counts are kept per bucket and made cumulative only when rendered
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self.lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self.values.items()]
+        lines = self.header()
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else formatValue(bound))
+                lines.append(f"{self.name}_bucket{formatLabels(self.labelNames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{formatLabels(self.labelNames, labels)} {formatValue(total)}")
+            lines.append(f"{self.name}_count{formatLabels(self.labelNames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode()
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: times each request through to the last body chunk and labels it
+    # with the route template FastAPI leaves in the scope, so paths with names don't explode
+    # the label set
+    def __init__(self, app, latency: Histogram, inFlight: Gauge, mounts=()):
+        self.app = app
+        self.latency = latency
+        self.inFlight = inFlight
+        self.mounts = tuple(mounts)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = [500]
+
+        async def sendWithStatus(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        self.inFlight.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, sendWithStatus)
+        finally:
+            self.inFlight.dec((method,))
+            self.latency.observe((method, self.routeOf(scope), str(status[0])), time.perf_counter() - started)
+
+    def routeOf(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        path = scope["path"]
+        for mount in self.mounts:
+            if path.startswith(mount + "/"):
+                return mount
+        return "unmatched"
+
+
+def commandCollection(command, commandName: str) -> str:
+    # Most commands name their collection as the command's value; getMore carries it separately
+    if commandName == "getMore":
+        return command.get("collection", "")
+    target = command.get(commandName)
+    return target if isinstance(target, str) else ""
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self, duration: Histogram, failures: Counter):
+        self.duration = duration
+        self.failures = failures
+        self.pending = {}
+
+    def started(self, event):
+        self.pending[(event.connection_id, event.request_id)] = commandCollection(event.command, event.command_name)
+
+    def succeeded(self, event):
+        collection = self.pending.pop((event.connection_id, event.request_id), "")
+        self.duration.observe((collection, event.command_name), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self.pending.pop((event.connection_id, event.request_id), "")
+        self.duration.observe((collection, event.command_name), event.duration_micros / 1e6)
+        self.failures.inc((collection, event.command_name))
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    # Checkout start and finish are reported on the thread doing the checkout
+    def __init__(self, checkoutWait: Histogram, connections: Gauge):
+        self.checkoutWait = checkoutWait
+        self.connections = connections
+        self.checkouts = {}
+
+    def connection_check_out_started(self, event):
+        self.checkouts[(event.address, threading.get_ident())] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._finish(event, "ok")
+
+    def connection_check_out_failed(self, event):
+        self._finish(event, "failed")
+
+    def _finish(self, event, outcome: str):
+        started = self.checkouts.pop((event.address, threading.get_ident()), None)
+        if started is not None:
+            self.checkoutWait.observe(("%s:%s" % event.address, outcome), time.perf_counter() - started)
+
+    def connection_created(self, event):
+        self.connections.inc(("%s:%s" % event.address,))
+
+    def connection_closed(self, event):
+        self.connections.dec(("%s:%s" % event.address,))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
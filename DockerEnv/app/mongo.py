@@ -0,0 +1,135 @@
+"""MongoDB client, pool monitoring and /healthz and /readyz probes.
+
+Kept byte-for-byte identical in Database/mongo.py and DockerEnv/app/mongo.py. Each
+directory is deployed on its own: the Docker build context is DockerEnv and copies only
+app/, and the Database apps run from their own directory. So neither can import the
+other. Change both copies together; the pool settings in each constants.py likewise.
+"""
+import asyncio
+import threading
+
+import motor.motor_asyncio
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from pymongo import monitoring
+
+import constants as constants
+
+
+def clientOptions() -> dict:
+    options = {
+        "maxPoolSize": constants.MongoMaxPoolSize,
+        "minPoolSize": constants.MongoMinPoolSize,
+        "maxIdleTimeMS": constants.MongoMaxIdleTimeMS,
+        "connectTimeoutMS": constants.MongoConnectTimeoutMS,
+        "serverSelectionTimeoutMS": constants.MongoServerSelectionTimeoutMS,
+        "socketTimeoutMS": constants.MongoSocketTimeoutMS,
+        "waitQueueTimeoutMS": constants.MongoWaitQueueTimeoutMS,
+    }
+    if constants.MongoCompressors:
+        options["compressors"] = constants.MongoCompressors
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def createClient(listeners=()):
+    # Constructing the client does no I/O; connections are opened by warmPool or first use
+    return motor.motor_asyncio.AsyncIOMotorClient(constants.MONGODB_URL, event_listeners=list(listeners), **clientOptions())
+
+
+async def warmPool(client, connections: int):
+    # Concurrent pings each need their own socket, so the pool holds that many
+    # authenticated connections before the first request arrives
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, connections))))
+
+
+class PoolState(monitoring.ConnectionPoolListener):
+    # Per-server pool state from pymongo's pool events; read by /readyz
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def _pool(self, address):
+        return self.pools.setdefault("%s:%s" % address, {"ready": False, "open": 0, "checkedOut": 0, "cleared": 0})
+
+    def _set(self, address, key: str, value):
+        with self.lock:
+            self._pool(address)[key] = value
+
+    def _add(self, address, key: str, amount: int):
+        with self.lock:
+            self._pool(address)[key] += amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {address: dict(pool) for address, pool in self.pools.items()}
+
+    def pool_created(self, event):
+        self._add(event.address, "open", 0)
+
+    def pool_ready(self, event):
+        self._set(event.address, "ready", True)
+
+    def pool_cleared(self, event):
+        # A cleared pool means the driver saw the server fail; it is marked ready again on recovery
+        self._set(event.address, "ready", False)
+        self._add(event.address, "cleared", 1)
+
+    def pool_closed(self, event):
+        self._set(event.address, "ready", False)
+
+    def connection_created(self, event):
+        self._add(event.address, "open", 1)
+
+    def connection_closed(self, event):
+        self._add(event.address, "open", -1)
+
+    def connection_checked_out(self, event):
+        self._add(event.address, "checkedOut", 1)
+
+    def connection_checked_in(self, event):
+        self._add(event.address, "checkedOut", -1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+
+async def readiness(client, poolState: PoolState, timeout: float):
+    pools = poolState.snapshot()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+        ping = "ok"
+    except Exception as exc:
+        ping = f"failed: {type(exc).__name__}"
+    # Pools that were cleared and have not recovered mean the server is unreachable or failing over
+    unhealthy = [address for address, pool in pools.items() if pool["cleared"] and not pool["ready"]]
+    return ping == "ok" and not unhealthy, {"ping": ping, "pools": pools}
+
+
+def probeRouter(state, poolState: PoolState, waiting=None) -> APIRouter:
+    # state() returns the app's (lifecycle, client); each service keeps those as module globals.
+    # waiting(), if given, names anything else readiness is held back for, or returns None.
+    router = APIRouter()
+
+    @router.get("/healthz", response_description="Liveness: the process is serving requests")
+    async def healthz():
+        # Deliberately independent of MongoDB, so a database outage does not restart every worker
+        return {"status": "ok"}
+
+    @router.get("/readyz", response_description="Readiness: startup finished and MongoDB is reachable")
+    async def readyz():
+        lifecycle, client = state()
+        if lifecycle != "ready":
+            return JSONResponse({"status": lifecycle}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if waiting is not None and (reason := waiting()) is not None:
+            return JSONResponse({"status": reason}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        healthy, checks = await readiness(client, poolState, constants.ReadinessTimeoutSeconds)
+        return JSONResponse({"status": "ok" if healthy else "unavailable", **checks},
+                            status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    return router
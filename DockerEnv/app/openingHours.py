@@ -0,0 +1,67 @@
+MINUTES_PER_DAY = 24 * 60
+
+
+class OpeningHoursIndex:
+    # Segment tree over the minutes of the day. An opening interval is stored on the
+    # O(log 1440) nodes that exactly cover it, so "who is open at minute t" walks one
+    # root-to-leaf path and unions what it finds: O(log 1440 + open restaurants).
+    def __init__(self):
+        self.size = 1
+        while self.size < MINUTES_PER_DAY:
+            self.size *= 2
+        self.nodes = [set() for _ in range(2 * self.size)]
+        self.hours = {}
+
+    def __len__(self):
+        return len(self.hours)
+
+    def rebuild(self, restaurants):
+        self.__init__()
+        for restaurant in restaurants:
+            self.add(restaurant["name"], restaurant["openingMinute"], restaurant["closingMinute"],
+                     restaurant["opening_time"], restaurant["closing_time"])
+
+    def add(self, name: str, openingMinute: int, closingMinute: int, opening_time: str, closing_time: str):
+        self.remove(name)
+        self.hours[name] = (openingMinute, closingMinute, opening_time, closing_time)
+        for start, end in self._ranges(openingMinute, closingMinute):
+            self._update(start, end, name, set.add)
+
+    def remove(self, name: str):
+        hours = self.hours.pop(name, None)
+        if hours is None:
+            return
+        for start, end in self._ranges(hours[0], hours[1]):
+            self._update(start, end, name, set.discard)
+
+    def openAt(self, minute: int) -> list:
+        names = set()
+        node = minute + self.size
+        while node:
+            names |= self.nodes[node]
+            node //= 2
+        return [
+            {"name": name, "opening_time": self.hours[name][2], "closing_time": self.hours[name][3]}
+            for name in sorted(names)
+        ]
+
+    def _ranges(self, openingMinute: int, closingMinute: int):
+        # Half-open [opening, closing); a stall that closes after midnight is split in two
+        if openingMinute == closingMinute:
+            return [(0, MINUTES_PER_DAY)]
+        if openingMinute < closingMinute:
+            return [(openingMinute, closingMinute)]
+        return [(openingMinute, MINUTES_PER_DAY), (0, closingMinute)]
+
+    def _update(self, start: int, end: int, name: str, operation):
+        start += self.size
+        end += self.size
+        while start < end:
+            if start & 1:
+                operation(self.nodes[start], name)
+                start += 1
+            if end & 1:
+                end -= 1
+                operation(self.nodes[end], name)
+            start //= 2
+            end //= 2
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+class OrderQueueFull(Exception):
+    pass
+
+
+class OrderQueue:
+    # Group commit for /orders/: requests enqueue their document and wait, while a few writer
+    # tasks drain whatever has queued up into one unordered insert_many. Under load each
+    # round trip carries many orders; when idle an order is written as soon as it arrives.
+    def __init__(self, collection, maxSize: int, batchSize: int, writers: int):
+        self.collection = collection
+        self.batchSize = batchSize
+        self.writers = writers
+        self.queue = asyncio.Queue(maxSize)
+        # idempotencyKey -> future of the order still waiting in this worker, so a retry that
+        # arrives before the first attempt is written waits for it instead of racing it
+        self.inFlight = {}
+        self.tasks = []
+        self.accepted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batchedOrders = 0
+        self.written = 0
+        self.duplicates = 0
+        self.writeErrors = 0
+        self.maxBatch = 0
+        self.lastBatchSeconds = 0.0
+        self.totalBatchSeconds = 0.0
+
+    async def submit(self, document) -> bool:
+        # True once the order is stored; False if its idempotency key was already used
+        key = document["idempotencyKey"]
+        if key in self.inFlight:
+            await asyncio.shield(self.inFlight[key])
+            return False
+        future = asyncio.get_running_loop().create_future()
+        try:
+            # Backpressure: a full queue is refused at once rather than queued behind a backlog
+            self.queue.put_nowait((document, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise OrderQueueFull()
+        self.accepted += 1
+        self.inFlight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.inFlight.get(key) is future:
+                del self.inFlight[key]
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._run()) for _ in range(self.writers)]
+
+    async def stop(self):
+        # Orders already accepted are written before shutdown; the writers then exit
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batchSize and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write(self, batch):
+        started = time.perf_counter()
+        failed = {}
+        try:
+            await self.collection.insert_many([document for document, _ in batch], ordered=False)
+        except BulkWriteError as exc:
+            failed = {writeError["index"]: writeError for writeError in exc.details["writeErrors"]}
+        except Exception as exc:
+            self.writeErrors += len(batch)
+            logger.exception("Writing %d orders failed", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for index, (document, future) in enumerate(batch):
+            writeError = failed.get(index)
+            if future.done():
+                continue
+            if writeError is None:
+                future.set_result(True)
+            elif writeError.get("code") == 11000:
+                self.duplicates += 1
+                future.set_result(False)
+            else:
+                self.writeErrors += 1
+                future.set_exception(RuntimeError(writeError.get("errmsg", "order write failed")))
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.batchedOrders += len(batch)
+        self.written += len(batch) - len(failed)
+        self.maxBatch = max(self.maxBatch, len(batch))
+        self.lastBatchSeconds = elapsed
+        self.totalBatchSeconds += elapsed
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "writeErrors": self.writeErrors,
+            "batches": self.batches,
+            "avgBatch": self.batchedOrders / self.batches if self.batches else 0.0,
+            "maxBatch": self.maxBatch,
+            "lastBatchSeconds": self.lastBatchSeconds,
+            "avgBatchSeconds": self.totalBatchSeconds / self.batches if self.batches else 0.0,
+        }
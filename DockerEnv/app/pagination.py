@@ -0,0 +1,102 @@
+import base64
+import binascii
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from pymongo import ASCENDING
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ID_ORDER = [("_id", ASCENDING)]
+# A sort is a list of (field, direction) whose last field is unique, so every document has its own position
+Sort = Optional[List[Tuple[str, int]]]
+
+
+def wantsNdjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def parseCursor(after: Optional[str]) -> Optional[ObjectId]:
+    if after is None:
+        return None
+    try:
+        return ObjectId(after)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {after}")
+
+
+def encodeCursor(values) -> str:
+    # Cursors for other sort orders carry every sort key of the last document, opaquely
+    values = [str(value) if isinstance(value, ObjectId) else value for value in values]
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode().rstrip("=")
+
+
+def decodeCursor(after: str, sort: Sort) -> list:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(after + "=" * (-len(after) % 4)))
+        if not isinstance(values, list) or len(values) != len(sort):
+            raise ValueError(after)
+        return [ObjectId(value) if field == "_id" else value for (field, _), value in zip(sort, values)]
+    except (ValueError, binascii.Error, InvalidId, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {after}")
+
+
+def cursorKey(document: dict, sort: Sort) -> list:
+    return [document[field] for field, _ in (sort or ID_ORDER)]
+
+
+def formatCursor(key: list, sort: Sort) -> str:
+    return str(key[0]) if sort is None else encodeCursor(key)
+
+
+def keysetQuery(query: dict, after: Optional[str], sort: Sort = None) -> dict:
+    # Pages are ordered by _id, so "after" is simply the last _id the client has seen
+    if after is None:
+        return query
+    if sort is None:
+        return {**query, "_id": {"$gt": parseCursor(after)}}
+    # Otherwise "after" means later in the sort order: (a > x) or (a == x and b > y) and so on
+    values = decodeCursor(after, sort)
+    clauses = []
+    for index, (field, direction) in enumerate(sort):
+        clause = {equalField: value for (equalField, _), value in zip(sort[:index], values)}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": values[index]}
+        clauses.append(clause)
+    return {**query, "$or": clauses}
+
+
+def keysetCursor(collection, query: dict, after: Optional[str], limit: Optional[int], projection: Optional[dict] = None, sort: Sort = None):
+    cursor = collection.find(keysetQuery(query, after, sort), projection).sort(sort or ID_ORDER)
+    if limit is not None:
+        # One extra document tells us whether another page exists without a count query
+        cursor = cursor.limit(limit + 1)
+    return cursor
+
+
+async def fetchPage(collection, query: dict, after: Optional[str], limit: Optional[int], projection: Optional[dict] = None, sort: Sort = None):
+    documents = await keysetCursor(collection, query, after, limit, projection, sort).to_list(None)
+    nextCursor = None
+    if limit is not None and len(documents) > limit:
+        documents = documents[:limit]
+        nextCursor = formatCursor(cursorKey(documents[-1], sort), sort)
+    return documents, nextCursor
+
+
+def ndjsonResponse(cursor, serialize: Callable[[dict], bytes], limit: Optional[int], sort: Sort = None) -> StreamingResponse:
+    async def lines() -> AsyncIterator[bytes]:
+        sent = 0
+        lastKey = None
+        async for document in cursor:
+            if limit is not None and sent == limit:
+                # The extra document fetched for paging only signals that another page exists
+                yield ('{"nextCursor": "%s"}\n' % formatCursor(lastKey, sort)).encode()
+                break
+            # Taken before serialize, which may reshape the document
+            lastKey = cursorKey(document, sort)
+            yield serialize(document) + b"\n"
+            sent += 1
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import re
+from collections import deque
+
+import orjson
+from starlette.websockets import WebSocket
+
+logger = logging.getLogger(__name__)
+
+TOPIC_PATTERN = re.compile(r"^(catalog|order:[0-9a-f]{24}|restaurant:.{1,200})$")
+# 1013 is "try again later": sent to clients dropped for reading too slowly or refused when full
+TRY_AGAIN_LATER = 1013
+
+
+class Subscriber:
+    # Kept small because thousands sit idle per worker: the send queue and its task only
+    # exist while messages are waiting to go out
+    __slots__ = ("websocket", "topics", "pending", "flushing", "closed")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.topics = set()
+        self.pending = None
+        self.flushing = None
+        self.closed = False
+
+
+class PushHub:
+    # Topic fan-out for /ws. Each event is encoded once and appended to every subscriber's
+    # bounded queue; a subscriber whose queue is full is too slow to keep up and is
+    # disconnected rather than letting it hold memory or delay everyone else.
+    def __init__(self, maxConnections: int, maxPending: int, maxTopics: int):
+        self.maxConnections = maxConnections
+        self.maxPending = maxPending
+        self.maxTopics = maxTopics
+        self.topics = {}
+        self.subscribers = set()
+        self.closing = set()
+        self.connected = 0
+        self.refused = 0
+        self.published = 0
+        self.delivered = 0
+        self.slowConsumers = 0
+
+    async def serve(self, websocket: WebSocket, topics):
+        if len(self.subscribers) >= self.maxConnections:
+            self.refused += 1
+            await websocket.close(code=TRY_AGAIN_LATER)
+            return
+        await websocket.accept()
+        subscriber = Subscriber(websocket)
+        self.subscribers.add(subscriber)
+        self.connected += 1
+        try:
+            self._send(subscriber, self._change(subscriber, {"subscribe": topics}))
+            while not subscriber.closed:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                self._send(subscriber, self._request(subscriber, message.get("text") or message.get("bytes")))
+        finally:
+            self._close(subscriber, None)
+            self.subscribers.discard(subscriber)
+
+    def _request(self, subscriber: Subscriber, data):
+        try:
+            request = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return {"error": "Messages must be JSON"}
+        if not isinstance(request, dict):
+            return {"error": "Send {\"subscribe\": [...]} or {\"unsubscribe\": [...]}"}
+        return self._change(subscriber, request)
+
+    def _change(self, subscriber: Subscriber, request):
+        subscribe, unsubscribe = request.get("subscribe") or [], request.get("unsubscribe") or []
+        if not isinstance(subscribe, list) or not isinstance(unsubscribe, list):
+            return {"error": "subscribe and unsubscribe take lists of topics"}
+        invalid = [topic for topic in subscribe if not isinstance(topic, str) or not TOPIC_PATTERN.match(topic)]
+        if invalid:
+            return {"error": "Unknown topics", "topics": invalid}
+        for topic in unsubscribe:
+            if topic in subscriber.topics:
+                subscriber.topics.discard(topic)
+                self._unlink(subscriber, topic)
+        for topic in subscribe:
+            if topic in subscriber.topics:
+                continue
+            if len(subscriber.topics) >= self.maxTopics:
+                return {"error": f"At most {self.maxTopics} topics per connection", "subscribed": sorted(subscriber.topics)}
+            subscriber.topics.add(topic)
+            self.topics.setdefault(topic, set()).add(subscriber)
+        return {"subscribed": sorted(subscriber.topics)}
+
+    def _unlink(self, subscriber: Subscriber, topic: str):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.topics[topic]
+
+    def publish(self, topic: str, event: dict) -> int:
+        # Called from write handlers; never waits on a client
+        subscribers = self.topics.get(topic)
+        if not subscribers:
+            return 0
+        self.published += 1
+        message = orjson.dumps({"topic": topic, **event}).decode()
+        for subscriber in list(subscribers):
+            self._enqueue(subscriber, message)
+        return len(subscribers)
+
+    def _send(self, subscriber: Subscriber, reply):
+        self._enqueue(subscriber, orjson.dumps(reply).decode())
+
+    def _enqueue(self, subscriber: Subscriber, message: str):
+        if subscriber.closed:
+            return
+        if subscriber.pending is None:
+            subscriber.pending = deque()
+        elif len(subscriber.pending) >= self.maxPending:
+            self.slowConsumers += 1
+            self._close(subscriber, TRY_AGAIN_LATER)
+            return
+        subscriber.pending.append(message)
+        if subscriber.flushing is None:
+            subscriber.flushing = asyncio.create_task(self._flush(subscriber))
+
+    async def _flush(self, subscriber: Subscriber):
+        try:
+            while subscriber.pending:
+                await subscriber.websocket.send_text(subscriber.pending.popleft())
+                self.delivered += 1
+        except Exception:
+            # The client went away mid-send; serve() sees the disconnect and returns
+            self._close(subscriber, None)
+        finally:
+            subscriber.pending = None
+            subscriber.flushing = None
+
+    def _close(self, subscriber: Subscriber, code):
+        if subscriber.closed:
+            return
+        subscriber.closed = True
+        for topic in subscriber.topics:
+            self._unlink(subscriber, topic)
+        subscriber.topics.clear()
+        if subscriber.pending is not None:
+            subscriber.pending.clear()
+        if code is not None:
+            task = asyncio.create_task(self._disconnect(subscriber, code))
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
+
+    async def _disconnect(self, subscriber: Subscriber, code: int):
+        # Waits for a send already in progress so the close frame isn't interleaved with it
+        if subscriber.flushing is not None:
+            await asyncio.wait([subscriber.flushing])
+        try:
+            await subscriber.websocket.close(code=code)
+        except Exception:
+            logger.debug("Closing a slow consumer failed", exc_info=True)
+
+    def stats(self):
+        return {
+            "connections": len(self.subscribers),
+            "topics": len(self.topics),
+            "subscriptions": sum(len(subscribers) for subscribers in self.topics.values()),
+            "connected": self.connected,
+            "refused": self.refused,
+            "published": self.published,
+            "delivered": self.delivered,
+            "slowConsumers": self.slowConsumers,
+            "pendingMessages": sum(len(subscriber.pending) for subscriber in self.subscribers if subscriber.pending),
+        }
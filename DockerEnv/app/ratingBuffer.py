@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class RatingBuffer:
+    # Write-behind aggregation for /newRating/: ratings are summed per restaurant in
+    # memory and written as one unordered bulk_write of $inc upserts per flush
+    def __init__(self, collection, flushInterval: float, flushThreshold: int, onFlushed=None):
+        self.collection = collection
+        self.onFlushed = onFlushed
+        self.flushInterval = flushInterval
+        self.flushThreshold = flushThreshold
+        self.pending = {}
+        self.pendingRatings = 0
+        # Deltas handed to bulk_write but not yet acknowledged; still merged into reads
+        self.inFlight = {}
+        self.flushLock = asyncio.Lock()
+        self.task = None
+        self.thresholdFlushes = set()
+        self.flushes = 0
+        self.flushErrors = 0
+        self.flushedRatings = 0
+        self.lastFlushSeconds = 0.0
+        self.maxFlushSeconds = 0.0
+        self.totalFlushSeconds = 0.0
+
+    def add(self, restaurantName: str, rating: float):
+        delta = self.pending.setdefault(restaurantName, [0.0, 0])
+        delta[0] += rating
+        delta[1] += 1
+        self.pendingRatings += 1
+        if self.pendingRatings >= self.flushThreshold and not self.flushLock.locked():
+            task = asyncio.create_task(self._flushQuietly())
+            self.thresholdFlushes.add(task)
+            task.add_done_callback(self.thresholdFlushes.discard)
+
+    def delta(self, restaurantName: str):
+        ratingSum, numRatings = 0.0, 0
+        for buffered in (self.pending, self.inFlight):
+            if restaurantName in buffered:
+                ratingSum += buffered[restaurantName][0]
+                numRatings += buffered[restaurantName][1]
+        return ratingSum, numRatings
+
+    def merge(self, restaurantName: str, restaurant_data):
+        ratingSum, numRatings = self.delta(restaurantName)
+        if not numRatings:
+            return restaurant_data
+        if restaurant_data is None:
+            restaurant_data = {"restaurantName": restaurantName, "ratingSum": 0.0, "numRatings": 0}
+        return {
+            **restaurant_data,
+            "ratingSum": restaurant_data["ratingSum"] + ratingSum,
+            "numRatings": restaurant_data["numRatings"] + numRatings,
+        }
+
+    async def flush(self):
+        async with self.flushLock:
+            if not self.pending:
+                return
+            self.inFlight, self.pending = self.pending, {}
+            batchRatings, self.pendingRatings = self.pendingRatings, 0
+            requests = [
+                UpdateOne({"restaurantName": name}, {"$inc": {"ratingSum": ratingSum, "numRatings": numRatings}}, upsert=True)
+                for name, (ratingSum, numRatings) in self.inFlight.items()
+            ]
+            started = time.perf_counter()
+            try:
+                await self.collection.bulk_write(requests, ordered=False)
+            except Exception:
+                # Put the batch back so the next flush retries it rather than dropping ratings
+                self.flushErrors += 1
+                logger.exception("Rating flush of %d restaurants failed", len(requests))
+                for name, (ratingSum, numRatings) in self.inFlight.items():
+                    delta = self.pending.setdefault(name, [0.0, 0])
+                    delta[0] += ratingSum
+                    delta[1] += numRatings
+                self.pendingRatings += batchRatings
+                raise
+            finally:
+                self.inFlight = {}
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.flushedRatings += batchRatings
+            self.lastFlushSeconds = elapsed
+            self.maxFlushSeconds = max(self.maxFlushSeconds, elapsed)
+            self.totalFlushSeconds += elapsed
+            if self.onFlushed is not None:
+                self.onFlushed()
+
+    async def _flushQuietly(self):
+        # Failures are already logged and counted by flush, and the batch is kept for a retry
+        try:
+            await self.flush()
+        except Exception:
+            pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flushInterval)
+            await self._flushQuietly()
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        # Durable shutdown: whatever is still buffered is written before the process exits
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pendingRatings": self.pendingRatings,
+            "pendingRestaurants": len(self.pending),
+            "flushes": self.flushes,
+            "flushErrors": self.flushErrors,
+            "flushedRatings": self.flushedRatings,
+            "lastFlushSeconds": self.lastFlushSeconds,
+            "maxFlushSeconds": self.maxFlushSeconds,
+            "avgFlushSeconds": self.totalFlushSeconds / self.flushes if self.flushes else 0.0,
+        }
@@ -0,0 +1,197 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+RESTAURANT = "restaurant"
+MENU = "menu"
+
+# Name matches always outrank matches found only in a menu item's description
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+# Fraction of the query's trigrams a name must share to count as a typo match
+MIN_GRAM_OVERLAP = 0.5
+# Description words are only searched once the prefix is this long, so that
+# one or two typed characters don't pull in most of the menu
+MIN_DESCRIPTION_PREFIX = 3
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[\W_]+", " ", text.casefold()).split())
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PrefixIndex:
+    # Sorted vocabulary plus postings, so any word prefix is a bisect away
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.vocabulary = []
+
+    def add(self, token: str, key, keepSorted: bool = True):
+        keys = self.postings[token]
+        if not keys and keepSorted:
+            insort(self.vocabulary, token)
+        keys.add(key)
+
+    def remove(self, token: str, key):
+        keys = self.postings.get(token)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.postings[token]
+            del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def sort(self):
+        self.vocabulary = sorted(self.postings)
+
+    def keys(self, prefix: str) -> set:
+        keys = set()
+        position = bisect_left(self.vocabulary, prefix)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(prefix):
+            keys |= self.postings[self.vocabulary[position]]
+            position += 1
+        return keys
+
+
+class SearchDocument:
+    __slots__ = ("key", "kind", "name", "restaurantName", "text", "grams", "description")
+
+    def __init__(self, key, kind, name, restaurantName, description=""):
+        self.key = key
+        self.kind = kind
+        self.name = name
+        self.restaurantName = restaurantName
+        self.text = normalize(name)
+        # Padding marks word boundaries, so " pi" only matches words starting with "pi"
+        self.grams = trigrams(f" {self.text} ")
+        self.description = normalize(description) if description else ""
+
+
+class SearchIndex:
+    def __init__(self):
+        self.documents = {}
+        self.restaurantKeys = set()
+        self.grams = defaultdict(set)
+        self.nameTokens = PrefixIndex()
+        self.descriptionTokens = PrefixIndex()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def rebuild(self, restaurants, menuItems):
+        self.__init__()
+        for restaurant in restaurants:
+            name = restaurant["name"]
+            self._add(SearchDocument((RESTAURANT, name), RESTAURANT, name, name), keepSorted=False)
+        for item in menuItems:
+            key = (MENU, item["restaurantName"], item["name"])
+            self._add(SearchDocument(key, MENU, item["name"], item["restaurantName"], item.get("description", "")), keepSorted=False)
+        self.nameTokens.sort()
+        self.descriptionTokens.sort()
+
+    def addRestaurant(self, name: str):
+        self._add(SearchDocument((RESTAURANT, name), RESTAURANT, name, name))
+
+    def removeRestaurant(self, name: str):
+        self._remove((RESTAURANT, name))
+
+    def addMenuItem(self, restaurantName: str, name: str, description: str = ""):
+        self._add(SearchDocument((MENU, restaurantName, name), MENU, name, restaurantName, description))
+
+    def removeMenuItem(self, restaurantName: str, name: str):
+        self._remove((MENU, restaurantName, name))
+
+    def _add(self, document: SearchDocument, keepSorted: bool = True):
+        self._remove(document.key)
+        self.documents[document.key] = document
+        if document.kind == RESTAURANT:
+            self.restaurantKeys.add(document.key)
+        for gram in document.grams:
+            self.grams[gram].add(document.key)
+        for token in set(document.text.split()):
+            self.nameTokens.add(token, document.key, keepSorted)
+        for token in set(document.description.split()):
+            self.descriptionTokens.add(token, document.key, keepSorted)
+
+    def _remove(self, key):
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        self.restaurantKeys.discard(key)
+        for gram in document.grams:
+            keys = self.grams[gram]
+            keys.discard(key)
+            if not keys:
+                del self.grams[gram]
+        for token in set(document.text.split()):
+            self.nameTokens.remove(token, key)
+        for token in set(document.description.split()):
+            self.descriptionTokens.remove(token, key)
+
+    def restaurantNames(self, query: str) -> list:
+        # Case-insensitive substring match on restaurant names, answered from the trigram index
+        needle = normalize(query)
+        if not needle:
+            return []
+        if len(needle) < 3:
+            candidates = self.restaurantKeys
+        else:
+            gramSets = sorted((self.grams.get(gram, set()) for gram in trigrams(needle)), key=len)
+            candidates = set.intersection(*gramSets)
+        return sorted(
+            self.documents[key].name for key in candidates
+            if key[0] == RESTAURANT and needle in self.documents[key].text
+        )
+
+    def autocomplete(self, query: str, limit: int = 10) -> list:
+        needle = normalize(query)
+        if not needle:
+            return []
+        # The last word is usually still being typed, so only its start is anchored
+        lastWord = needle.split()[-1]
+        queryGrams = trigrams(f" {needle}")
+        candidates = self.nameTokens.keys(lastWord)
+        if len(lastWord) >= MIN_DESCRIPTION_PREFIX:
+            candidates |= self.descriptionTokens.keys(lastWord)
+        if queryGrams:
+            counts = defaultdict(int)
+            for gram in queryGrams:
+                for key in self.grams.get(gram, ()):
+                    counts[key] += 1
+            required = max(1, int(len(queryGrams) * MIN_GRAM_OVERLAP + 0.5))
+            candidates.update(key for key, count in counts.items() if count >= required)
+
+        hits = []
+        for key in candidates:
+            document = self.documents[key]
+            score = self._nameScore(needle, queryGrams, document)
+            if document.description:
+                score = max(score, self._textScore(needle, document.description) * DESCRIPTION_WEIGHT)
+            if score > 0:
+                hits.append((-score, document.kind != RESTAURANT, len(document.name), key, document))
+        return [
+            {"kind": document.kind, "name": document.name, "restaurantName": document.restaurantName, "score": round(-score, 3)}
+            for score, _, _, _, document in heapq.nsmallest(limit, hits)
+        ]
+
+    def _textScore(self, needle: str, text: str) -> float:
+        if text == needle:
+            return 1.0
+        if text.startswith(needle):
+            return 0.9
+        if f" {needle}" in f" {text}":
+            return 0.8
+        if needle in text:
+            return 0.7
+        return 0.0
+
+    def _nameScore(self, needle: str, queryGrams: set, document: SearchDocument) -> float:
+        score = self._textScore(needle, document.text)
+        if score or not queryGrams:
+            return score * NAME_WEIGHT
+        overlap = len(queryGrams & document.grams) / len(queryGrams)
+        return 0.6 * overlap * NAME_WEIGHT if overlap >= MIN_GRAM_OVERLAP else 0.0
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class SingleFlight:
+    # Coalesces identical reads. The first caller for a key starts the fetch, and everyone
+    # asking for the same key before it finishes awaits that same fetch instead of sending
+    # their own query. The result is then kept for ttl seconds, so a spike on one hot key
+    # costs one query per ttl instead of one per request.
+    # Keys are tuples of the query shape and its parameters, such as ("ratings", name).
+    # Like ResponseCache, every invalidation bumps the version and a fetch that overlapped
+    # one is handed to its waiters but not kept.
+    def __init__(self, ttl: float, maxEntries: int):
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.version = 0
+        self.inFlight = {}
+        self.results = OrderedDict()
+        self.calls = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+
+    async def do(self, key: tuple, fetch, ttl: float = None):
+        # fetch is a coroutine function; its result is shared, so callers must not mutate it
+        self.calls += 1
+        entry = self.results.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                # Least recently used entries are evicted first, so hot keys stay cached
+                self.results.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.results[key]
+        task = self.inFlight.get(key)
+        if task is None:
+            self.fetches += 1
+            task = self.inFlight[key] = asyncio.ensure_future(self._fetch(key, fetch, self.ttl if ttl is None else ttl))
+            # Retrieves the exception even if every waiter was cancelled, so it isn't logged as lost
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        else:
+            self.coalesced += 1
+        # Shielded: a caller that goes away doesn't cancel the fetch the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: tuple, fetch, ttl: float):
+        version = self.version
+        try:
+            value = await fetch()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            if self.inFlight.get(key) is asyncio.current_task():
+                del self.inFlight[key]
+        if ttl > 0 and version == self.version:
+            self.results[key] = (time.monotonic() + ttl, value)
+            if len(self.results) > self.maxEntries:
+                self.results.popitem(last=False)
+        return value
+
+    def invalidate(self, *prefix):
+        # Fetches already running still answer the callers waiting on them; later callers start a new one
+        self.version += 1
+        for key in [key for key in self.results if key[:len(prefix)] == prefix]:
+            del self.results[key]
+        for key in [key for key in self.inFlight if key[:len(prefix)] == prefix]:
+            del self.inFlight[key]
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "inFlight": len(self.inFlight),
+            "cached": len(self.results),
+            # Requests answered per query actually sent
+            "callsPerFetch": self.calls / self.fetches if self.fetches else 0.0,
+        }
@@ -0,0 +1,164 @@
+import mimetypes
+import os
+import re
+from collections import OrderedDict
+from email.utils import formatdate
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+# Uploads are stored as <sha256>[_variant].<ext>, so a URL never changes meaning
+FINGERPRINTED = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+STREAM_CHUNK_SIZE = 256 * 1024
+
+mimetypes.add_type("image/webp", ".webp")
+
+
+class AssetCache:
+    # LRU of small file bodies keyed by path; entries are dropped if the file's
+    # mtime or size no longer match, so a replaced file is never served stale
+    def __init__(self, maxBytes: int, maxFileBytes: int):
+        self.maxBytes = maxBytes
+        self.maxFileBytes = maxFileBytes
+        self.totalBytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str, stat_result: os.stat_result):
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != (stat_result.st_mtime_ns, stat_result.st_size):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(path)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, path: str, stat_result: os.stat_result, body: bytes):
+        if len(body) > self.maxFileBytes:
+            return
+        previous = self.entries.pop(path, None)
+        if previous is not None:
+            self.totalBytes -= len(previous[1])
+        self.entries[path] = ((stat_result.st_mtime_ns, stat_result.st_size), body)
+        self.totalBytes += len(body)
+        while self.totalBytes > self.maxBytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.totalBytes -= len(evicted)
+
+
+def parseRange(rangeHeader: str, size: int):
+    # Returns (start, end) inclusive, None to serve the whole file, or False if unsatisfiable.
+    # Only single ranges are honoured; multi-range requests get the full body, as RFC 9110 allows.
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", rangeHeader.strip())
+    if match is None or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        suffix = int(match.group(2))
+        if suffix == 0:
+            return False
+        return max(0, size - suffix), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class AssetResponse(Response):
+    def __init__(self, path: str, stat_result: os.stat_result, start: int, end: int,
+                 headers: dict, status_code: int, cache: AssetCache, bytesServed=None):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.stat_result = stat_result
+        self.start = start
+        self.count = end - start + 1
+        self.cache = cache
+        self.bytesServed = bytesServed
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        size = self.stat_result.st_size
+        if size <= self.cache.maxFileBytes:
+            body = self.cache.get(self.path, self.stat_result)
+            if body is None:
+                async with await anyio.open_file(self.path, "rb") as file:
+                    body = await file.read()
+                self.cache.put(self.path, self.stat_result, body)
+            await send({"type": "http.response.body", "body": body[self.start:self.start + self.count]})
+            self.served("cache", self.count)
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            # The server can sendfile() straight from the page cache to the socket
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopysend", "file": file.fileno(),
+                            "offset": self.start, "count": self.count})
+            self.served("sendfile", self.count)
+            return
+
+        async with await anyio.open_file(self.path, "rb") as file:
+            await file.seek(self.start)
+            remaining = self.count
+            while remaining:
+                chunk = await file.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                await send({"type": "http.response.body", "body": b""})
+        self.served("stream", self.count - remaining)
+
+    def served(self, source: str, count: int):
+        if self.bytesServed is not None:
+            self.bytesServed.inc((source,), count)
+
+
+class AssetFiles(StaticFiles):
+    def __init__(self, *, cache: AssetCache, bytesServed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.bytesServed = bytesServed
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        path = os.fspath(full_path)
+        filename = os.path.basename(path)
+        fingerprinted = FINGERPRINTED.match(filename) is not None
+        if fingerprinted:
+            etag = '"' + filename.split(".")[0] + '"'
+        else:
+            etag = '"%x-%x"' % (stat_result.st_mtime_ns, stat_result.st_size)
+        headers = {
+            "etag": etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "cache-control": IMMUTABLE if fingerprinted else REVALIDATE,
+            "accept-ranges": "bytes",
+            "content-type": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        }
+        if status_code == 200 and self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+
+        size = stat_result.st_size
+        byteRange = None
+        if status_code == 200 and "range" in request_headers:
+            ifRange = request_headers.get("if-range")
+            if ifRange is None or ifRange in (etag, headers["last-modified"]):
+                byteRange = parseRange(request_headers["range"], size)
+        if byteRange is False:
+            return Response(status_code=416, headers={"content-range": f"bytes */{size}", "accept-ranges": "bytes"})
+        if byteRange:
+            start, end = byteRange
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            return AssetResponse(path, stat_result, start, end, headers, 206, self.cache, self.bytesServed)
+        return AssetResponse(path, stat_result, 0, size - 1, headers, status_code, self.cache, self.bytesServed)
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import uuid
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile, status
+
+# Leading bytes of the image formats we accept, mapped to the extension they are stored under
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+def sniffImageExtension(header: bytes):
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+async def saveUpload(image: UploadFile, directory: str, chunkSize: int, maxBytes: int) -> str:
+    # Streams the upload into a temp file while hashing it, then renames it to <sha256><ext>.
+    # The rename is atomic, so readers never see a partial file, and identical images share one file.
+    digest = hashlib.sha256()
+    tempPath = os.path.join(directory, f".upload-{uuid.uuid4().hex}.tmp")
+    extension = None
+    size = 0
+    try:
+        async with aiofiles.open(tempPath, "wb") as out_file:
+            while content := await image.read(chunkSize):
+                if extension is None:
+                    extension = sniffImageExtension(content[:16])
+                    if extension is None:
+                        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                            detail="Image must be a JPEG, PNG, GIF or WebP file")
+                size += len(content)
+                if size > maxBytes:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                        detail=f"Image is larger than {maxBytes} bytes")
+                digest.update(content)
+                await out_file.write(content)
+        if extension is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Image file is empty")
+        filename = digest.hexdigest() + extension
+        finalPath = os.path.join(directory, filename)
+        if await aiofiles.os.path.exists(finalPath):
+            await aiofiles.os.remove(tempPath)
+        else:
+            await aiofiles.os.replace(tempPath, finalPath)
+        return filename
+    except BaseException:
+        # Plain os calls so the temp file is still removed when the request is cancelled
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+
+def saveImageBytes(data: bytes, directory: str, maxBytes: int) -> str:
+    # Synchronous counterpart of saveUpload for images already in memory (e.g. from a bulk
+    # import zip); meant to run in a worker thread. Raises ValueError for rejected images.
+    extension = sniffImageExtension(data[:16])
+    if extension is None:
+        raise ValueError("image must be a JPEG, PNG, GIF or WebP file")
+    if len(data) > maxBytes:
+        raise ValueError(f"image is larger than {maxBytes} bytes")
+    filename = hashlib.sha256(data).hexdigest() + extension
+    finalPath = os.path.join(directory, filename)
+    if not os.path.exists(finalPath):
+        tempPath = os.path.join(directory, f".upload-{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tempPath, "wb") as out_file:
+                out_file.write(data)
+            os.replace(tempPath, finalPath)
+        except BaseException:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+    return filename
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from catalog import placeholderImage  # noqa: E402
+
+FLOOD_RESTAURANT = "Admission Load Menu"
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return "no requests"
+    return (f"n={len(latencies)} p50={latencies[len(latencies) // 2]:.0f}ms p99={latencies[max(0, int(len(latencies) * 0.99) - 1)]:.0f}ms "
+            f"max={latencies[-1]:.0f}ms")
+
+
+async def reads(client: httpx.AsyncClient, rps: float, deadline: float, latencies: list, statuses: Counter):
+    # Open loop: requests go out on schedule whether or not earlier ones have finished, and
+    # latency counts from when each was due, so queueing inside the server isn't hidden
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    tasks = []
+
+    async def one(index: int, due: float):
+        try:
+            response = await client.get("/restaurants/", params={"limit": 20},
+                                        headers={"X-Forwarded-For": f"10.1.{index % 250}.{index // 250 % 250}"})
+            statuses[response.status_code] += 1
+        except httpx.HTTPError as exc:
+            statuses[type(exc).__name__] += 1
+        latencies.append((loop.time() - due) * 1000)
+
+    index = 0
+    while loop.time() < deadline:
+        due = started + index / rps
+        if (delay := due - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(index, due)))
+        index += 1
+    await asyncio.gather(*tasks)
+
+
+def uploadForm(route: str, name: str):
+    if route == "restaurants":
+        return "/restaurants/", {"name": name, "phone_number": "9800000000", "restaurant_type": "Veg", "opening_time": "09:00 AM", "closing_time": "10:00 PM"}
+    return "/menu/", {"name": name, "restaurantName": FLOOD_RESTAURANT, "menu_type": "Veg", "description": "admission load", "price": 50}
+
+
+async def uploader(client: httpx.AsyncClient, worker: int, route: str, image: bytes, deadline: float, latencies: list, statuses: Counter):
+    # Closed loop, as fast as the server lets it: a client script re-uploading photos.
+    # Honours Retry-After, the way a well-behaved client backs off.
+    rng = random.Random(worker)
+    sequence = 0
+    while time.perf_counter() < deadline:
+        sequence += 1
+        started = time.perf_counter()
+        path, form = uploadForm(route, f"Admission Load {os.getpid()}-{worker}-{sequence}")
+        try:
+            response = await client.post(path, files={"image": ("load.jpg", image, "image/jpeg")}, data=form,
+                                         headers={"X-Forwarded-For": f"10.2.0.{worker % 250}"})
+            statuses[response.status_code] += 1
+        except httpx.HTTPError as exc:
+            statuses[type(exc).__name__] += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code in (429, 503):
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")) * rng.uniform(0.5, 1.0))
+
+
+async def greedy(client: httpx.AsyncClient, deadline: float, statuses: Counter):
+    # One client hammering reads with no back-off; its token bucket should stop it, not the others
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get("/restaurants/", params={"limit": 20}, headers={"X-Forwarded-For": "10.3.0.1"})
+            statuses[response.status_code] += 1
+        except httpx.HTTPError as exc:
+            statuses[type(exc).__name__] += 1
+
+
+async def flood(url: str, workers: range, route: str, imageKb: int, greedyConnections: int, duration: float):
+    image = placeholderImage() * max(1, imageKb * 1024 // len(placeholderImage()))
+    latencies, statuses, greedyStatuses = [], Counter(), Counter()
+    limits = httpx.Limits(max_connections=len(workers) + greedyConnections, max_keepalive_connections=len(workers) + greedyConnections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(uploader(client, worker, route, image, deadline, latencies, statuses) for worker in workers),
+                             *(greedy(client, deadline, greedyStatuses) for _ in range(greedyConnections)))
+    return latencies, statuses, greedyStatuses
+
+
+def floodProcess(url: str, workers: range, route: str, imageKb: int, greedyConnections: int, duration: float, results):
+    results.put(asyncio.run(flood(url, workers, route, imageKb, greedyConnections, duration)))
+
+
+async def phase(client: httpx.AsyncClient, args, withWrites: bool):
+    # The flood runs in separate processes so it cannot slow the measuring client's own event loop
+    readLatencies, readStatuses = [], Counter()
+    processes = []
+    if withWrites:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        for index in range(args.processes):
+            workers = range(index, args.uploaders, args.processes)
+            processes.append(context.Process(target=floodProcess, args=(
+                args.url, workers, args.upload_route, args.image_kb, args.greedy if index == 0 else 0, args.duration, results)))
+        for process in processes:
+            process.start()
+        # Let the flood build up before measuring
+        await asyncio.sleep(1)
+    await reads(client, args.read_rps, asyncio.get_running_loop().time() + args.duration - (1 if withWrites else 0), readLatencies, readStatuses)
+    label = "reads + upload flood" if withWrites else "reads alone"
+    print(f"{label:<21} reads:   {summary(readLatencies)} {dict(readStatuses)}")
+    if withWrites:
+        writeLatencies, writeStatuses, greedyStatuses = [], Counter(), Counter()
+        for _ in processes:
+            latencies, statuses, greedyCounts = await asyncio.to_thread(results.get)
+            writeLatencies += latencies
+            writeStatuses.update(statuses)
+            greedyStatuses.update(greedyCounts)
+        for process in processes:
+            process.join()
+        print(f"{'':<21} uploads: {summary(writeLatencies)} {dict(writeStatuses)}")
+        print(f"{'':<21} greedy client: {dict(greedyStatuses)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Read latency with and without a flood of uploads, to check admission control keeps reads fast. "
+                                                 "Start the server with ADMISSION_CLIENT_RATE=50 ADMISSION_CLIENT_HEADER=X-Forwarded-For so clients are told apart; "
+                                                 "run once more with ADMISSION_ENABLED=false to compare.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per phase")
+    parser.add_argument("--read-rps", type=float, default=200)
+    parser.add_argument("--uploaders", type=int, default=64, help="concurrent upload clients in the flood")
+    parser.add_argument("--upload-route", choices=("restaurants", "menu"), default="restaurants",
+                        help="restaurants: new restaurants, which also invalidate the cached listing the reads hit; menu: menu photos")
+    parser.add_argument("--image-kb", type=int, default=2048, help="size of each uploaded image")
+    parser.add_argument("--greedy", type=int, default=4, help="connections of one client reading with no back-off")
+    parser.add_argument("--processes", type=int, default=4, help="processes generating the flood")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=500, max_keepalive_connections=500)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120) as client:
+        if args.upload_route == "menu":
+            path, form = uploadForm("restaurants", FLOOD_RESTAURANT)
+            await client.post(path, files={"image": ("load.jpg", placeholderImage(), "image/jpeg")}, data=form)
+        await phase(client, args, withWrites=False)
+        await phase(client, args, withWrites=True)
+        response = await client.get("/admission/stats")
+        if response.status_code == 200:
+            for route, stats in response.json()["routes"].items():
+                if route in ("GET /restaurants/", "POST /restaurants/", "POST /menu/"):
+                    print(f"server {route}: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+import orjson
+
+
+def menuRows(restaurantName: str, count: int) -> bytes:
+    return b"".join(
+        orjson.dumps({
+            "name": f"item-{index}",
+            "restaurantName": restaurantName,
+            "menu_type": "Veg" if index % 2 else "Non-Veg",
+            "description": f"house special number {index}",
+            "price": 50 + index % 200,
+            "imageUrl": "/static/placeholder.jpg",
+        }) + b"\n"
+        for index in range(count)
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure /bulk/menu throughput against a running API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--files", type=int, default=1, help="number of files uploaded in parallel")
+    args = parser.parse_args()
+
+    restaurantNames = [f"bench-{uuid.uuid4().hex[:8]}" for _ in range(args.files)]
+    payloads = [menuRows(restaurantName, args.rows // args.files) for restaurantName in restaurantNames]
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=600) as client:
+        async def upload(payload):
+            response = await client.post("/bulk/menu", files={"file": ("menu.ndjson", payload, "application/x-ndjson")})
+            response.raise_for_status()
+            return response.json()
+
+        started = time.perf_counter()
+        reports = await asyncio.gather(*(upload(payload) for payload in payloads))
+        elapsed = time.perf_counter() - started
+
+    inserted = sum(report["inserted"] for report in reports)
+    failed = sum(report["failed"] for report in reports)
+    print(f"rows={args.rows} files={args.files} inserted={inserted} failed={failed} {elapsed:.2f}s "
+          f"{inserted / elapsed * 60:.0f} rows/min")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+import hashlib
+import io
+import os
+import random
+from datetime import datetime
+
+ADJECTIVES = ["Spicy", "Golden", "Campus", "Royal", "Green", "Urban", "Midnight", "Tasty", "Happy", "Desi"]
+KITCHENS = ["Dhaba", "Kitchen", "Canteen", "Cafe", "Bistro", "Grill", "Tiffins", "Biryani House", "Bakery", "Juice Bar"]
+DISHES = ["Paneer Tikka", "Masala Dosa", "Veg Biryani", "Chicken Roll", "Cold Coffee", "Aloo Paratha",
+          "Chole Bhature", "Egg Maggi", "Hakka Noodles", "Veg Momos", "Butter Chicken", "Filter Coffee"]
+OPENING_TIMES = ["07:00 AM", "08:30 AM", "09:00 AM", "11:00 AM", "05:00 PM", "12:00 AM"]
+CLOSING_TIMES = ["03:00 PM", "09:00 PM", "10:30 PM", "11:45 PM", "02:00 AM", "12:00 AM"]
+CHUNK_SIZE = 10000
+
+# Presets for seed/run; explicit --restaurants/--menu-items/--ratings/--users flags override them.
+# "small" keeps the in-memory Motor stand-in responsive, since it scans collections linearly.
+PRESETS = {
+    "small": {"restaurants": 100, "menuItems": 20, "ratings": 100000, "users": 1000},
+    "campus": {"restaurants": 1000, "menuItems": 100, "ratings": 1000000, "users": 10000},
+}
+
+
+def placeholderImage() -> bytes:
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + b"\x00" * 1020
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), (200, 120, 40)).save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+class Catalog:
+    # Everything is derived from the seed, so a run against an already seeded server
+    # regenerates the same names without reading them back
+    def __init__(self, restaurants: int, menuItems: int, ratings: int, users: int, seed: int):
+        self.sizes = {"restaurants": restaurants, "menuItems": menuItems, "ratings": ratings, "users": users}
+        self.seed = seed
+        rng = random.Random(seed)
+        self.restaurantNames = [f"{rng.choice(ADJECTIVES)} {rng.choice(KITCHENS)} {index}" for index in range(restaurants)]
+        self.menuNames = [f"{rng.choice(DISHES)} {index}" for index in range(menuItems)]
+        self.hours = [(rng.choice(OPENING_TIMES), rng.choice(CLOSING_TIMES)) for _ in range(restaurants)]
+        self.searchTerms = sorted({word[:4].lower() for name in self.restaurantNames for word in name.split()[:2]})
+        self.image = placeholderImage()
+        self.imageName = hashlib.sha256(self.image).hexdigest() + ".jpg"
+        self.imageUrl = f"/static/{self.imageName}"
+
+    def restaurantDocuments(self):
+        rng = random.Random(f"{self.seed}:restaurants")
+        for index, name in enumerate(self.restaurantNames):
+            opening, closing = self.hours[index]
+            document = {
+                "name": name,
+                "phone_number": f"98{index:08d}",
+                "restaurant_type": rng.choice(["Veg", "Non-Veg", "Both"]),
+                "rating": round(rng.uniform(2.5, 5), 1),
+                "imageUrl": self.imageUrl,
+            }
+            openingTime = datetime.strptime(opening, '%I:%M %p')
+            closingTime = datetime.strptime(closing, '%I:%M %p')
+            document["opening_time"], document["closing_time"] = opening, closing
+            document["openingMinute"] = openingTime.hour * 60 + openingTime.minute
+            document["closingMinute"] = closingTime.hour * 60 + closingTime.minute
+            yield document
+
+    def menuDocuments(self):
+        rng = random.Random(f"{self.seed}:menu")
+        for restaurantName in self.restaurantNames:
+            for name in self.menuNames:
+                yield {
+                    "name": name,
+                    "restaurantName": restaurantName,
+                    "menu_type": rng.choice(["Veg", "Non-Veg"]),
+                    "description": f"{name.rsplit(' ', 1)[0]} made fresh at {restaurantName}",
+                    "price": rng.randrange(20, 400, 5),
+                    "imageUrl": self.imageUrl,
+                }
+
+    def ratingDocuments(self):
+        # Ratings are stored as running totals, so N ratings become per-restaurant sums
+        rng = random.Random(f"{self.seed}:ratings")
+        count = len(self.restaurantNames)
+        for index, restaurantName in enumerate(self.restaurantNames):
+            numRatings = self.sizes["ratings"] // count + (1 if index < self.sizes["ratings"] % count else 0)
+            if numRatings:
+                yield {"restaurantName": restaurantName, "numRatings": numRatings,
+                       "ratingSum": round(numRatings * rng.uniform(2.5, 5), 2)}
+
+    def userDocuments(self):
+        for index in range(self.sizes["users"]):
+            yield {"email": f"student{index}@campus.example"}
+
+
+async def insertChunks(collection, documents) -> int:
+    inserted = 0
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) == CHUNK_SIZE:
+            inserted += len((await collection.insert_many(chunk, ordered=False)).inserted_ids)
+            chunk = []
+    if chunk:
+        inserted += len((await collection.insert_many(chunk, ordered=False)).inserted_ids)
+    return inserted
+
+
+async def seedCatalog(db, catalog: Catalog, constants, staticDirectory=None) -> dict:
+    # Replaces the four collections in db; never point this at a database you want to keep
+    collections = {
+        "restaurants": (constants.RestaurantCollectionName, catalog.restaurantDocuments()),
+        "menuItems": (constants.RestaurantMenuCollectionName, catalog.menuDocuments()),
+        "ratings": (constants.RatingsCollectionName, catalog.ratingDocuments()),
+        "users": (constants.UsersCollectionName, catalog.userDocuments()),
+    }
+    counts = {}
+    for key, (collectionName, documents) in collections.items():
+        await db[collectionName].drop()
+        counts[key] = await insertChunks(db[collectionName], documents)
+    if staticDirectory is not None:
+        with open(os.path.join(staticDirectory, catalog.imageName), "wb") as out_file:
+            out_file.write(catalog.image)
+    return counts
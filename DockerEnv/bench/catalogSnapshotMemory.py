@@ -0,0 +1,107 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import orjson
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from catalog import Catalog, PRESETS  # noqa: E402
+from catalogSnapshot import SnapshotStore  # noqa: E402
+
+
+def catalogRecords(catalog: Catalog):
+    # The same records main.loadCatalog builds, without a database in between
+    restaurants = []
+    for document in catalog.restaurantDocuments():
+        objectId = ObjectId()
+        restaurants.append((objectId, document["name"], orjson.dumps({**document, "id": str(objectId), "imageVariants": None})))
+    menus = {}
+    for document in catalog.menuDocuments():
+        objectId = ObjectId()
+        record = orjson.dumps({**document, "id": str(objectId), "imageVariants": None})
+        menus.setdefault(document["restaurantName"], []).append((objectId, document["menu_type"], document["price"], record))
+    ratings = {document["restaurantName"]: [document["ratingSum"], document["numRatings"]] for document in catalog.ratingDocuments()}
+    return restaurants, menus, ratings
+
+
+def memory() -> dict:
+    # Pss splits shared pages between the processes mapping them; private pages are this worker's alone
+    values = {}
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                values[key] = int(rest.split()[0])
+    return {"rssMB": values["Rss"] / 1024, "pssMB": values["Pss"] / 1024,
+            "privateMB": (values["Private_Clean"] + values["Private_Dirty"]) / 1024}
+
+
+def worker(mode: str, directory: str, results, done):
+    snapshot = SnapshotStore(directory, 0.2).current()
+    started = time.perf_counter()
+    if mode == "snapshot":
+        pages = [snapshot.menuPage(name, None, None)[0] for name in snapshot.menus]
+    else:
+        # What each worker holds when it caches the catalog itself: parsed objects, serialized per request
+        menus = {name: orjson.loads(b"[" + snapshot.menuPage(name, None, None)[0] + b"]") for name in snapshot.menus}
+        restaurants = {name: orjson.loads(snapshot.restaurant(name)) for name in snapshot.restaurantNames}
+        snapshot = None
+        pages = [orjson.dumps(items) for items in menus.values()] + [orjson.dumps(restaurant) for restaurant in restaurants.values()]
+    elapsed = time.perf_counter() - started
+    del pages
+    results.put({"seconds": elapsed, **memory()})
+    # Stay alive until every worker has measured, so shared pages are counted across all of them
+    done.wait()
+
+
+def run(mode: str, directory: str, workers: int):
+    context = multiprocessing.get_context("spawn")
+    results, done = context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(mode, directory, results, done)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker memory with a shared catalog snapshot versus a per-worker catalog copy")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="campus")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--directory", help="snapshot directory; defaults to a temporary one")
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix="catalog-bench-")
+    sizes = PRESETS[args.preset]
+    catalog = Catalog(sizes["restaurants"], sizes["menuItems"], sizes["ratings"], sizes["users"], seed=1)
+    started = time.perf_counter()
+    restaurants, menus, ratings = catalogRecords(catalog)
+    SnapshotStore(directory, 0.2).publish(1, restaurants, menus, ratings)
+    snapshotBytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".snap"))
+    print(f"snapshot of {len(restaurants)} restaurants, {sum(len(items) for items in menus.values())} menu items: "
+          f"{snapshotBytes / 1024 / 1024:.1f} MB built in {time.perf_counter() - started:.1f}s")
+    try:
+        for workers in args.workers:
+            for mode in ("copy", "snapshot"):
+                measured = run(mode, directory, workers)
+                pss = sum(result["pssMB"] for result in measured)
+                private = max(result["privateMB"] for result in measured)
+                seconds = max(result["seconds"] for result in measured)
+                print(f"{mode:<9} workers={workers:<2} total PSS={pss:7.1f} MB  max private/worker={private:6.1f} MB  "
+                      f"render every menu={seconds * 1000:7.1f} ms")
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from dispatch import DispatchEngine, Order, distance  # noqa: E402
+
+
+class Campus:
+    # Buildings scattered over a square campus; restaurants sit in some of them. Popular
+    # restaurants get most orders, as at lunchtime.
+    def __init__(self, seed: int, size: float, buildings: int, restaurants: int):
+        rng = random.Random(f"{seed}:campus")
+        self.size = size
+        self.buildings = [(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(buildings)]
+        self.restaurants = [(f"Restaurant {index}", rng.choice(self.buildings)) for index in range(restaurants)]
+        self.popularity = [1 / (rank + 1) for rank in range(restaurants)]
+
+    def order(self, rng: random.Random, orderId: int) -> Order:
+        name, pickup = rng.choices(self.restaurants, self.popularity)[0]
+        building = rng.choice(self.buildings)
+        # Drop-offs are building entrances, a few metres either way
+        dropoff = (building[0] + rng.uniform(-15, 15), building[1] + rng.uniform(-15, 15))
+        return Order(orderId, name, pickup, dropoff)
+
+
+class Simulation:
+    # Deterministic for a given seed: one-second ticks, orders arriving as a Poisson process
+    # and runners moving at a fixed speed towards their next stop
+    def __init__(self, args, campus: Campus, engine: DispatchEngine):
+        self.args = args
+        self.campus = campus
+        self.engine = engine
+        self.rng = random.Random(f"{args.seed}:orders")
+        self.readyAt = {}
+        self.deliveryTimes = []
+        self.travelled = 0.0
+        self.engineSeconds = 0.0
+        self.engineCalls = 0
+
+    def timed(self, call, *args):
+        started = time.perf_counter()
+        result = call(*args)
+        self.engineSeconds += time.perf_counter() - started
+        self.engineCalls += 1
+        return result
+
+    def run(self):
+        rng = random.Random(f"{self.args.seed}:runners")
+        for runnerId in range(self.args.runners):
+            self.timed(self.engine.addRunner, runnerId, rng.choice(self.campus.buildings))
+        orderId = 0
+        for second in range(self.args.duration):
+            arrivals = self.poisson(self.args.orders_per_second) if second < self.args.duration - self.args.drain else 0
+            for _ in range(arrivals):
+                order = self.campus.order(self.rng, orderId)
+                self.readyAt[orderId] = second
+                self.timed(self.engine.addOrder, order)
+                orderId += 1
+            self.step(second)
+            if second % self.args.rebalance_every == 0:
+                self.timed(self.engine.rebalance)
+        return orderId
+
+    def poisson(self, rate: float) -> int:
+        # Knuth's method; fine for the small per-second rates simulated here
+        limit, product, count = pow(2.718281828459045, -rate), self.rng.random(), 0
+        while product > limit:
+            product *= self.rng.random()
+            count += 1
+        return count
+
+    def step(self, second: int):
+        for runner in list(self.engine.runners.values()):
+            batch = runner.batch
+            if batch is None:
+                continue
+            budget = self.args.speed
+            position = runner.position
+            while budget > 0 and runner.batch is batch and batch.orders:
+                target = batch.pickup if not batch.pickedUp else batch.orders[0].dropoff
+                gap = distance(position, target)
+                if gap > budget:
+                    position = (position[0] + (target[0] - position[0]) * budget / gap,
+                                position[1] + (target[1] - position[1]) * budget / gap)
+                    self.travelled += budget
+                    break
+                position = target
+                budget -= gap
+                self.travelled += gap
+                runner.position = position
+                if not batch.pickedUp:
+                    self.timed(self.engine.pickedUp, runner.id)
+                else:
+                    delivered = batch.orders[0].id
+                    self.deliveryTimes.append(second - self.readyAt.pop(delivered))
+                    self.timed(self.engine.deliver, runner.id, delivered)
+            self.timed(self.engine.moveRunner, runner.id, position)
+
+
+def burst(args, campus: Campus, cellSize: float, capacity: int):
+    # Hundreds of orders become ready at once (the noon rush) with every runner idle:
+    # how long does the engine take to place them all?
+    rng = random.Random(f"{args.seed}:burst")
+    engine = DispatchEngine(cellSize=cellSize, batchRadius=args.batch_radius, capacity=capacity)
+    for runnerId in range(args.runners):
+        engine.addRunner(runnerId, rng.choice(campus.buildings))
+    orders = [campus.order(rng, orderId) for orderId in range(args.burst)]
+    started = time.perf_counter()
+    for order in orders:
+        engine.addOrder(order)
+    elapsed = time.perf_counter() - started
+    return elapsed, engine.stats()
+
+
+def simulate(args, campus: Campus, cellSize: float, capacity: int):
+    engine = DispatchEngine(cellSize=cellSize, batchRadius=args.batch_radius, capacity=capacity, rebalanceGain=args.rebalance_gain)
+    simulation = Simulation(args, campus, engine)
+    placed = simulation.run()
+    stats = engine.stats()
+    times = simulation.deliveryTimes
+    return {
+        "orders": placed,
+        "delivered": stats["delivered"],
+        "batched": stats["batchedAssignments"] / max(1, stats["assignments"]),
+        "metresPerOrder": simulation.travelled / max(1, stats["delivered"]),
+        "medianMinutes": statistics.median(times) / 60 if times else 0.0,
+        "p95Minutes": sorted(times)[int(len(times) * 0.95) - 1] / 60 if times else 0.0,
+        "engineMicros": simulation.engineSeconds / max(1, simulation.engineCalls) * 1e6,
+        "reassignments": stats["reassignments"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic dispatch simulation and assignment throughput benchmark")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--campus-size", type=float, default=2000, help="metres per side")
+    parser.add_argument("--buildings", type=int, default=120)
+    parser.add_argument("--restaurants", type=int, default=25)
+    parser.add_argument("--runners", type=int, default=150)
+    parser.add_argument("--orders-per-second", type=float, default=0.6, help="peak arrival rate")
+    parser.add_argument("--duration", type=int, default=7200, help="simulated seconds")
+    parser.add_argument("--drain", type=int, default=1800, help="final seconds with no new orders")
+    parser.add_argument("--speed", type=float, default=4.0, help="runner speed in m/s")
+    parser.add_argument("--cell-size", type=float, default=100.0)
+    parser.add_argument("--batch-radius", type=float, default=150.0)
+    parser.add_argument("--capacity", type=int, default=3, help="orders per runner trip")
+    parser.add_argument("--rebalance-every", type=int, default=10, help="simulated seconds between rebalances")
+    parser.add_argument("--rebalance-gain", type=float, default=200.0)
+    parser.add_argument("--burst", type=int, default=500, help="orders made ready at once for the throughput benchmark")
+    args = parser.parse_args()
+
+    campus = Campus(args.seed, args.campus_size, args.buildings, args.restaurants)
+    # A cell as large as the campus is a linear scan, which is the baseline for the grid
+    variants = [("grid", args.cell_size, args.capacity), ("linear scan", args.campus_size * 2, args.capacity),
+                ("no batching", args.cell_size, 1)]
+    for label, cellSize, capacity in variants:
+        elapsed, stats = burst(args, campus, cellSize, capacity)
+        print(f"burst {label:<12} {args.burst} orders, {args.runners} runners: {elapsed * 1000:7.1f} ms "
+              f"({args.burst / elapsed:8.0f} assignments/s) assigned={stats['assignments']} waiting={stats['waitingOrders']}")
+    for label, cellSize, capacity in variants:
+        result = simulate(args, campus, cellSize, capacity)
+        print(f"sim   {label:<12} orders={result['orders']} delivered={result['delivered']} batched={result['batched']:.0%} "
+              f"distance/order={result['metresPerOrder']:.0f} m delivery median={result['medianMinutes']:.1f} min "
+              f"p95={result['p95Minutes']:.1f} min engine={result['engineMicros']:.1f} us/call reassigned={result['reassignments']}")
+
+
+if __name__ == "__main__":
+    main()
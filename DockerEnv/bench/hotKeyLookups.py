@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import placeholderImage  # noqa: E402
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return f"p50={latencies[len(latencies) // 2]:.0f}ms p99={latencies[max(0, int(len(latencies) * 0.99) - 1)]:.0f}ms max={latencies[-1]:.0f}ms"
+
+
+async def mongoFinds(client: httpx.AsyncClient) -> int:
+    # find commands MongoDB has answered for this worker, from the command monitoring histogram
+    response = await client.get("/metrics")
+    if response.status_code != 200:
+        return 0
+    return sum(int(float(line.rsplit(" ", 1)[1])) for line in response.text.splitlines()
+               if line.startswith("mongodb_command_duration_seconds_count{") and 'command="find"' in line)
+
+
+async def wave(client: httpx.AsyncClient, path: str, concurrency: int, latencies: list):
+    async def one():
+        started = time.perf_counter()
+        response = await client.get(path)
+        latencies.append((time.perf_counter() - started) * 1000)
+        return response.status_code
+
+    return await asyncio.gather(*(one() for _ in range(concurrency)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Many clients asking for the same restaurant, menu and rating at once: "
+                                                 "how many MongoDB queries reach the database per request. "
+                                                 "Run once more with SINGLE_FLIGHT_TTL_SECONDS=0 to see coalescing alone.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=200, help="identical requests sent at once")
+    parser.add_argument("--waves", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between waves")
+    args = parser.parse_args()
+
+    name = f"Hot Key {uuid.uuid4().hex[:8]}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        form = {"name": name, "phone_number": "9800000000", "restaurant_type": "Veg", "opening_time": "09:00 AM", "closing_time": "10:00 PM"}
+        (await client.post("/restaurants/", files={"image": ("hot.jpg", placeholderImage(), "image/jpeg")}, data=form)).raise_for_status()
+        form = {"name": "Hot Dish", "restaurantName": name, "menu_type": "Veg", "description": "hot key", "price": 50}
+        (await client.post("/menu/", files={"image": ("hot.jpg", placeholderImage(), "image/jpeg")}, data=form)).raise_for_status()
+        (await client.post("/newRating/", json={"rating": 4, "restaurantName": name})).raise_for_status()
+
+        for path in (f"/restaurants/{name}", f"/menu/{name}", f"/avgRating/{name}"):
+            before = (await client.get("/reads/coalescing")).json()
+            findsBefore = await mongoFinds(client)
+            latencies, failed = [], 0
+            for _ in range(args.waves):
+                failed += sum(status != 200 for status in await wave(client, path, args.concurrency, latencies))
+                await asyncio.sleep(args.interval)
+            after = (await client.get("/reads/coalescing")).json()
+            finds = await mongoFinds(client) - findsBefore
+            requests = args.waves * args.concurrency
+            fetches = after["fetches"] - before["fetches"]
+            print(f"{path.replace(name, '{name}'):<20} {requests} requests ({failed} failed) {summary(latencies)}")
+            # With several workers these counters are whichever worker answered /reads/coalescing
+            print(f"{'':<20} server: fetches={fetches} coalesced={after['coalesced'] - before['coalesced']} "
+                  f"hits={after['hits'] - before['hits']} mongo finds={finds} -> {requests / max(1, fetches):.0f} requests per query")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
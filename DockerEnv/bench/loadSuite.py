@@ -0,0 +1,486 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+import orjson
+
+from catalog import PRESETS, Catalog, seedCatalog
+
+BENCH_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPO_DIRECTORY = os.path.join(BENCH_DIRECTORY, "..", "..")
+TARGET_DIRECTORIES = {
+    "main": os.path.join(BENCH_DIRECTORY, "..", "app"),
+    "database": os.path.join(REPO_DIRECTORY, "Database"),
+}
+# App module behind each client key of a target
+TARGET_APPS = {
+    "main": {"main": "main"},
+    "database": {"restaurants": "restaurantApp", "menu": "menuApp", "ratings": "ratingsApp", "users": "userApp"},
+}
+BENCH_DATABASE = "CampusFoodDeliveryBench"
+
+
+class Endpoint:
+    # build(i) returns (path, request kwargs) for the i-th request; requests are replayed in order.
+    # rpsScale lowers the rate for endpoints where one request carries many rows.
+    def __init__(self, name: str, method: str, build, app: str = "main", rpsScale: float = 1.0):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.app = app
+        self.rpsScale = rpsScale
+
+
+class RunState:
+    # Rows created by the write endpoints, so the delete endpoints have something to remove
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.runId = f"{os.getpid():x}{int(time.time()) % 100000:x}"
+        self.restaurants = []
+        self.menuItems = []
+
+    def rng(self, name: str) -> random.Random:
+        return random.Random(f"{self.catalog.seed}:{name}")
+
+    def restaurantForm(self, index: int):
+        name = f"load {self.runId} {index}"
+        self.restaurants.append(name)
+        return {"data": {"name": name, "phone_number": "9800000000", "restaurant_type": "Both",
+                         "opening_time": "09:00 AM", "closing_time": "10:00 PM"},
+                "files": {"image": ("image.jpg", self.catalog.image, "image/jpeg")}}
+
+    def menuForm(self, index: int, restaurantName: str):
+        name = f"load {self.runId} {index}"
+        self.menuItems.append((restaurantName, name))
+        return {"data": {"name": name, "restaurantName": restaurantName, "menu_type": "Veg",
+                         "description": "load test item", "price": "99"},
+                "files": {"image": ("image.jpg", self.catalog.image, "image/jpeg")}}
+
+
+def mainEndpoints(state: RunState):
+    catalog = state.catalog
+    names = catalog.restaurantNames
+    pick = lambda rng: rng.choice(names)
+    rng = {name: state.rng(name) for name in ("byName", "menu", "page", "search", "autocomplete", "rating",
+                                              "avgRating", "batch", "open", "newMenu")}
+
+    def bulkMenu(index):
+        rows = b"".join(orjson.dumps({"name": f"bulk {state.runId} {index} {row}", "restaurantName": names[index % len(names)],
+                                      "menu_type": "Veg", "description": "bulk item", "price": 50,
+                                      "imageUrl": catalog.imageUrl}) + b"\n" for row in range(100))
+        return "/bulk/menu", {"files": {"file": ("menu.ndjson", rows, "application/x-ndjson")}}
+
+    def deleteRestaurant(index):
+        return f"/restaurants/{state.restaurants.pop() if state.restaurants else 'missing'}", {}
+
+    def deleteMenu(index):
+        restaurantName, name = state.menuItems.pop() if state.menuItems else (names[0], "missing")
+        return f"/menu/{restaurantName}/{name}", {}
+
+    return [
+        Endpoint("GET /", "GET", lambda i: ("/", {})),
+        Endpoint("GET /indexes/explain", "GET", lambda i: ("/indexes/explain", {})),
+        Endpoint("GET /metrics", "GET", lambda i: ("/metrics", {})),
+        Endpoint("GET /healthz", "GET", lambda i: ("/healthz", {})),
+        Endpoint("GET /readyz", "GET", lambda i: ("/readyz", {})),
+        Endpoint("POST /restaurants/", "POST", lambda i: ("/restaurants/", state.restaurantForm(i))),
+        Endpoint("GET /restaurants/", "GET", lambda i: ("/restaurants/", {})),
+        Endpoint("GET /restaurants/?limit=50", "GET", lambda i: ("/restaurants/", {"params": {"limit": 50}})),
+        Endpoint("GET /restaurants/ ndjson", "GET", lambda i: ("/restaurants/", {"headers": {"accept": "application/x-ndjson"}})),
+        Endpoint("GET /restaurants/open", "GET", lambda i: ("/restaurants/open", {"params": {"at": f"{rng['open'].randrange(24):02d}:{rng['open'].randrange(60):02d}"}})),
+        Endpoint("GET /restaurants/top", "GET", lambda i: ("/restaurants/top", {"params": {"k": 20, **({"type": ("Veg", "Non-Veg", "Both")[i % 4]} if i % 4 < 3 else {})}})),
+        Endpoint("GET /restaurants/{name}", "GET", lambda i: (f"/restaurants/{pick(rng['byName'])}", {})),
+        Endpoint("GET /restaurants/{name}/page", "GET", lambda i: (f"/restaurants/{pick(rng['page'])}/page", {"params": {"limit": 20}})),
+        Endpoint("POST /restaurants/batch", "POST", lambda i: ("/restaurants/batch", {"json": {"names": rng['batch'].sample(names, min(20, len(names)))}})),
+        Endpoint("GET /restaurants/search/", "GET", lambda i: ("/restaurants/search/", {"params": {"query": rng['search'].choice(catalog.searchTerms), "limit": 50}})),
+        Endpoint("GET /search/autocomplete", "GET", lambda i: ("/search/autocomplete", {"params": {"q": rng['autocomplete'].choice(catalog.searchTerms)[:3]}})),
+        Endpoint("DELETE /restaurants/{name}", "DELETE", deleteRestaurant),
+        Endpoint("POST /menu/", "POST", lambda i: ("/menu/", state.menuForm(i, pick(rng['newMenu'])))),
+        Endpoint("GET /menu/{name}", "GET", lambda i: (f"/menu/{pick(rng['menu'])}", {})),
+        Endpoint("GET /menu/{name}?sort=price&fields", "GET", lambda i: (f"/menu/{pick(rng['menu'])}?menu_type=Veg&max_price=300&sort=price&fields=id,name,price&limit=20", {})),
+        Endpoint("DELETE /menu/{restaurant}/{name}", "DELETE", deleteMenu),
+        Endpoint("POST /newRating/", "POST", lambda i: ("/newRating/", {"json": {"rating": rng['rating'].randint(1, 5), "restaurantName": pick(rng['rating'])}})),
+        Endpoint("POST /orders/", "POST", lambda i: ("/orders/", {"json": {"restaurantName": names[i % len(names)], "email": "load@campus.example", "items": [{"name": state.catalog.menuNames[i % len(state.catalog.menuNames)], "quantity": 1}]}, "headers": {"Idempotency-Key": f"{state.runId}-{i}"}})),
+        Endpoint("GET /orders/queue", "GET", lambda i: ("/orders/queue", {})),
+        # Runner location pings are the most frequent dispatch write
+        Endpoint("PUT /dispatch/runners/{id}", "PUT", lambda i: (f"/dispatch/runners/{state.runId}-{i % 200}", {"json": {"x": (i * 37) % 2000, "y": (i * 91) % 2000}})),
+        Endpoint("GET /dispatch/stats", "GET", lambda i: ("/dispatch/stats", {})),
+        Endpoint("GET /ws/stats", "GET", lambda i: ("/ws/stats", {})),
+        Endpoint("GET /admission/stats", "GET", lambda i: ("/admission/stats", {})),
+        Endpoint("GET /reads/coalescing", "GET", lambda i: ("/reads/coalescing", {})),
+        Endpoint("GET /ratings/buffer", "GET", lambda i: ("/ratings/buffer", {})),
+        Endpoint("GET /catalog/snapshot", "GET", lambda i: ("/catalog/snapshot", {})),
+        Endpoint("GET /avgRating/{name}", "GET", lambda i: (f"/avgRating/{pick(rng['avgRating'])}", {})),
+        Endpoint("POST /avgRating/batch", "POST", lambda i: ("/avgRating/batch", {"json": {"names": rng['batch'].sample(names, min(20, len(names)))}})),
+        Endpoint("POST /bulk/menu", "POST", bulkMenu, rpsScale=0.05),
+        Endpoint("GET /static/{image}", "GET", lambda i: (catalog.imageUrl, {})),
+    ]
+
+
+def databaseEndpoints(state: RunState):
+    names = state.catalog.restaurantNames
+    pick = lambda rng: rng.choice(names)
+    rng = {name: state.rng(name) for name in ("byName", "menu", "search", "rating", "avgRating", "newMenu")}
+
+    def deleteRestaurant(index):
+        return f"/restaurants/{state.restaurants.pop() if state.restaurants else 'missing'}", {}
+
+    def deleteMenu(index):
+        restaurantName, name = state.menuItems.pop() if state.menuItems else (names[0], "missing")
+        return f"/menu/{restaurantName}/{name}", {}
+
+    return [
+        Endpoint("restaurantApp GET /", "GET", lambda i: ("/", {}), "restaurants"),
+        Endpoint("restaurantApp GET /healthz", "GET", lambda i: ("/healthz", {}), "restaurants"),
+        Endpoint("restaurantApp GET /readyz", "GET", lambda i: ("/readyz", {}), "restaurants"),
+        Endpoint("restaurantApp POST /restaurants/", "POST", lambda i: ("/restaurants/", state.restaurantForm(i)), "restaurants"),
+        Endpoint("restaurantApp GET /restaurants/", "GET", lambda i: ("/restaurants/", {}), "restaurants"),
+        Endpoint("restaurantApp GET /restaurants/{name}", "GET", lambda i: (f"/restaurants/{pick(rng['byName'])}", {}), "restaurants"),
+        Endpoint("restaurantApp GET /restaurants/search/", "GET", lambda i: ("/restaurants/search/", {"params": {"query": rng['search'].choice(state.catalog.searchTerms)}}), "restaurants"),
+        Endpoint("restaurantApp DELETE /restaurants/{name}", "DELETE", deleteRestaurant, "restaurants"),
+        Endpoint("menuApp GET /", "GET", lambda i: ("/", {}), "menu"),
+        Endpoint("menuApp GET /readyz", "GET", lambda i: ("/readyz", {}), "menu"),
+        Endpoint("menuApp POST /menu/", "POST", lambda i: ("/menu/", state.menuForm(i, pick(rng['newMenu']))), "menu"),
+        Endpoint("menuApp GET /menu/{name}", "GET", lambda i: (f"/menu/{pick(rng['menu'])}", {}), "menu"),
+        Endpoint("menuApp DELETE /menu/{restaurant}/{name}", "DELETE", deleteMenu, "menu"),
+        Endpoint("ratingsApp GET /", "GET", lambda i: ("/", {}), "ratings"),
+        Endpoint("ratingsApp GET /readyz", "GET", lambda i: ("/readyz", {}), "ratings"),
+        Endpoint("ratingsApp POST /newRating/", "POST", lambda i: ("/newRating/", {"json": {"rating": rng['rating'].randint(1, 5), "restaurantName": pick(rng['rating'])}}), "ratings"),
+        Endpoint("ratingsApp GET /avgRating/{name}", "GET", lambda i: (f"/avgRating/{pick(rng['avgRating'])}", {}), "ratings"),
+        Endpoint("userApp GET /", "GET", lambda i: ("/", {}), "users"),
+        Endpoint("userApp GET /readyz", "GET", lambda i: ("/readyz", {}), "users"),
+        Endpoint("userApp POST /user/", "POST", lambda i: ("/user/", {"data": {"email": f"load{state.runId}{i}@campus.example"}}), "users"),
+    ]
+
+
+ENDPOINTS = {"main": mainEndpoints, "database": databaseEndpoints}
+
+
+class RssSampler:
+    # Samples VmRSS of a process from /proc while an endpoint is under load
+    def __init__(self, pid, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    def read(self):
+        if self.pid is None:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    async def _sample(self):
+        while True:
+            if (rss := self.read()) is not None:
+                self.samples.append(rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.samples = [rss] if (rss := self.read()) is not None else []
+        self.task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> dict:
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+        after = self.read()
+        if not self.samples or after is None:
+            return {"before": None, "peak": None, "after": None}
+        return {"before": round(self.samples[0], 1), "peak": round(max(self.samples + [after]), 1), "after": round(after, 1)}
+
+
+def percentile(sortedValues, fraction: float):
+    # Nearest-rank percentile
+    if not sortedValues:
+        return None
+    return sortedValues[max(0, min(len(sortedValues) - 1, int(round(fraction * len(sortedValues))) - 1))]
+
+
+async def runEndpoint(clients, endpoint: Endpoint, rps: float, duration: float, warmup: int, pid) -> dict:
+    client = clients[endpoint.app]
+    rps = rps * endpoint.rpsScale
+    loop = asyncio.get_running_loop()
+    for index in range(warmup):
+        path, kwargs = endpoint.build(-1 - index)
+        with contextlib.suppress(httpx.HTTPError):
+            await client.request(endpoint.method, path, **kwargs)
+
+    latencies = []
+    statuses = Counter()
+
+    async def send(index, scheduledAt):
+        path, kwargs = endpoint.build(index)
+        try:
+            response = await client.request(endpoint.method, path, **kwargs)
+            statuses[str(response.status_code)] += 1
+        except httpx.HTTPError as exc:
+            statuses[type(exc).__name__] += 1
+        # Measured from when the request was due, not when it was sent, so a backed-up
+        # server cannot hide queueing delay (no coordinated omission)
+        latencies.append((loop.time() - scheduledAt) * 1000)
+
+    sampler = RssSampler(pid)
+    sampler.start()
+    total = max(1, int(rps * duration))
+    started = loop.time()
+    tasks = []
+    for index in range(total):
+        scheduledAt = started + index / rps
+        if (delay := scheduledAt - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(index, scheduledAt)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+    memory = await sampler.stop()
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+    return {
+        "method": endpoint.method,
+        "requests": total,
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "targetRps": rps,
+        "throughput": round(total / elapsed, 1),
+        "latencyMs": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2),
+            "mean": round(sum(latencies) / len(latencies), 2),
+        },
+        "rssMiB": memory,
+    }
+
+
+def catalogFromArgs(args, inMemory: bool) -> Catalog:
+    sizes = dict(PRESETS[args.preset or ("small" if inMemory else "campus")])
+    for key, value in (("restaurants", args.restaurants), ("menuItems", args.menu_items),
+                       ("ratings", args.ratings), ("users", args.users)):
+        if value is not None:
+            sizes[key] = value
+    return Catalog(sizes["restaurants"], sizes["menuItems"], sizes["ratings"], sizes["users"], args.seed)
+
+
+def importTarget(target: str):
+    # The targets ship modules with the same names (constants), so only one is imported per process
+    sys.path.insert(0, os.path.abspath(TARGET_DIRECTORIES[target]))
+    import constants as constants
+    return constants
+
+
+def gitRevision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIRECTORY,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCH_DIRECTORY,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def motorDatabase(mongo: str, database: str):
+    if mongo == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()[database]
+    import motor.motor_asyncio
+    return motor.motor_asyncio.AsyncIOMotorClient(mongo)[database]
+
+
+@contextlib.asynccontextmanager
+async def inProcessClients(target: str, db):
+    # Runs the target apps inside this process on the given database, lifespans included
+    clients = {}
+    async with contextlib.AsyncExitStack() as stack:
+        for key, moduleName in TARGET_APPS[target].items():
+            module = __import__(moduleName)
+            module.client = db.client
+            module.db = db
+            await stack.enter_async_context(module.app.router.lifespan_context(module.app))
+            # App exceptions become 500s and are counted as errors instead of ending the run
+            transport = httpx.ASGITransport(app=module.app, raise_app_exceptions=False)
+            clients[key] = await stack.enter_async_context(httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60))
+        yield clients
+
+
+@contextlib.asynccontextmanager
+async def externalClients(target: str, urls):
+    clients = {}
+    async with contextlib.AsyncExitStack() as stack:
+        for key in TARGET_APPS[target]:
+            if key not in urls:
+                raise SystemExit(f"--url {key}=http://... is required for the {target} target")
+            clients[key] = await stack.enter_async_context(
+                httpx.AsyncClient(base_url=urls[key], timeout=60, limits=httpx.Limits(max_connections=1000)))
+        yield clients
+
+
+def parseUrls(values, target: str) -> dict:
+    urls = {}
+    for value in values or []:
+        if "=" in value.split("://")[0]:
+            key, url = value.split("=", 1)
+            urls[key] = url
+        else:
+            urls.update({key: value for key in TARGET_APPS[target]})
+    return urls
+
+
+async def seedCommand(args):
+    constants = importTarget(args.target)
+    catalog = catalogFromArgs(args, inMemory=False)
+    db = motorDatabase(args.mongo, args.database)
+    counts = await seedCatalog(db, catalog, constants, args.static)
+    if args.target == "main":
+        from indexes import ensureIndexes
+        await ensureIndexes(db)
+    print(f"seeded {args.database}, documents per collection: {counts}")
+    print("Start (or restart) the API after seeding so its in-memory indexes include the catalog")
+
+
+async def runCommand(args):
+    external = bool(args.url)
+    workingDirectory = os.getcwd()
+    inMemory = not external and args.mongo == "memory"
+    catalog = catalogFromArgs(args, inMemory)
+    constants = importTarget(args.target)
+    if external:
+        backend = "external"
+        pid = args.pid
+        clientContext = externalClients(args.target, parseUrls(args.url, args.target))
+    else:
+        backend = "memory" if inMemory else "mongodb"
+        pid = os.getpid()
+        # The apps mount ./static, so they run from a scratch directory that has one
+        os.chdir(tempfile.mkdtemp(prefix="loadSuite-"))
+        os.mkdir("static")
+        db = motorDatabase(args.mongo, args.database)
+        started = time.perf_counter()
+        counts = await seedCatalog(db, catalog, constants, "static")
+        print(f"seeded {backend} catalog, documents per collection {counts}, in {time.perf_counter() - started:.1f}s")
+        clientContext = inProcessClients(args.target, db)
+
+    state = RunState(catalog)
+    endpoints = [endpoint for endpoint in ENDPOINTS[args.target](state)
+                 if args.only is None or re.search(args.only, endpoint.name)]
+    commit, dirty = gitRevision()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "createdAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": args.target,
+        "backend": backend,
+        "python": platform.python_version(),
+        "catalog": {**catalog.sizes, "seed": catalog.seed},
+        "load": {"rps": args.rps, "duration": args.duration, "warmup": args.warmup},
+        "endpoints": {},
+    }
+    async with clientContext as clients:
+        for endpoint in endpoints:
+            result = await runEndpoint(clients, endpoint, args.rps, args.duration, args.warmup, pid)
+            report["endpoints"][endpoint.name] = result
+            latency = result["latencyMs"]
+            print(f"{endpoint.name:<48} {result['throughput']:>8.1f} req/s p50={latency['p50']:>8.2f}ms "
+                  f"p95={latency['p95']:>8.2f}ms p99={latency['p99']:>8.2f}ms errors={result['errors']} "
+                  f"rss={result['rssMiB']['peak']}MiB")
+
+    output = args.output or os.path.join(workingDirectory, f"loadSuite-{args.target}-{backend}-{commit or 'nogit'}.json")
+    with open(output, "w") as out_file:
+        json.dump(report, out_file, indent=2)
+    print(f"wrote {output}")
+
+
+def compareCommand(args):
+    with open(args.baseline) as baselineFile, open(args.candidate) as candidateFile:
+        baseline, candidate = json.load(baselineFile), json.load(candidateFile)
+    print(f"baseline {baseline['commit']} ({baseline['backend']})  candidate {candidate['commit']} ({candidate['backend']})")
+    if baseline["catalog"] != candidate["catalog"] or baseline["load"] != candidate["load"]:
+        print("warning: catalog or load settings differ between the two runs")
+    regressions = []
+    for name, new in candidate["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            print(f"{name:<48} new endpoint")
+            continue
+        changes = []
+        for key in ("p50", "p95", "p99"):
+            before, after = old["latencyMs"][key], new["latencyMs"][key]
+            change = (after - before) / before * 100 if before else 0.0
+            changes.append(f"{key} {before:.2f}->{after:.2f}ms ({change:+.0f}%)")
+            if key == "p95" and change > args.threshold:
+                regressions.append(name)
+        changes.append(f"throughput {old['throughput']}->{new['throughput']}")
+        print(f"{name:<48} " + "  ".join(changes))
+    if regressions:
+        print(f"p95 regressed by more than {args.threshold}%: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+def addCatalogArguments(parser):
+    parser.add_argument("--target", choices=sorted(TARGET_APPS), default="main",
+                        help="main = DockerEnv/app/main.py, database = the Database/*App.py services")
+    parser.add_argument("--preset", choices=sorted(PRESETS),
+                        help="catalog size; defaults to small in memory and campus against mongod")
+    parser.add_argument("--restaurants", type=int)
+    parser.add_argument("--menu-items", type=int, help="menu items per restaurant")
+    parser.add_argument("--ratings", type=int, help="total ratings, stored as per-restaurant totals")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--seed", type=int, default=1, help="random seed for names and traffic")
+    parser.add_argument("--database", default=BENCH_DATABASE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a synthetic campus catalog and load test every route")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed = commands.add_parser("seed", help="seed a mongod for runs against an external server")
+    addCatalogArguments(seed)
+    seed.add_argument("--mongo", default="mongodb://localhost:27017/")
+    seed.add_argument("--static", help="the API's static directory, to place the catalog image in")
+
+    run = commands.add_parser("run", help="replay traffic at a fixed rate against each endpoint in turn")
+    addCatalogArguments(run)
+    run.add_argument("--mongo", default="memory", help="'memory' for the in-process Motor stand-in, or a mongod URL")
+    run.add_argument("--url", action="append",
+                     help="test a running server instead: URL, or app=URL per Database app (restaurants, menu, ratings, users)")
+    run.add_argument("--pid", type=int, help="server process to sample memory from when using --url")
+    run.add_argument("--rps", type=float, default=50)
+    run.add_argument("--duration", type=float, default=5, help="seconds per endpoint")
+    run.add_argument("--warmup", type=int, default=10, help="requests per endpoint before measuring")
+    run.add_argument("--only", help="regex on endpoint names")
+    run.add_argument("--output", help="JSON results path")
+
+    compare = commands.add_parser("compare", help="diff two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=10, help="p95 regression percentage that fails the comparison")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compareCommand(args)
+    else:
+        asyncio.run(seedCommand(args) if args.command == "seed" else runCommand(args))
+
+
+if __name__ == "__main__":
+    main()
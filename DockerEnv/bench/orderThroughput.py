@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from catalog import placeholderImage  # noqa: E402
+
+MENU = [("Masala Dosa", 60), ("Filter Coffee", 20), ("Veg Biryani", 120), ("Paneer Roll", 80), ("Cold Coffee", 50)]
+
+
+async def seedRestaurant(client: httpx.AsyncClient, name: str):
+    # A restaurant of its own per run, created through the API so any server can be benchmarked
+    image = {"image": ("order-bench.jpg", placeholderImage(), "image/jpeg")}
+    response = await client.post("/restaurants/", files=image, data={
+        "name": name, "phone_number": "9800000000", "restaurant_type": "Veg", "opening_time": "12:00 AM", "closing_time": "11:59 PM"})
+    response.raise_for_status()
+    for itemName, price in MENU:
+        response = await client.post("/menu/", files=image, data={
+            "name": itemName, "restaurantName": name, "menu_type": "Veg", "description": "order benchmark", "price": price})
+        response.raise_for_status()
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.placed = set()
+        self.perSecond = Counter()
+        self.replays = 0
+        self.replayMismatches = 0
+
+
+async def customer(client: httpx.AsyncClient, index: int, restaurant: str, runId: str, deadline: float,
+                   retryRate: float, results: Results, started: float):
+    rng = random.Random(index)
+    sequence = 0
+    while time.perf_counter() < deadline:
+        sequence += 1
+        key = f"{runId}-{index}-{sequence}"
+        body = {"restaurantName": restaurant, "email": f"student{index}@campus.example",
+                "items": [{"name": name, "quantity": rng.randint(1, 3)} for name, _ in rng.sample(MENU, rng.randint(1, 3))]}
+        while True:
+            requestStarted = time.perf_counter()
+            try:
+                response = await client.post("/orders/", json=body, headers={"Idempotency-Key": key})
+            except httpx.HTTPError as exc:
+                results.statuses[type(exc).__name__] += 1
+                break
+            results.statuses[response.status_code] += 1
+            if response.status_code != 503:
+                break
+            # Backpressure: honour Retry-After and resend the same order with the same key
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")) * rng.uniform(0.5, 1.5))
+        if response.status_code != 201:
+            continue
+        finished = time.perf_counter()
+        results.latencies.append((finished - requestStarted) * 1000)
+        results.placed.add(key)
+        results.perSecond[int(finished - started)] += 1
+        if rng.random() < retryRate:
+            # A client that never saw the 201: the retry must return the same order, not a new one
+            replay = await client.post("/orders/", json=body, headers={"Idempotency-Key": key})
+            results.replays += 1
+            if replay.status_code != 200 or replay.json()["id"] != response.json()["id"]:
+                results.replayMismatches += 1
+
+
+def verify(mongo: str, database: str, runId: str):
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo)
+    try:
+        return client[database]["Orders"].count_documents({"idempotencyKey": {"$regex": f"^{runId}-"}})
+    finally:
+        client.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Sustained /orders/ throughput with many concurrent clients")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of sustained load")
+    parser.add_argument("--retry-rate", type=float, default=0.05, help="fraction of orders resent with the same key")
+    parser.add_argument("--mongo", help="mongod URL; counts the stored orders to check nothing was written twice")
+    parser.add_argument("--database", default="CampusFoodDeliverySystem")
+    args = parser.parse_args()
+
+    runId = f"bench{os.getpid():x}{int(time.time()) % 100000:x}"
+    restaurant = f"Order Bench {runId}"
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        await seedRestaurant(client, restaurant)
+        results = Results()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(customer(client, index, restaurant, runId, deadline, args.retry_rate, results, started)
+                               for index in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        queue = (await client.get("/orders/queue")).json()
+
+    latencies = sorted(results.latencies)
+    if not latencies:
+        raise SystemExit(f"no orders were placed: {dict(results.statuses)}")
+    # The first and last seconds are partial, so the sustained rate is taken from the ones in between
+    seconds = [results.perSecond[second] for second in range(1, int(args.duration) - 1)] or [len(latencies) / elapsed]
+    print(f"clients={args.clients} duration={elapsed:.1f}s orders={len(latencies)} "
+          f"throughput={len(latencies) / elapsed:.0f} orders/s (per second: min={min(seconds)} median={statistics.median(seconds):.0f})")
+    print(f"latency p50={latencies[len(latencies) // 2]:.1f}ms p95={latencies[int(len(latencies) * 0.95) - 1]:.1f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1]:.1f}ms max={latencies[-1]:.1f}ms")
+    print(f"responses {dict(results.statuses)}; replays={results.replays} mismatched={results.replayMismatches}")
+    print(f"server queue: avgBatch={queue['avgBatch']:.1f} maxBatch={queue['maxBatch']} rejected={queue['rejected']} "
+          f"avgBatchSeconds={queue['avgBatchSeconds'] * 1000:.1f}ms (this worker only)")
+    if args.mongo:
+        stored = verify(args.mongo, args.database, runId)
+        print(f"stored orders={stored} distinct keys placed={len(results.placed)} "
+              f"{'OK' if stored == len(results.placed) else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
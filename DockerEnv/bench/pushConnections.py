@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import resource
+import statistics
+import time
+from urllib.parse import quote
+
+import httpx
+import orjson
+import websockets
+
+
+async def connect(url: str, topic: str, opened: list, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        websocket = await websockets.connect(f"{url}?topics={quote(topic)}", max_size=2 ** 16, ping_interval=None)
+        # The subscription acknowledgement
+        await websocket.recv()
+    opened.append(websocket)
+
+
+async def received(websocket, started: float, latencies: list):
+    await websocket.recv()
+    latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Memory per idle /ws connection and fan-out latency of one event to all of them")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=200, help="connections opened at once")
+    parser.add_argument("--restaurant", default="Push Bench", help="every connection subscribes to restaurant:<name>; ratings to it are the fan-out event")
+    parser.add_argument("--events", type=int, default=5)
+    args = parser.parse_args()
+
+    # Every connection is a file descriptor here too
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.connections + 100:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, args.connections + 1000), hard))
+
+    wsUrl = args.url.replace("http", "ws", 1) + "/ws"
+    topic = f"restaurant:{args.restaurant}"
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        before = (await client.get("/ws/stats")).json()
+        opened = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(connect(wsUrl, topic, opened, semaphore) for _ in range(args.connections)), return_exceptions=True)
+        failed = [result for result in results if isinstance(result, BaseException)]
+        elapsed = time.perf_counter() - started
+        # Let the server settle before measuring: buffers from the handshakes are freed
+        await asyncio.sleep(2)
+        after = (await client.get("/ws/stats")).json()
+        added = after["connections"] - before["connections"]
+        perConnection = (after["residentBytes"] - before["residentBytes"]) / max(1, added)
+        print(f"opened {len(opened)} connections in {elapsed:.1f}s ({len(failed)} failed"
+              f"{': ' + type(failed[0]).__name__ if failed else ''})")
+        print(f"server connections={after['connections']} resident {before['residentBytes'] / 2 ** 20:.1f} MB -> "
+              f"{after['residentBytes'] / 2 ** 20:.1f} MB, {perConnection / 1024:.1f} KB per connection")
+
+        if not opened:
+            raise SystemExit("no connections were opened")
+        for event in range(args.events):
+            latencies = []
+            started = time.perf_counter()
+            waiting = [asyncio.create_task(received(websocket, started, latencies)) for websocket in opened]
+            await client.post("/newRating/", json={"rating": 1 + event % 5, "restaurantName": args.restaurant})
+            await asyncio.wait(waiting, timeout=30)
+            latencies.sort()
+            if latencies:
+                print(f"event {event + 1}: delivered to {len(latencies)}/{len(opened)} in {latencies[-1]:.0f} ms "
+                      f"(p50={statistics.median(latencies):.0f} ms p99={latencies[int(len(latencies) * 0.99) - 1]:.0f} ms)")
+        stats = (await client.get("/ws/stats")).json()
+        print(f"server: published={stats['published']} delivered={stats['delivered']} slowConsumers={stats['slowConsumers']} "
+              f"(this worker only)")
+        print(orjson.dumps(stats).decode())
+    await asyncio.gather(*(websocket.close() for websocket in opened), return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import random
+import uuid
+
+import httpx
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Post ratings in parallel and check that none are lost")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--ratings", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    restaurantName = f"bench-{uuid.uuid4().hex[:8]}"
+    ratings = [random.randint(0, 5) for _ in range(args.ratings)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        async def post(rating):
+            async with semaphore:
+                response = await client.post("/newRating/", json={"rating": rating, "restaurantName": restaurantName})
+                response.raise_for_status()
+
+        await asyncio.gather(*(post(rating) for rating in ratings))
+        stored = (await client.get(f"/avgRating/{restaurantName}")).json()
+
+    expectedAverage = sum(ratings) / len(ratings)
+    lost = len(ratings) - int(stored["numRatings"])
+    print(f"posted={len(ratings)} stored={int(stored['numRatings'])} lost={lost}")
+    print(f"expected avg={expectedAverage:.4f} stored avg={stored['avgRating']:.4f}")
+    if lost or abs(stored["avgRating"] - expectedAverage) > 1e-9:
+        raise SystemExit("ratings were lost under concurrency")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
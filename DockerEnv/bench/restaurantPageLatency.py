@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def threeCalls(client: httpx.AsyncClient, name: str):
+    # What a page render does today: restaurant, then menu, then rating
+    for path in (f"/restaurants/{name}", f"/menu/{name}", f"/avgRating/{name}"):
+        response = await client.get(path)
+        if response.status_code not in (200, 404):
+            response.raise_for_status()
+
+
+async def composite(client: httpx.AsyncClient, name: str):
+    response = await client.get(f"/restaurants/{name}/page")
+    response.raise_for_status()
+
+
+async def measure(label, render, client, name, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await render(client, name)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<10} pages={requests} concurrency={concurrency} {requests / elapsed:.0f} pages/s "
+          f"p50={statistics.median(latencies):.1f}ms p95={p95:.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare the three-call restaurant page render with /restaurants/{name}/page")
+    parser.add_argument("name", help="an existing restaurant name")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        await composite(client, args.name)
+        await measure("3 calls", threeCalls, client, args.name, args.requests, args.concurrency)
+        await measure("composite", composite, client, args.name, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
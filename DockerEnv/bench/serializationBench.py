@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import copy
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+# main mounts ./static, so import it from a scratch directory that has one
+os.chdir(tempfile.mkdtemp())
+os.mkdir("static")
+import main
+import orjson
+
+
+def legacyDocuments(count):
+    opening = datetime.strptime("09:00 AM", '%I:%M %p')
+    closing = datetime.strptime("10:30 PM", '%I:%M %p')
+    return [{
+        "_id": ObjectId(), "name": f"Restaurant {index}", "phone_number": "9876543210",
+        "restaurant_type": "Both", "opening_time": opening, "closing_time": closing,
+        "rating": 4.2, "imageUrl": f"/static/{index}.jpg",
+    } for index in range(count)]
+
+
+def currentDocuments(count):
+    return [{
+        "_id": ObjectId(), "name": f"Restaurant {index}", "phone_number": "9876543210",
+        "restaurant_type": "Both", "opening_time": "09:00 AM", "closing_time": "10:30 PM",
+        "rating": 4.2, "imageUrl": f"/static/{index}.jpg", "imageVariants": None,
+    } for index in range(count)]
+
+
+async def before(documents, field):
+    # The original listRestaurants: strftime per document, RestaurantListing, then FastAPI's response_model pass
+    for restaurant in documents:
+        restaurant['opening_time'] = restaurant['opening_time'].strftime('%I:%M %p')
+        restaurant['closing_time'] = restaurant['closing_time'].strftime('%I:%M %p')
+    listing = main.RestaurantListing(restaurants=documents)
+    content = await serialize_response(field=field, response_content=listing, by_alias=False)
+    return JSONResponse(content).body
+
+
+async def after(documents, field):
+    for restaurant in documents:
+        main.formatRestaurant(restaurant)
+    return orjson.dumps({"restaurants": documents, "nextCursor": None})
+
+
+async def measure(label, serialize, makeDocuments, count, repeats, field):
+    timings = []
+    for _ in range(repeats):
+        documents = copy.deepcopy(makeDocuments(count))
+        started = time.process_time()
+        body = await serialize(documents, field)
+        timings.append(time.process_time() - started)
+    timings.sort()
+    print(f"{label:<7} documents={count} median={timings[len(timings) // 2] * 1000:.1f} ms "
+          f"min={timings[0] * 1000:.1f} ms body={len(body)} bytes")
+    return timings[len(timings) // 2]
+
+
+async def run():
+    parser = argparse.ArgumentParser(description="CPU time per /restaurants/ listing, before and after the orjson fast path")
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=15)
+    args = parser.parse_args()
+
+    field = create_response_field(name="response", type_=main.RestaurantListing)
+    slow = await measure("before", before, legacyDocuments, args.documents, args.repeats, field)
+    fast = await measure("after", after, currentDocuments, args.documents, args.repeats, field)
+    print(f"speedup {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
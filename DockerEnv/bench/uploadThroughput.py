@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiofiles
+from fastapi import UploadFile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+import constants as constants
+from uploads import saveUpload
+
+
+def makeUpload(payload: bytes) -> UploadFile:
+    # Mirrors what Starlette hands the handler: a spooled temp file rolled over to disk
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(payload)
+    spooled.seek(0)
+    return UploadFile(file=spooled, filename="image.jpg")
+
+
+async def legacyCopy(image: UploadFile, directory: str, index: int):
+    async with aiofiles.open(os.path.join(directory, f"item_{index}.jpg"), "wb") as out_file:
+        while content := await image.read(1024):
+            await out_file.write(content)
+
+
+async def pipelineCopy(image: UploadFile, directory: str, index: int):
+    await saveUpload(image, directory, constants.UploadChunkSize, constants.UploadMaxBytes)
+
+
+async def run(label, copy, payloads, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    with tempfile.TemporaryDirectory() as directory:
+        async def one(index, payload):
+            async with semaphore:
+                await copy(makeUpload(payload), directory, index)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index, payload) for index, payload in enumerate(payloads)))
+        elapsed = time.perf_counter() - started
+        stored = len(os.listdir(directory))
+    megabytes = sum(len(payload) for payload in payloads) / (1024 * 1024)
+    print(f"{label:<10} uploads={len(payloads)} concurrency={concurrency} {elapsed:.2f}s "
+          f"{len(payloads) / elapsed:.1f} uploads/s {megabytes / elapsed:.1f} MB/s files stored={stored}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare image upload throughput of the old 1 KB copy and the upload pipeline")
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=2048)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--distinct", type=int, default=50, help="number of distinct images among the uploads")
+    args = parser.parse_args()
+
+    images = [b"\xff\xd8\xff" + os.urandom(args.size_kb * 1024 - 3) for _ in range(args.distinct)]
+    payloads = [images[index % len(images)] for index in range(args.uploads)]
+    await run("legacy", legacyCopy, payloads, args.concurrency)
+    await run("pipeline", pipelineCopy, payloads, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())